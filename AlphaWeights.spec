@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('templates', 'templates')],
-    hiddenimports=[],
+    hiddenimports=['msgpack', 'brotli'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,10 +1,14 @@
 # app.py
 # Web 应用入口
 
-from flask import Flask, render_template, request, jsonify
-from models import get_session, Fund, Stock, Holding, FundHistory, StockPrice, init_db
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from models import get_session, Fund, init_db
 import models
 from fetcher import FundFetcher
+from holdings_store import bulk_save_funds
+from db_writer import db_writer
+from event_stream import broadcaster
+from fund_snapshot import fund_list_cache
 from scheduler_service import start_scheduler
 from datetime import datetime, date
 
@@ -31,41 +35,64 @@ def add_fund():
             return jsonify({'success': False, 'message': '该基金已存在'})
 
         # 获取数据
-        data = FundFetcher.get_fund_details(code)
+        from holdings_service import full_portfolio_enabled
+        full = full_portfolio_enabled(session)
+    finally:
+        session.close()
+
+    try:
+        data = FundFetcher.get_fund_details(code, full)
         if not data:
             return jsonify({'success': False, 'message': '无法获取基金信息，请确认代码是否正确'})
-        
-        # 保存基金
-        fund = Fund(code=data['code'], name=data['name'])
-        session.add(fund)
-        session.flush() # 获取ID
-        
-        # 保存持仓
-        for item in data['holdings']:
-            # item: {code, name, ratio}
-            stock_code = item['code']
-            stock_name = item['name']
-            ratio = item['ratio']
-            
-            # 查找或创建 Stock
-            stock = session.query(Stock).filter_by(code=stock_code).first()
-            if not stock:
-                stock = Stock(code=stock_code, name=stock_name)
-                session.add(stock)
-                session.flush()
-            
-            # 创建关联
-            holding = Holding(fund_id=fund.id, stock_id=stock.id, ratio=ratio)
-            session.add(holding)
-            
-        session.commit()
+
+        # 保存基金及持仓 (经写库线程；抓取期间可能已被别的请求添加，写入前再查一次)
+        def save(session):
+            if session.query(Fund).filter_by(code=code).first():
+                return False
+            bulk_save_funds(session, [data])
+            return True
+        if not db_writer.run(save, name='fund_add'):
+            return jsonify({'success': False, 'message': '该基金已存在'})
         return jsonify({'success': True, 'message': f"成功添加: {data['name']}"})
-        
+
     except Exception as e:
-        session.rollback()
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        session.close()
+
+@app.route('/api/fund/add_batch', methods=['POST'])
+def add_fund_batch():
+    """
+    批量添加基金
+    支持 JSON {codes: ["000001", ...]} 或 {codes: "000001,000002"}，也支持上传文本/CSV 文件 (字段名 file)
+    返回任务 ID，进度通过 /api/fund/add_batch/<job_id> 轮询
+    """
+    from fund_importer import parse_codes, start_import
+    text = ''
+    upload = request.files.get('file')
+    if upload:
+        raw = upload.read()
+        try:
+            text = raw.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            text = raw.decode('gbk', 'ignore')
+    else:
+        payload = request.get_json(silent=True) or {}
+        codes = payload.get('codes') or request.form.get('codes', '')
+        text = ' '.join(codes) if isinstance(codes, list) else str(codes)
+
+    codes = parse_codes(text)
+    if not codes:
+        return jsonify({'success': False, 'message': '未找到有效的6位基金代码'})
+
+    job = start_import(codes)
+    return jsonify({'success': True, 'message': f"已开始导入 {len(codes)} 个基金", 'data': job.to_dict()})
+
+@app.route('/api/fund/add_batch/<job_id>', methods=['GET'])
+def get_add_batch_job(job_id):
+    from fund_importer import get_job
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在或已过期'})
+    return jsonify({'success': True, 'data': job.to_dict()})
 
 @app.route('/api/fund/delete', methods=['POST'])
 def delete_fund():
@@ -73,21 +100,19 @@ def delete_fund():
     if not fund_id:
         return jsonify({'success': False, 'message': '缺少基金ID'})
     
-    session = get_session()
-    try:
+    def delete(session):
         fund = session.get(Fund, fund_id)
         if not fund:
-            return jsonify({'success': False, 'message': '未找到该基金'})
-            
+            return False
         # 由于配置了 cascade="all, delete-orphan"，删除 Fund 会自动删除关联的 Holding 和 FundHistory
         session.delete(fund)
-        session.commit()
+        return True
+    try:
+        if not db_writer.run(delete, name='fund_delete'):
+            return jsonify({'success': False, 'message': '未找到该基金'})
         return jsonify({'success': True, 'message': '删除成功'})
     except Exception as e:
-        session.rollback()
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        session.close()
 
 @app.route('/api/fund/refresh_holdings', methods=['POST'])
 def refresh_fund_holdings():
@@ -105,181 +130,142 @@ def refresh_fund_holdings():
             
         if not fund:
             return jsonify({'success': False, 'message': '未找到该基金'})
-            
+        fund_id, code = fund.id, fund.code
+        from holdings_service import apply_details, full_portfolio_enabled
+        full = full_portfolio_enabled(session)
+    finally:
+        session.close()
+
+    try:
         # 重新获取数据
         from log_utils import log
-        log(f"正在重新获取基金 {fund.code} 的持仓...")
-        data = FundFetcher.get_fund_details(fund.code)
+        log(f"正在重新获取基金 {code} 的持仓...")
+        data = FundFetcher.get_fund_details(code, full)
         if not data:
             return jsonify({'success': False, 'message': '无法从外部接口获取数据'})
             
-        # 更新名称
-        if data.get('name') and data['name'] != f"基金{fund.code}":
-            fund.name = data['name']
-            
-        # 只有当抓取到持仓时才更新
-        if data.get('holdings'):
-             # 清除旧持仓
-            session.query(Holding).filter_by(fund_id=fund.id).delete()
-            
-            # 写入新持仓
-            for item in data['holdings']:
-                stock_code = item['code']
-                stock_name = item['name']
-                ratio = item['ratio']
-                
-                # 查找或创建 Stock
-                stock = session.query(Stock).filter_by(code=stock_code).first()
-                if not stock:
-                    stock = Stock(code=stock_code, name=stock_name)
-                    session.add(stock)
-                    session.flush()
-                
-                # 创建关联
-                holding = Holding(fund_id=fund.id, stock_id=stock.id, ratio=ratio)
-                session.add(holding)
-            
-            session.commit()
-            return jsonify({'success': True, 'message': f"成功更新持仓，共 {len(data['holdings'])} 只股票"})
+        # 按差异更新名称和持仓 (同时记录报告期缓存)；只有当抓取到持仓时才更新
+        def save(session):
+            fund = session.get(Fund, fund_id)
+            return apply_details(session, fund, data) if fund else None
+        diff = db_writer.run(save, name='fund_refresh_holdings')
+        if diff is not None:
+            return jsonify({'success': True, 'message': f"成功更新持仓，共 {len(data['holdings'])} 只股票"
+                                                        f" (新增 {diff['inserted']}，变动 {diff['updated']}，移除 {diff['deleted']})"})
         else:
             return jsonify({'success': False, 'message': '接口返回的持仓列表为空，未进行更新'})
 
     except Exception as e:
-        session.rollback()
         return jsonify({'success': False, 'message': str(e)})
-    finally:
-        session.close()
 
 @app.route('/api/fund/list', methods=['GET'])
 def get_fund_list():
-    session = get_session()
-    try:
-        funds = session.query(Fund).all()
-        result = []
-        for f in funds:
-            # 获取最新估值
-            last_hist = session.query(FundHistory)\
-                .filter_by(fund_id=f.id)\
-                .order_by(FundHistory.timestamp.desc())\
-                .first()
-            
-            est_change = 0.0
-            last_time = ""
-            last_timestamp = None
-            if last_hist:
-                est_change = last_hist.estimated_change
-                last_time = last_hist.timestamp.strftime("%H:%M")
-                last_timestamp = last_hist.timestamp
-
-            # 检查是否过期，例如如果是昨天的，今天开盘前显示0？
-            # 暂时简单处理：如果是今天的数据才显示？或者一直显示最新一条
-            # 需求通常希望看到最新的有效状态。如果过了一夜，可能希望看到昨收盘？
-            # 计算前十持仓总占比
-            total_ratio = sum([h.ratio for h in f.holdings])
-
-            result.append({
-                'id': f.id,
-                'code': f.code,
-                'name': f.name,
-                'est_change': est_change,
-                'update_time': last_time,
-                'total_ratio': total_ratio
-            })
-        return jsonify({'success': True, 'data': result})
-    finally:
-        session.close()
+    # 内存快照 (每个 tick 提交后发布新版本)；客户端带着当前 ETag 轮询时直接返回 304，不查库也不序列化
+    # 可选参数：page/page_size 分页，sort (见 SORT_KEYS) + order=asc|desc 排序，q (代码/名称) 和 trend=up|down|flat 筛选；
+    # 都不带时返回全部基金 (按 ID)
+    from fund_snapshot import ListQuery, SORT_KEYS, TRENDS, MAX_PAGE_SIZE
+    args = request.args
+    query = None
+    if any(k in args for k in ('page', 'page_size', 'sort', 'order', 'q', 'trend')):
+        try:
+            page, page_size = int(args.get('page', 1)), int(args.get('page_size', ListQuery.page_size))
+        except ValueError:
+            return jsonify({'success': False, 'message': 'page / page_size 必须是整数'})
+        if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+            return jsonify({'success': False, 'message': f'page 至少为 1，page_size 应在 1-{MAX_PAGE_SIZE} 之间'})
+        sort, order, trend = args.get('sort', 'id'), args.get('order', 'asc'), args.get('trend') or None
+        if sort not in SORT_KEYS:
+            return jsonify({'success': False, 'message': f"sort 可选: {', '.join(SORT_KEYS)}"})
+        if order not in ('asc', 'desc'):
+            return jsonify({'success': False, 'message': 'order 应为 asc 或 desc'})
+        if trend is not None and trend not in TRENDS:
+            return jsonify({'success': False, 'message': f"trend 可选: {', '.join(TRENDS)}"})
+        query = ListQuery(sort, order == 'desc', args.get('q', '').strip(), trend, page, page_size)
+
+    snapshot = fund_list_cache.current()
+    if snapshot is None:
+        session = get_session()
+        try:
+            snapshot = fund_list_cache.get(session)
+        finally:
+            session.close()
+    if request.if_none_match.contains(snapshot.etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(snapshot.body if query is None else snapshot.page_body(query), mimetype='application/json')
+    resp.set_etag(snapshot.etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+@app.route('/api/stream', methods=['GET'])
+def event_stream():
+    """
+    SSE 推送：每个 tick 提交后推送 tick 事件 {time, changes: [[fund_id, 估值], ...]} (只含有变化的基金)，
+    基金增删或持仓变化时推送 funds 事件 (前端重新拉取列表)
+    """
+    return Response(stream_with_context(broadcaster.stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/fund/history/<int:fund_id>', methods=['GET'])
 def get_fund_history(fund_id):
+    # 日期范围 start/end (YYYY-MM-DD，含两端，默认当天；date=... 等同 start=end)；
+    # max_points 限制返回的点数 (LTTB 降采样)。每天按 原始分时 -> 归档 -> 5 分钟线 -> 日线 取精度最高的数据
+    # format=json (默认，details 按点展开) / columnar / msgpack (持仓信息只发一次，价格/涨跌幅为平行数组)；
+    # 响应按 Accept-Encoding 压缩
+    from history_query import fund_history, MIN_POINTS
+    from response_codec import encoded_response, nullable, available_formats
+    output = request.args.get('format', 'json')
+    if output not in available_formats():
+        return jsonify({'success': False, 'message': f"format 可选: {', '.join(available_formats())}"})
+    try:
+        day = request.args.get('date')
+        first = date.fromisoformat(request.args.get('start') or day or date.today().isoformat())
+        last = date.fromisoformat(request.args.get('end') or day or date.today().isoformat())
+    except ValueError:
+        return jsonify({'success': False, 'message': '日期格式应为 YYYY-MM-DD'})
+    if first > last:
+        return jsonify({'success': False, 'message': 'start 不能晚于 end'})
+    max_points = request.args.get('max_points')
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'max_points 必须是整数'})
+        if max_points < MIN_POINTS:
+            return jsonify({'success': False, 'message': f'max_points 至少为 {MIN_POINTS}'})
+
     session = get_session()
     try:
-        # 只取当天的
-        today = date.today()
-        # Sqlite date compare needs care, try filtering by range
-        start_of_day = datetime.combine(today, datetime.min.time())
-        
-        # 1.获取基金和它的持仓结构
-        fund = session.get(Fund, fund_id)
-        if not fund:
+        if not session.get(Fund, fund_id):
             return jsonify({'success': False, 'message': 'Fund not found'})
-            
-        # 预加载持仓，构建 stock_id -> {ratio, name} 映射
-        holdings_map = {}
-        for h in fund.holdings:
-            # 确保stock加载
-            s = session.get(Stock, h.stock_id) 
-            if s:
-                holdings_map[h.stock_id] = {
-                    'code': s.code,
-                    'name': s.name,
-                    'ratio': h.ratio
-                }
-        
-        stock_ids = list(holdings_map.keys())
-        
-        # 2. 获取基金估值历史
-        histories = session.query(FundHistory)\
-            .filter(FundHistory.fund_id == fund_id)\
-            .filter(FundHistory.timestamp >= start_of_day)\
-            .order_by(FundHistory.timestamp.asc())\
-            .all()
-            
-        times = [h.timestamp.strftime("%H:%M") for h in histories]
-        values = [h.estimated_change for h in histories]
-        
-        # 3. 获取对应的股票价格历史
-        # 为了避免查询过多，我们查询 stock_id在列表中，且时间在今天的
-        # 然后在内存里进行匹配
-        stock_prices = session.query(StockPrice)\
-            .filter(StockPrice.stock_id.in_(stock_ids))\
-            .filter(StockPrice.timestamp >= start_of_day)\
-            .all()
-            
-        # 将价格按 timestamp 分组: { timestamp_str: [price_record, ...] }
-        # 注意 timestamp 需要和 history 里的完全匹配，或者我们用 strftime 匹配
-        prices_by_time = {}
-        for sp in stock_prices:
-            t_str = sp.timestamp.strftime("%H:%M") # 分钟级匹配
-            if t_str not in prices_by_time:
-                prices_by_time[t_str] = []
-            prices_by_time[t_str].append(sp)
-            
-        # 4. 构建每个时间点的详情
-        details = []
-        for h in histories:
-            t_str = h.timestamp.strftime("%H:%M")
-            point_detail = []
-            
-            # 找到这个时间点的所有股票价格
-            sps = prices_by_time.get(t_str, [])
-            
-            for sp in sps:
-                # 找到这只股票在基金里的权重信息
-                h_info = holdings_map.get(sp.stock_id)
-                if h_info:
-                    point_detail.append({
-                        'code': h_info['code'],
-                        'name': h_info['name'],
-                        'ratio': h_info['ratio'],
-                        'pct': sp.change_percent,
-                        'price': sp.price
-                    })
-            
-            # 按权重排序
-            point_detail.sort(key=lambda x: x['ratio'], reverse=True)
-            details.append(point_detail)
-        
-        return jsonify({
-            'success': True,
-            'data': {
-                'times': times,
-                'values': values,
-                'details': details 
-            }
-        })
+        result = fund_history(session, fund_id, first, last, max_points)
     finally:
         session.close()
 
+    # 单日只显示时刻，跨日带日期 (跨年带年份)；tick 间隔不足一分钟时带秒 (标签不重复)
+    stamps = result.times.astype(datetime).tolist()
+    fmt = "%H:%M:%S" if any(t.second for t in stamps) else "%H:%M"
+    if first.year != last.year:
+        fmt = "%Y-%m-%d " + fmt
+    elif first != last:
+        fmt = "%m-%d " + fmt
+    data = {
+        'times': [t.strftime(fmt) for t in stamps],
+        'values': result.values.tolist(),
+        'resolution': result.resolution,
+        'total_points': result.total_points,
+        'start': first.isoformat(),
+        'end': last.isoformat(),
+    }
+    if output == 'json':
+        data['details'] = result.details()
+    else:
+        data['format'] = 'columnar'
+        data['holdings'] = [{'code': h.code, 'name': h.name, 'ratio': h.ratio} for h in result.holdings]
+        data['price'] = [nullable(row) for row in result.price]
+        data['pct'] = [nullable(row) for row in result.pct]
+    return encoded_response({'success': True, 'data': data}, output)
+
 @app.route('/api/trigger', methods=['POST'])
 def manual_trigger():
     # 手动触发更新（调试用）
@@ -290,6 +276,47 @@ def manual_trigger():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+@app.route('/api/stats/quote_cache', methods=['GET'])
+def get_quote_cache_stats():
+    # 行情缓存命中/合并统计
+    from quote_cache import quote_cache
+    return jsonify({'success': True, 'data': quote_cache.stats()})
+
+@app.route('/api/stats/upstream', methods=['GET'])
+def get_upstream_stats():
+    # 各上游 host 的分片大小、速率、熔断状态，以及各行情数据源的延迟分位数
+    from request_control import all_stats
+    from quote_providers import quote_router
+    return jsonify({'success': True, 'data': {'hosts': all_stats(), 'providers': quote_router.stats()}})
+
+@app.route('/api/stats/pipeline', methods=['GET'])
+def get_pipeline_stats():
+    # 估值流水线各阶段和写库线程的计数、队列长度、平均耗时
+    from update_pipeline import update_pipeline
+    return jsonify({'success': True, 'data': {'pipeline': update_pipeline.stats(), 'writer': db_writer.stats(),
+                                              'stream': broadcaster.stats()}})
+
+@app.route('/api/schedule', methods=['GET'])
+def get_schedule():
+    # 交易状态和各定时任务接下来的运行时间
+    from scheduler_service import schedule_info
+    count = request.args.get('count', 5, type=int)
+    return jsonify({'success': True, 'data': schedule_info(max(1, min(count, 50)))})
+
+@app.route('/api/schedule/holidays', methods=['POST'])
+def update_schedule_holidays():
+    # 更新某年的休市日期 (写入 data/holidays.json)
+    from scheduler_service import update_holidays
+    year = request.json.get('year')
+    days = request.json.get('days')
+    if not year or not isinstance(days, list):
+        return jsonify({'success': False, 'message': '需要 year 和 days (YYYY-MM-DD 列表)'})
+    try:
+        update_holidays(int(year), days)
+        return jsonify({'success': True, 'message': f"已更新 {year} 年休市日期，共 {len(days)} 天"})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     session = get_session()
@@ -303,7 +330,13 @@ def get_config():
                     val = val * 60
                 interval = val
             except: pass
-        return jsonify({'success': True, 'data': {'interval': interval}})
+        from holdings_service import full_portfolio_enabled
+        from retention import retention_settings
+        retention = retention_settings(session)
+        return jsonify({'success': True, 'data': {'interval': interval,
+                                                  'holdings_full': full_portfolio_enabled(session),
+                                                  'retention_days': retention['raw_days'],
+                                                  'retention_5m_days': retention['bar_days']}})
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
     finally:
@@ -311,6 +344,11 @@ def get_config():
 
 @app.route('/api/config/update', methods=['POST'])
 def update_config():
+    if 'holdings_full' in request.json:
+        return update_holdings_mode(bool(request.json.get('holdings_full')))
+    if 'retention_days' in request.json or 'retention_5m_days' in request.json:
+        return update_retention(request.json.get('retention_days'), request.json.get('retention_5m_days'))
+
     seconds = request.json.get('interval')
     if not seconds or int(seconds) < 30:
         return jsonify({'success': False, 'message': '间隔必须大于等于30秒'})
@@ -322,6 +360,66 @@ def update_config():
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
+def update_holdings_mode(enabled: bool):
+    """切换完整持仓选项，并在后台按新选项同步所有基金的持仓"""
+    import threading
+    from holdings_service import set_full_portfolio, refresh_all_holdings
+    try:
+        set_full_portfolio(enabled)
+        threading.Thread(target=refresh_all_holdings, kwargs={'force': True},
+                         name='holdings-refresh-mode', daemon=True).start()
+        mode = '完整持仓' if enabled else '前十大重仓'
+        return jsonify({'success': True, 'message': f"已切换为跟踪{mode}，正在后台同步持仓"})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+def update_retention(raw_days, bar_days):
+    """修改原始分时/5 分钟线的保留天数，下一次数据维护时生效"""
+    from retention import set_retention
+    try:
+        raw_days = int(raw_days) if raw_days is not None else None
+        bar_days = int(bar_days) if bar_days is not None else None
+        if (raw_days is not None and raw_days < 1) or (bar_days is not None and bar_days < 1):
+            return jsonify({'success': False, 'message': '保留天数至少为 1 天'})
+        set_retention(raw_days, bar_days)
+        return jsonify({'success': True, 'message': '已保存保留天数，下次数据维护时生效'})
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '保留天数必须是整数'})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)})
+
+@app.route('/api/maintenance', methods=['GET'])
+def get_maintenance():
+    # 保留设置、汇总台账概况、上次维护结果
+    from retention import retention_settings, last_run, is_running
+    from archive import archived_days
+    from models import RollupLedger
+    from sqlalchemy import func
+    session = get_session()
+    try:
+        rolled, purged, first, last = session.query(
+            func.count(RollupLedger.trade_date), func.count(RollupLedger.purged_at),
+            func.min(RollupLedger.trade_date), func.max(RollupLedger.trade_date)).one()
+        archives = archived_days()
+        return jsonify({'success': True, 'data': {
+            'settings': retention_settings(session),
+            'rolled_days': rolled, 'purged_days': purged, 'first_day': first, 'last_day': last,
+            'archived_days': [d.isoformat() for d in archives],
+            'running': is_running(), 'last_run': dict(last_run),
+        }})
+    finally:
+        session.close()
+
+@app.route('/api/maintenance/run', methods=['POST'])
+def run_maintenance_now():
+    # 立即在后台执行一次数据维护
+    import threading
+    from retention import run_maintenance, is_running
+    if is_running():
+        return jsonify({'success': False, 'message': '数据维护正在进行中'})
+    threading.Thread(target=run_maintenance, name='maintenance-manual', daemon=True).start()
+    return jsonify({'success': True, 'message': '已开始数据维护'})
+
 if __name__ == '__main__':
     # 纯本地使用，开启debug方便看日志
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
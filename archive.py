@@ -0,0 +1,211 @@
+# archive.py
+# 原始分时的列式归档：每个已收盘的交易日导出为一个目录 data/archive/YYYY-MM-DD/
+#   stocks.npy  结构化数组 (stock_id, ts, price, prev_close, pct)，按 (stock_id, ts) 排序
+#   funds.npy   结构化数组 (fund_id, ts, value)，按 (fund_id, ts) 排序
+#   ticks.npy   当天的 tick 时间轴 (tick_log)，向前填充用
+#   stocks_index.npy / funds_index.npy  各 ID 及其记录的起始行 (末尾多一个总行数)
+# 读取用 np.load(mmap_mode='r') 内存映射，按索引取连续切片，不复制数据
+# 归档后 SQLite 中该日的原始分时即可删除，库里只保留还没收盘归档的日期
+
+import os
+import shutil
+from datetime import date, datetime, time, timedelta
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import DB_DIR, FundHistory, StockPrice, TickLog, PRICE_SCALE, PCT_SCALE
+
+ARCHIVE_DIR = os.path.join(DB_DIR, 'archive')
+
+STOCK_DTYPE = np.dtype([('stock_id', '<i4'), ('ts', '<M8[us]'), ('price', '<f8'), ('prev_close', '<f8'), ('pct', '<f8')])
+FUND_DTYPE = np.dtype([('fund_id', '<i4'), ('ts', '<M8[us]'), ('value', '<f8')])
+TICK_DTYPE = np.dtype('<M8[us]')
+INDEX_DTYPE = np.dtype([('id', '<i8'), ('offset', '<i8')])
+
+def _day_range(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, time(0, 0))
+    return start, start + timedelta(days=1)
+
+def partition_path(day: date, root: str = ARCHIVE_DIR) -> str:
+    return os.path.join(root, day.isoformat())
+
+# ---------------------------------------------------------------------------
+# 导出
+
+def _fetch(session: Session, stmt) -> List[tuple]:
+    # 直接取 DBAPI 行 (库里的整数：秒级时间、定点数)，由 NumPy 整列换算
+    result = session.connection().execute(stmt)
+    rows = result.cursor.fetchall()
+    result.close()
+    return rows
+
+def _to_array(rows: List[tuple], dtype: np.dtype, scales: Sequence[Optional[int]]) -> np.ndarray:
+    """scales: 各列的定点数倍数，None 表示原样 (时间列为秒数)"""
+    arr = np.empty(len(rows), dtype=dtype)
+    if rows:
+        for name, col, scale in zip(dtype.names, zip(*rows), scales):
+            values = np.array(col, dtype=np.int64)
+            if dtype[name] == TICK_DTYPE:
+                arr[name] = values.astype('M8[s]')
+            elif scale:
+                arr[name] = values / scale
+            else:
+                arr[name] = values
+    return arr
+
+def _index(ids: np.ndarray) -> np.ndarray:
+    """已排序的 ID 列 -> 每个 ID 的起始行；最后一项 id 为 -1，offset 为总行数"""
+    unique, starts = np.unique(ids, return_index=True)
+    index = np.empty(len(unique) + 1, dtype=INDEX_DTYPE)
+    index['id'][:-1], index['offset'][:-1] = unique, starts
+    index[-1] = (-1, len(ids))
+    return index
+
+def export_day(session: Session, day: date, root: str = ARCHIVE_DIR) -> Dict[str, int]:
+    """
+    把一天的原始分时写成列式分区 (先写临时目录再改名，中途失败不会留下半个分区)
+    :return: 各文件的行数
+    """
+    start, end = _day_range(day)
+    stocks = _to_array(_fetch(session, select(
+        StockPrice.stock_id, StockPrice.timestamp, StockPrice.price, StockPrice.prev_close, StockPrice.change_percent)
+        .where(StockPrice.timestamp >= start, StockPrice.timestamp < end)
+        .order_by(StockPrice.stock_id, StockPrice.timestamp)), STOCK_DTYPE,
+        (None, None, PRICE_SCALE, PRICE_SCALE, PCT_SCALE))
+    funds = _to_array(_fetch(session, select(FundHistory.fund_id, FundHistory.timestamp, FundHistory.estimated_change)
+        .where(FundHistory.timestamp >= start, FundHistory.timestamp < end)
+        .order_by(FundHistory.fund_id, FundHistory.timestamp)), FUND_DTYPE, (None, None, PCT_SCALE))
+    ticks = np.array([r[0] for r in _fetch(session, select(TickLog.timestamp).where(
+        TickLog.timestamp >= start, TickLog.timestamp < end).order_by(TickLog.timestamp))],
+        dtype=np.int64).astype('M8[s]').astype(TICK_DTYPE)
+
+    path = partition_path(day, root)
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, 'stocks.npy'), stocks)
+    np.save(os.path.join(tmp, 'stocks_index.npy'), _index(stocks['stock_id']))
+    np.save(os.path.join(tmp, 'funds.npy'), funds)
+    np.save(os.path.join(tmp, 'funds_index.npy'), _index(funds['fund_id']))
+    np.save(os.path.join(tmp, 'ticks.npy'), ticks)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp, path)
+    return {'stocks': len(stocks), 'funds': len(funds), 'ticks': len(ticks)}
+
+def remove_before(day: date, root: str = ARCHIVE_DIR) -> int:
+    """删除 day 之前的分区，返回删除的个数"""
+    removed = 0
+    for d in archived_days(root=root):
+        if d < day:
+            shutil.rmtree(partition_path(d, root), ignore_errors=True)
+            removed += 1
+    return removed
+
+# ---------------------------------------------------------------------------
+# 读取
+
+class Partition:
+    """一天的归档 (内存映射，只读)；各文件在第一次用到时才打开"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _load(self, name: str, mmap: bool = True) -> np.ndarray:
+        return np.load(os.path.join(self.path, name), mmap_mode='r' if mmap else None)
+
+    @cached_property
+    def stocks(self) -> np.ndarray:
+        return self._load('stocks.npy')
+
+    @cached_property
+    def funds(self) -> np.ndarray:
+        return self._load('funds.npy')
+
+    @cached_property
+    def ticks(self) -> np.ndarray:
+        return self._load('ticks.npy')
+
+    # 索引很小，直接读入内存
+    @cached_property
+    def _stock_index(self) -> np.ndarray:
+        return self._load('stocks_index.npy', mmap=False)
+
+    @cached_property
+    def _fund_index(self) -> np.ndarray:
+        return self._load('funds_index.npy', mmap=False)
+
+    @staticmethod
+    def _slice(arr: np.ndarray, index: np.ndarray, ident: int) -> np.ndarray:
+        i = int(np.searchsorted(index['id'][:-1], ident))
+        if i == len(index) - 1 or index['id'][i] != ident:
+            return arr[0:0]
+        return arr[index['offset'][i]:index['offset'][i + 1]]
+
+    def stock(self, stock_id: int) -> np.ndarray:
+        """某只股票当天的记录 (按时间排序的视图)"""
+        return self._slice(self.stocks, self._stock_index, stock_id)
+
+    def fund(self, fund_id: int) -> np.ndarray:
+        return self._slice(self.funds, self._fund_index, fund_id)
+
+def archived_days(start: Optional[date] = None, end: Optional[date] = None, root: str = ARCHIVE_DIR) -> List[date]:
+    """[start, end) 内已归档的日期"""
+    if not os.path.isdir(root):
+        return []
+    days = []
+    for name in os.listdir(root):
+        try:
+            d = date.fromisoformat(name)
+        except ValueError:
+            continue    # 临时目录等
+        if (start is None or d >= start) and (end is None or d < end):
+            days.append(d)
+    return sorted(days)
+
+def open_day(day: date, root: str = ARCHIVE_DIR) -> Optional[Partition]:
+    path = partition_path(day, root)
+    return Partition(path) if os.path.isdir(path) else None
+
+def iter_partitions(start: date, end: date, root: str = ARCHIVE_DIR) -> Iterator[Tuple[date, Partition]]:
+    for d in archived_days(start, end, root):
+        yield d, Partition(partition_path(d, root))
+
+def carry_forward_index(times: np.ndarray, point_times: np.ndarray) -> np.ndarray:
+    """times 各时刻对应的最近一条记录的下标 (之前没有记录为 -1)"""
+    return np.searchsorted(point_times, times, side='right') - 1
+
+def fund_series(fund_id: int, start: date, end: date, root: str = ARCHIVE_DIR) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    基金在 [start, end) 各归档日的估值序列 (按 tick 时间轴向前填充，每天从第一条记录开始)
+    :return: (时间 datetime64[us], 估值)
+    """
+    times, values = [], []
+    for _, part in iter_partitions(start, end, root):
+        points = part.fund(fund_id)
+        if not len(points):
+            continue
+        axis = np.union1d(part.ticks[part.ticks >= points['ts'][0]], points['ts'])
+        times.append(axis)
+        values.append(points['value'][carry_forward_index(axis, points['ts'])])
+    if not times:
+        return np.empty(0, TICK_DTYPE), np.empty(0)
+    return np.concatenate(times), np.concatenate(values)
+
+def stock_series(stock_id: int, start: date, end: date, root: str = ARCHIVE_DIR) -> np.ndarray:
+    """股票在 [start, end) 的全部记录 (只存变化，未向前填充)"""
+    parts = [part.stock(stock_id) for _, part in iter_partitions(start, end, root)]
+    parts = [p for p in parts if len(p)]
+    return np.concatenate(parts) if parts else np.empty(0, STOCK_DTYPE)
+
+def daily_closes(fund_id: int, start: date, end: date, root: str = ARCHIVE_DIR) -> Tuple[List[date], np.ndarray]:
+    """基金在 [start, end) 各归档日的收盘估值 (当天最后一条记录)"""
+    days, closes = [], []
+    for d, part in iter_partitions(start, end, root):
+        points = part.fund(fund_id)
+        if len(points):
+            days.append(d)
+            closes.append(points['value'][-1])
+    return days, np.array(closes)
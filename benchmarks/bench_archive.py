@@ -0,0 +1,127 @@
+# bench_archive.py
+# 多日历史查询：同样的原始分时分别放在 SQLite (ORM 查询) 和列式归档 (内存映射) 中，对比读取耗时
+# 合成若干交易日写入临时库，导出归档后按 基金多日序列 / 股票多日记录 两种查询各跑若干次
+#
+# 用法:
+#   python benchmarks/bench_archive.py
+#   python benchmarks/bench_archive.py --days 20 --funds 300 --stocks 2000 --interval 30
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time as time_mod
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Fund, Stock, FundHistory, StockPrice, TickLog
+from trading_calendar import SESSIONS
+import archive
+
+def tick_times(day: date, interval: int):
+    times = []
+    for start, end in SESSIONS:
+        t, e = datetime.combine(day, start), datetime.combine(day, end)
+        while t <= e:
+            times.append(t)
+            t += timedelta(seconds=interval)
+    return times
+
+def build(session, args):
+    rng = random.Random(7)
+    session.execute(insert(Fund.__table__), [{'id': i, 'code': f"{i:06d}", 'name': f"F{i}"} for i in range(1, args.funds + 1)])
+    session.execute(insert(Stock.__table__), [{'id': i, 'code': f"{i:06d}", 'name': f"S{i}"} for i in range(1, args.stocks + 1)])
+    days = []
+    d = date(2026, 1, 5)
+    while len(days) < args.days:
+        if d.weekday() < 5:
+            days.append(d)
+        d += timedelta(days=1)
+    for day in days:
+        times = tick_times(day, args.interval)
+        session.execute(insert(TickLog.__table__), [{'timestamp': t, 'funds': args.funds, 'stocks': args.stocks} for t in times])
+        fund_rows, price_rows = [], []
+        for t in times:
+            # 只存变化：每个 tick 约三分之一的基金/股票有新值
+            for fid in rng.sample(range(1, args.funds + 1), args.funds // 3):
+                fund_rows.append({'fund_id': fid, 'timestamp': t, 'estimated_change': round(rng.uniform(-3, 3), 2)})
+            for sid in rng.sample(range(1, args.stocks + 1), args.stocks // 3):
+                price = round(rng.uniform(5, 50), 2)
+                price_rows.append({'stock_id': sid, 'timestamp': t, 'price': price, 'prev_close': price, 'change_percent': 0.0})
+        session.execute(insert(FundHistory.__table__), fund_rows)
+        session.execute(insert(StockPrice.__table__), price_rows)
+    session.commit()
+    return days
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time_mod.perf_counter()
+        result = fn()
+        best = min(best, time_mod.perf_counter() - t0)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--funds', type=int, default=200)
+    parser.add_argument('--stocks', type=int, default=1000)
+    parser.add_argument('--interval', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        t0 = time_mod.perf_counter()
+        days = build(session, args)
+        print(f"合成 {len(days)} 个交易日: {time_mod.perf_counter() - t0:.1f}s")
+        root = os.path.join(tmp, 'archive')
+        t0 = time_mod.perf_counter()
+        for day in days:
+            archive.export_day(session, day, root)
+        print(f"导出归档: {time_mod.perf_counter() - t0:.2f}s")
+
+        start = datetime.combine(days[0], datetime.min.time())
+        end = datetime.combine(days[-1] + timedelta(days=1), datetime.min.time())
+        fid, sid = 1, 1
+
+        def orm_fund():
+            return session.query(FundHistory).filter(FundHistory.fund_id == fid, FundHistory.timestamp >= start,
+                                                     FundHistory.timestamp < end).order_by(FundHistory.timestamp).all()
+
+        def orm_stock():
+            return session.query(StockPrice).filter(StockPrice.stock_id == sid, StockPrice.timestamp >= start,
+                                                    StockPrice.timestamp < end).order_by(StockPrice.timestamp).all()
+
+        def mmap_fund():
+            parts = [p.fund(fid) for _, p in archive.iter_partitions(days[0], days[-1] + timedelta(days=1), root)]
+            return sum(len(p) for p in parts)
+
+        def mmap_stock():
+            return archive.stock_series(sid, days[0], days[-1] + timedelta(days=1), root)
+
+        for name, fn in (('基金多日记录 ORM', orm_fund), ('基金多日记录 mmap', mmap_fund),
+                         ('股票多日记录 ORM', orm_stock), ('股票多日记录 mmap', mmap_stock)):
+            session.expire_all()
+            seconds, result = timed(fn, args.repeat)
+            rows = result if isinstance(result, int) else len(result)
+            print(f"{name:<16} {rows:>7} 行  {seconds * 1000:8.2f} ms")
+
+        seconds, (times, _) = timed(lambda: archive.fund_series(fid, days[0], days[-1] + timedelta(days=1), root), args.repeat)
+        print(f"{'基金多日序列 (向前填充)':<16} {len(times):>7} 点  {seconds * 1000:8.2f} ms")
+        session.close()
+        engine.dispose()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
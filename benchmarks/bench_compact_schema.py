@@ -0,0 +1,201 @@
+# bench_compact_schema.py
+# 分时表紧凑结构 (迁移 v3) 前后对比：同样的合成分时先按旧结构 (DateTime 字符串、浮点数、rowid 表 + 复合索引)
+# 写入临时库，测量文件大小和范围查询耗时；再用 migrations.migrate 把这个库升级到新结构，VACUUM 后重新测量
+#
+# 范围查询：
+#   基金单日   某个基金一天的估值 (详情页)
+#   股票多日   某只股票全部日期的价格
+#   全市场单日 一天内所有股票的价格 (汇总、归档导出)
+# 每种查询分别测 sqlite3 直接读取 (存储层) 和 SQLAlchemy Core 读取 (含类型换算，应用实际走的路径)
+#
+# 用法:
+#   python benchmarks/bench_compact_schema.py
+#   python benchmarks/bench_compact_schema.py --days 10 --funds 500 --stocks 3000 --interval 30
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time as time_mod
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, Table, Column, Integer, Float, DateTime, MetaData
+from sqlalchemy.pool import NullPool
+
+from models import FundHistory, StockPrice
+from trading_calendar import SESSIONS
+import migrations
+
+# 迁移前 (v2) 的分时表结构
+LEGACY_DDL = """
+CREATE TABLE funds (id INTEGER NOT NULL, code VARCHAR(10) NOT NULL, name VARCHAR(100) NOT NULL,
+    created_at DATETIME, updated_at DATETIME, PRIMARY KEY (id));
+CREATE TABLE stocks (id INTEGER NOT NULL, code VARCHAR(10) NOT NULL, name VARCHAR(100) NOT NULL,
+    created_at DATETIME, PRIMARY KEY (id));
+CREATE TABLE fund_histories (id INTEGER NOT NULL, fund_id INTEGER NOT NULL, estimated_change FLOAT NOT NULL,
+    timestamp DATETIME, PRIMARY KEY (id), FOREIGN KEY(fund_id) REFERENCES funds (id));
+CREATE INDEX ix_fund_histories_timestamp ON fund_histories (timestamp);
+CREATE INDEX ix_fund_histories_fund_id_timestamp ON fund_histories (fund_id, timestamp);
+CREATE TABLE stock_prices (id INTEGER NOT NULL, stock_id INTEGER NOT NULL, price FLOAT NOT NULL,
+    prev_close FLOAT NOT NULL, change_percent FLOAT NOT NULL, timestamp DATETIME, PRIMARY KEY (id),
+    FOREIGN KEY(stock_id) REFERENCES stocks (id));
+CREATE INDEX ix_stock_prices_timestamp ON stock_prices (timestamp);
+CREATE INDEX ix_stock_prices_stock_id_timestamp ON stock_prices (stock_id, timestamp);
+CREATE TABLE tick_log (id INTEGER NOT NULL, timestamp DATETIME NOT NULL, funds INTEGER NOT NULL,
+    stocks INTEGER NOT NULL, fund_rows INTEGER NOT NULL, stock_rows INTEGER NOT NULL, PRIMARY KEY (id));
+CREATE INDEX ix_tick_log_timestamp ON tick_log (timestamp);
+PRAGMA user_version = 2;
+"""
+
+_legacy = MetaData()
+LegacyFundHistory = Table('fund_histories', _legacy, Column('id', Integer, primary_key=True), Column('fund_id', Integer),
+                          Column('estimated_change', Float), Column('timestamp', DateTime))
+LegacyStockPrice = Table('stock_prices', _legacy, Column('id', Integer, primary_key=True), Column('stock_id', Integer),
+                         Column('price', Float), Column('prev_close', Float), Column('change_percent', Float),
+                         Column('timestamp', DateTime))
+
+def tick_times(day: date, interval: int):
+    times = []
+    for start, end in SESSIONS:
+        t, e = datetime.combine(day, start), datetime.combine(day, end)
+        while t <= e:
+            times.append(t)
+            t += timedelta(seconds=interval)
+    return times
+
+def build_legacy(path: str, args):
+    """按 tick 顺序写入 (与实际运行一致：同一基金的记录分散在整张表中)"""
+    rng = random.Random(11)
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_DDL)
+    conn.executemany("INSERT INTO funds (id, code, name) VALUES (?, ?, ?)",
+                     [(i, f"{i:06d}", f"F{i}") for i in range(1, args.funds + 1)])
+    conn.executemany("INSERT INTO stocks (id, code, name) VALUES (?, ?, ?)",
+                     [(i, f"{i:06d}", f"S{i}") for i in range(1, args.stocks + 1)])
+    prices = {sid: round(rng.uniform(3, 300), 2) for sid in range(1, args.stocks + 1)}
+    days = []
+    d = date(2026, 3, 2)
+    while len(days) < args.days:
+        if d.weekday() < 5:
+            days.append(d)
+        d += timedelta(days=1)
+    for day in days:
+        prev = dict(prices)
+        for t in tick_times(day, args.interval):
+            ts = t.strftime("%Y-%m-%d %H:%M:%S.%f")
+            fund_rows = [(fid, round(rng.uniform(-3, 3), 2), ts)
+                         for fid in rng.sample(range(1, args.funds + 1), int(args.funds * args.changed))]
+            price_rows = []
+            for sid in rng.sample(range(1, args.stocks + 1), int(args.stocks * args.changed)):
+                prices[sid] = round(max(0.5, prices[sid] * (1 + rng.uniform(-0.003, 0.003))), 2)
+                price_rows.append((sid, prices[sid], prev[sid], round((prices[sid] - prev[sid]) / prev[sid] * 100, 2), ts))
+            conn.executemany("INSERT INTO fund_histories (fund_id, estimated_change, timestamp) VALUES (?, ?, ?)", fund_rows)
+            conn.executemany("INSERT INTO stock_prices (stock_id, price, prev_close, change_percent, timestamp) "
+                             "VALUES (?, ?, ?, ?, ?)", price_rows)
+            conn.execute("INSERT INTO tick_log (timestamp, funds, stocks, fund_rows, stock_rows) VALUES (?, ?, ?, ?, ?)",
+                         (ts, args.funds, args.stocks, len(fund_rows), len(price_rows)))
+        conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    return days
+
+def timed(fn, repeat):
+    best, rows = float('inf'), 0
+    for _ in range(repeat):
+        t0 = time_mod.perf_counter()
+        rows = len(fn())
+        best = min(best, time_mod.perf_counter() - t0)
+    return best, rows
+
+def measure(path: str, days, args, compact: bool):
+    """返回 {查询名: (行数, sqlite3 毫秒, Core 毫秒)}"""
+    first = datetime.combine(days[0], datetime.min.time())
+    day_start = datetime.combine(days[len(days) // 2], datetime.min.time())
+    day_end, last = day_start + timedelta(days=1), datetime.combine(days[-1], datetime.min.time()) + timedelta(days=1)
+    if compact:
+        fh, sp = FundHistory.__table__, StockPrice.__table__
+        p = lambda dt: int((dt - datetime(1970, 1, 1)).total_seconds())
+    else:
+        fh, sp = LegacyFundHistory, LegacyStockPrice
+        p = lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+    fid, sid = args.funds // 2, args.stocks // 2
+    queries = {
+        '基金单日': ("SELECT timestamp, estimated_change FROM fund_histories "
+                     "WHERE fund_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                     (fid, p(day_start), p(day_end)),
+                     select(fh.c.timestamp, fh.c.estimated_change)
+                     .where(fh.c.fund_id == fid, fh.c.timestamp >= day_start, fh.c.timestamp < day_end)
+                     .order_by(fh.c.timestamp)),
+        '股票多日': ("SELECT timestamp, price, prev_close, change_percent FROM stock_prices "
+                     "WHERE stock_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                     (sid, p(first), p(last)),
+                     select(sp.c.timestamp, sp.c.price, sp.c.prev_close, sp.c.change_percent)
+                     .where(sp.c.stock_id == sid, sp.c.timestamp >= first, sp.c.timestamp < last)
+                     .order_by(sp.c.timestamp)),
+        '全市场单日': ("SELECT stock_id, timestamp, price, prev_close, change_percent FROM stock_prices "
+                       "WHERE timestamp >= ? AND timestamp < ? ORDER BY stock_id, timestamp",
+                       (p(day_start), p(day_end)),
+                       select(sp.c.stock_id, sp.c.timestamp, sp.c.price, sp.c.prev_close, sp.c.change_percent)
+                       .where(sp.c.timestamp >= day_start, sp.c.timestamp < day_end)
+                       .order_by(sp.c.stock_id, sp.c.timestamp)),
+    }
+    conn = sqlite3.connect(path)
+    engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+    result = {}
+    with engine.connect() as sa_conn:
+        for name, (sql, params, stmt) in queries.items():
+            raw_s, rows = timed(lambda: conn.execute(sql, params).fetchall(), args.repeat)
+            core_s, core_rows = timed(lambda: sa_conn.execute(stmt).all(), args.repeat)
+            assert rows == core_rows
+            result[name] = (rows, raw_s * 1000, core_s * 1000)
+    conn.close()
+    engine.dispose()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--funds', type=int, default=300)
+    parser.add_argument('--stocks', type=int, default=2000)
+    parser.add_argument('--interval', type=int, default=30)
+    parser.add_argument('--changed', type=float, default=0.3, help="每个 tick 有变化的基金/股票比例")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'bench.db')
+        t0 = time_mod.perf_counter()
+        days = build_legacy(path, args)
+        print(f"合成 {len(days)} 个交易日 (旧结构): {time_mod.perf_counter() - t0:.1f}s")
+        before_size = os.path.getsize(path)
+        before = measure(path, days, args, compact=False)
+
+        engine = create_engine(f"sqlite:///{path}", poolclass=NullPool)
+        t0 = time_mod.perf_counter()
+        versions = migrations.migrate(engine)
+        engine.dispose()
+        print(f"迁移 v{versions[0]} -> v{versions[1]}: {time_mod.perf_counter() - t0:.1f}s")
+        conn = sqlite3.connect(path)
+        conn.execute("VACUUM")
+        conn.close()
+        after_size = os.path.getsize(path)
+        after = measure(path, days, args, compact=True)
+
+        print(f"\n文件大小: {before_size / 1e6:8.1f} MB -> {after_size / 1e6:8.1f} MB  ({after_size / before_size - 1:+.1%})")
+        print(f"\n{'查询':<10}{'行数':>8}  {'sqlite3 前/后 (ms)':>22}  {'Core 前/后 (ms)':>22}")
+        for name in before:
+            rows, raw0, core0 = before[name]
+            rows1, raw1, core1 = after[name]
+            assert rows == rows1, (name, rows, rows1)
+            print(f"{name:<10}{rows:>8}  {raw0:9.2f} / {raw1:9.2f}  {core0:10.2f} / {core1:9.2f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
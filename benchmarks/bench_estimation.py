@@ -0,0 +1,101 @@
+# bench_estimation.py
+# 估值计算基准：原逐基金 Python 累加 vs estimation_engine 的 CSR 向量运算
+# 数据写入内存 SQLite，矩阵通过 build_matrix 从数据库构建，顺带校验两种算法结果一致
+#
+# 用法:
+#   python benchmarks/bench_estimation.py                         # 5000 个基金, 3000 只股票, 每个基金 10 只持仓
+#   python benchmarks/bench_estimation.py --funds 10000 --holdings 200
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Fund, Stock, Holding
+from quote_parser import Quote
+from estimation_engine import build_matrix, EstimationEngine
+
+def populate(session, funds, stocks, holdings, seed=1):
+    rnd = random.Random(seed)
+    now = datetime.now()
+    session.execute(insert(Stock), [{'id': i + 1, 'code': f"{600000 + i:06d}", 'name': f"S{i}", 'created_at': now}
+                                    for i in range(stocks)])
+    session.execute(insert(Fund), [{'id': i + 1, 'code': f"{i:06d}", 'name': f"F{i}", 'created_at': now, 'updated_at': now}
+                                   for i in range(funds)])
+    rows = []
+    for f in range(funds):
+        for s in rnd.sample(range(stocks), min(holdings, stocks)):
+            rows.append({'fund_id': f + 1, 'stock_id': s + 1, 'ratio': rnd.uniform(0.001, 0.1), 'created_at': now})
+    session.execute(insert(Holding), rows)
+    session.commit()
+    price_map = {f"{600000 + i:06d}": Quote(f"S{i}", 10.0, 10.0, rnd.uniform(-10, 10)) for i in range(stocks)}
+    return price_map
+
+def legacy_estimate(fund_holdings_map, price_map):
+    """原 _perform_update 第 4 步的算法"""
+    result = {}
+    for fund_id, h_list in fund_holdings_map.items():
+        est_change = 0.0
+        for code, ratio in h_list:
+            p_data = price_map.get(code)
+            if p_data:
+                est_change += p_data.pct * ratio
+        result[fund_id] = est_change
+    return result
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--funds', type=int, default=5000)
+    ap.add_argument('--stocks', type=int, default=3000)
+    ap.add_argument('--holdings', type=int, default=10, help='每个基金的持仓数')
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    price_map = populate(session, args.funds, args.stocks, args.holdings)
+
+    # 原实现每个 tick 重建的 {fund_id: [(code, ratio)]}；这里只构建一次，只比较计算部分
+    fund_holdings_map = {}
+    for fund in session.query(Fund).all():
+        fund_holdings_map[fund.id] = [(h.stock.code, h.ratio) for h in fund.holdings]
+
+    t0 = time.perf_counter()
+    matrix = build_matrix(session)
+    build_time = time.perf_counter() - t0
+    est = EstimationEngine()
+
+    legacy = legacy_estimate(fund_holdings_map, price_map)
+    vectorized = est.estimate(matrix, price_map)
+    for i, fid in enumerate(matrix.fund_ids):
+        assert abs(legacy[int(fid)] - vectorized[i]) < 1e-9, "两种算法结果不一致"
+
+    est.matrix(session)
+    t_cached = best_of(lambda: est.matrix(session), args.repeat)
+    t_legacy = best_of(lambda: legacy_estimate(fund_holdings_map, price_map), args.repeat)
+    t_vec = best_of(lambda: est.estimate(matrix, price_map), args.repeat)
+
+    print(f"{args.funds} 个基金 x {args.stocks} 只股票, {matrix.nnz} 条持仓, best of {args.repeat}")
+    print(f"  矩阵构建 (持仓变化时)          {build_time * 1000:8.1f} ms")
+    print(f"  取矩阵 (持仓未变化)            {t_cached * 1000:8.3f} ms")
+    print(f"  legacy 逐基金累加              {t_legacy * 1000:8.1f} ms")
+    print(f"  行情向量 + CSR 乘法            {t_vec * 1000:8.1f} ms  {t_legacy / t_vec:5.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# bench_fund_list.py
+# 基金列表 (/api/fund/list) 在大量基金下的耗时：合成若干基金、一个交易日的分时和若干天日线写入临时库，
+# 测量快照重建 (load_entries 一条查询) 以及在快照上分页/排序/筛选生成一页响应的耗时
+#
+# 用法:
+#   python benchmarks/bench_fund_list.py
+#   python benchmarks/bench_fund_list.py --funds 5000 --stocks 3000 --interval 30
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time as time_mod
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Fund, Stock, Holding, FundHistory, TickLog, FundDaily
+from trading_calendar import SESSIONS
+from fund_snapshot import FundListCache, ListQuery, load_entries
+
+def tick_times(day: date, interval: int):
+    times = []
+    for start, end in SESSIONS:
+        t, e = datetime.combine(day, start), datetime.combine(day, end)
+        while t <= e:
+            times.append(t)
+            t += timedelta(seconds=interval)
+    return times
+
+def build(session, args):
+    rng = random.Random(5)
+    funds = range(1, args.funds + 1)
+    session.execute(insert(Fund.__table__), [{'id': i, 'code': f"{i:06d}", 'name': f"基金{i}"} for i in funds])
+    session.execute(insert(Stock.__table__), [{'id': i, 'code': f"{i:06d}", 'name': f"S{i}"} for i in range(1, args.stocks + 1)])
+    session.execute(insert(Holding.__table__), [{'fund_id': fid, 'stock_id': sid, 'ratio': round(rng.uniform(0.01, 0.1), 4)}
+                                                for fid in funds for sid in rng.sample(range(1, args.stocks + 1), 10)])
+    day = date(2026, 3, 2)
+    for k in range(args.daily_days):
+        d = day - timedelta(days=k + 1)
+        session.execute(insert(FundDaily.__table__), [{'fund_id': fid, 'trade_date': d.isoformat(), 'open': 0, 'high': 0,
+                                                       'low': 0, 'estimated_change': round(rng.uniform(-3, 3), 2)}
+                                                      for fid in funds])
+    times = tick_times(day, args.interval)
+    session.execute(insert(TickLog.__table__), [{'timestamp': t, 'funds': args.funds, 'stocks': args.stocks} for t in times])
+    # 只存变化；约 5% 的基金当天没有分时 (显示最近的日线收盘估值)
+    active = list(funds)[:int(args.funds * 0.95)]
+    rows = [{'fund_id': fid, 'timestamp': t, 'estimated_change': round(rng.uniform(-3, 3), 2)}
+            for t in times for fid in rng.sample(active, len(active) // 3)]
+    session.execute(insert(FundHistory.__table__), rows)
+    session.commit()
+    return len(rows)
+
+def timed(fn, repeat):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time_mod.perf_counter()
+        result = fn()
+        best = min(best, time_mod.perf_counter() - t0)
+    return best * 1000, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--funds', type=int, default=5000)
+    parser.add_argument('--stocks', type=int, default=3000)
+    parser.add_argument('--interval', type=int, default=30)
+    parser.add_argument('--daily-days', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        t0 = time_mod.perf_counter()
+        rows = build(session, args)
+        print(f"合成 {args.funds} 个基金、{rows} 条分时: {time_mod.perf_counter() - t0:.1f}s")
+
+        ms, entries = timed(lambda: load_entries(session), args.repeat)
+        print(f"{'快照重建 (一条查询)':<24} {ms:8.2f} ms  {len(entries)} 项")
+
+        cache = FundListCache()
+        snapshot = cache.get(session)
+        print(f"{'全部基金响应体':<24} {len(snapshot.body) / 1024:8.0f} KiB")
+        for name, query in (('按 ID 第 1 页', ListQuery()),
+                            ('按估值降序 第 10 页', ListQuery('est_change', True, page=10)),
+                            ('涨跌幅度 + 上涨筛选', ListQuery('abs_change', True, trend='up')),
+                            ('名称搜索 + 仓位排序', ListQuery('total_ratio', True, keyword='基金12'))):
+            # 新版本上的第一次含排序，之后命中该版本的排序缓存
+            snapshot = cache._publish(snapshot.entries)
+            first, _ = timed(lambda: snapshot.page_body(query), 1)
+            again, body = timed(lambda: snapshot.page_body(query), args.repeat)
+            print(f"{name:<24} {first:8.2f} ms  (缓存后 {again:.2f} ms, {len(body)} 字节)")
+        session.close()
+        engine.dispose()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
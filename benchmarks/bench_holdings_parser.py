@@ -0,0 +1,117 @@
+# bench_holdings_parser.py
+# 基金持仓解析基准：旧版 (整段正则 + 反转义 + lxml 建树) vs holdings_parser
+#
+# 用法:
+#   python benchmarks/bench_holdings_parser.py                       # 合成 300 个基金的响应 (每个含 3 个季度)
+#   python benchmarks/bench_holdings_parser.py --funds 1000 --holdings 50
+#   python benchmarks/bench_holdings_parser.py --record data/records  # 使用 ALPHA_RECORD_DIR 录制的响应
+
+import argparse
+import base64
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import html
+from fake_upstream import Synthesizer
+from holdings_parser import parse_holdings
+
+def legacy_parse(text: str):
+    """原 FundFetcher._fetch_from_pc_api 的解析逻辑 (去掉了打印)"""
+    content = ""
+    match = re.search(r'content:"(.*?)",aryLastDate', text, re.DOTALL)
+    if match:
+        content = match.group(1)
+    else:
+        match = re.search(r'content:"(.*)"', text, re.DOTALL)
+        if match:
+            content = match.group(1)
+    if not content:
+        return []
+    tree = html.fromstring(content.replace(r'\"', '"').replace(r'\/', '/'))
+    holdings = []
+    for tbl in tree.xpath('//table'):
+        rows = tbl.xpath('.//tr')
+        if not rows: continue
+        headers = [''.join(col.itertext()).strip() for col in rows[0].xpath('.//td|.//th')]
+        idx_code = idx_name = idx_ratio = -1
+        for i, h in enumerate(headers):
+            if '代码' in h: idx_code = i
+            elif '名称' in h: idx_name = i
+            elif '占比' in h or '比例' in h: idx_ratio = i
+        if idx_code != -1 and idx_name != -1 and idx_ratio != -1:
+            for row in rows[1:]:
+                cols = row.xpath('.//td')
+                if len(cols) <= max(idx_code, idx_name, idx_ratio):
+                    continue
+                c_code = ''.join(cols[idx_code].itertext()).strip()
+                c_name = ''.join(cols[idx_name].itertext()).strip()
+                c_ratio_str = ''.join(cols[idx_ratio].itertext()).strip().replace('%', '')
+                if c_code and c_ratio_str:
+                    try:
+                        holdings.append({'code': c_code, 'name': c_name, 'ratio': float(c_ratio_str) / 100.0})
+                    except ValueError:
+                        continue
+            if holdings:
+                holdings = holdings[:10]
+                break
+    return holdings
+
+def load_recorded(path):
+    files = sorted(glob.glob(os.path.join(path, '*.jsonl'))) if os.path.isdir(path) else [path]
+    texts = []
+    for fn in files:
+        with open(fn, encoding='utf-8') as f:
+            for line in f:
+                e = json.loads(line)
+                if 'FundArchivesDatas.aspx' in e['url']:
+                    texts.append(base64.b64decode(e['body_b64']).decode('utf-8', 'replace'))
+    return texts
+
+def run(label, fn, texts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for t in texts:
+            fn(t)
+        best = min(best, time.perf_counter() - t0)
+    return label, best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--funds', type=int, default=300)
+    ap.add_argument('--holdings', type=int, default=10, help='合成响应中每个季度表格的行数')
+    ap.add_argument('--record', help='录制文件或目录')
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+
+    if args.record:
+        texts = load_recorded(args.record)
+    else:
+        synth = Synthesizer(holdings_per_fund=args.holdings)
+        texts = [synth.fund_archives(f"{i:06d}", args.holdings) for i in range(args.funds)]
+    if not texts:
+        print("没有可用的响应")
+        return
+
+    # 正确性校验
+    for t in texts:
+        assert legacy_parse(t) == parse_holdings(t, limit=10), "新旧解析结果不一致"
+
+    size = sum(len(t.encode('utf-8')) for t in texts)
+    results = [
+        run('legacy (regex+unescape+lxml)', legacy_parse, texts, args.repeat),
+        run('parse_holdings', lambda t: parse_holdings(t, limit=10), texts, args.repeat),
+    ]
+    print(f"{len(texts)} 个响应, 共 {size / 1024:.0f} KiB, best of {args.repeat}")
+    base = results[0][1]
+    for label, t in results:
+        print(f"  {label:<30} {t * 1000:8.1f} ms  {len(texts) / t:8.0f} 基金/秒  {base / t:5.2f}x")
+
+if __name__ == '__main__':
+    main()
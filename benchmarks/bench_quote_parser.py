@@ -0,0 +1,123 @@
+# bench_quote_parser.py
+# 新浪行情解析微基准：旧版 (整体 GBK 解码 + 逐行 split + dict) vs quote_parser
+#
+# 用法:
+#   python benchmarks/bench_quote_parser.py                  # 合成 2000 只股票的响应
+#   python benchmarks/bench_quote_parser.py --codes 5000
+#   python benchmarks/bench_quote_parser.py --file a.txt b.txt   # 使用抓包保存的原始响应
+
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quote_parser import parse_sina, parse_sina_into
+
+NAMES = ['贵州茅台', '宁德时代', '招商银行', '中国平安', '五粮液', '隆基绿能', '比亚迪', '药明康德']
+
+def make_payload(codes, seed=0) -> bytes:
+    """按新浪真实格式合成一段响应 (33 个字段)"""
+    rnd = random.Random(seed)
+    lines = []
+    for c in codes:
+        prefix = 'sh' if c.startswith('6') else 'sz'
+        prev = round(rnd.uniform(3, 300), 2)
+        price = round(prev * rnd.uniform(0.9, 1.1), 2)
+        book = ','.join(str(rnd.randint(100, 99999)) if i % 2 == 0 else f"{price:.3f}" for i in range(20))
+        fields = [
+            rnd.choice(NAMES), f"{prev:.3f}", f"{prev:.3f}", f"{price:.3f}",
+            f"{price * 1.02:.3f}", f"{price * 0.98:.3f}", f"{price:.3f}", f"{price:.3f}",
+            str(rnd.randint(10**5, 10**8)), f"{rnd.uniform(10**6, 10**10):.3f}",
+            book, '2024-05-20', '14:59:57', '00'
+        ]
+        lines.append(f'var hq_str_{prefix}{c}="{",".join(fields)}";')
+    return ('\n'.join(lines) + '\n').encode('gbk')
+
+def legacy_parse(payload: bytes, codes):
+    """原 StockFetcher._fetch_chunk 的解析逻辑 (用于对比)"""
+    map_sina_to_raw = {}
+    for c in codes:
+        prefix = 'sz'
+        if c.startswith('6'): prefix = 'sh'
+        elif c.startswith('8') or c.startswith('4'): prefix = 'bj'
+        map_sina_to_raw[f"{prefix}{c}"] = c
+    text = payload.decode('gbk')
+    data_map = {}
+    for line in text.strip().split('\n'):
+        if '="' not in line: continue
+        left, right = line.split('="')
+        val_str = right.strip().strip('";')
+        sina_code = left.strip().split('hq_str_')[-1]
+        if not val_str: continue
+        fields = val_str.split(',')
+        if len(fields) < 4: continue
+        try:
+            name = fields[0]
+            prev_close = float(fields[2])
+            price = float(fields[3])
+            if price == 0 and prev_close > 0:
+                price = prev_close
+            pct = 0.0
+            if prev_close > 0:
+                pct = (price - prev_close) / prev_close * 100
+            raw_code = map_sina_to_raw.get(sina_code)
+            if raw_code:
+                data_map[raw_code] = {'name': name, 'price': price, 'prev_close': prev_close, 'pct': round(pct, 2)}
+        except:
+            continue
+    return data_map
+
+def bench(label, fn, repeat):
+    fn()  # 预热
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return label, best
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--codes', type=int, default=2000)
+    ap.add_argument('--file', nargs='*', help='抓包保存的原始响应文件 (GBK 字节)')
+    ap.add_argument('--repeat', type=int, default=20)
+    args = ap.parse_args()
+
+    if args.file:
+        payload = b''.join(open(f, 'rb').read() for f in args.file)
+        codes = list(parse_sina(payload).keys())
+    else:
+        codes = [f"{600000 + i:06d}" if i % 2 else f"{i:06d}" for i in range(args.codes)]
+        payload = make_payload(codes)
+
+    slot_of = {c: i for i, c in enumerate(codes)}
+    prices = array('d', bytes(8 * len(codes)))
+    prevs = array('d', bytes(8 * len(codes)))
+    pcts = array('d', bytes(8 * len(codes)))
+
+    # 正确性校验：新旧解析结果一致
+    old = legacy_parse(payload, codes)
+    new = parse_sina(payload)
+    assert set(old) == set(new), "解析出的股票集合不一致"
+    for c, d in old.items():
+        q = new[c]
+        assert (d['name'], d['price'], d['prev_close'], d['pct']) == (q.name, q.price, q.prev_close, q.pct), c
+
+    results = [
+        bench('legacy (decode+split+dict)', lambda: legacy_parse(payload, codes), args.repeat),
+        bench('parse_sina', lambda: parse_sina(payload), args.repeat),
+        bench('parse_sina(extended=True)', lambda: parse_sina(payload, extended=True), args.repeat),
+        bench('parse_sina_into (arrays)', lambda: parse_sina_into(payload, slot_of, prices, prevs, pcts), args.repeat),
+    ]
+
+    print(f"payload: {len(payload) / 1024:.1f} KiB, {len(codes)} 只股票, best of {args.repeat}")
+    base = results[0][1]
+    for label, t in results:
+        print(f"  {label:<30} {t * 1000:8.2f} ms  {base / t:5.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# bench_tick_write.py
+# 每个 tick 的写库耗时：原 ORM 逐条 add + 逐只 query Stock vs history_store.save_tick (Core executemany)
+# 使用临时文件中的 SQLite (与实际部署一致，包含 commit 的落盘开销)
+#
+# 用法:
+#   python benchmarks/bench_tick_write.py                      # 5000 个基金, 3000 只股票, 每种方式 5 个 tick
+#   python benchmarks/bench_tick_write.py --funds 1000 --stocks 800 --ticks 10
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, func, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Fund, Stock, FundHistory, StockPrice
+from quote_parser import Quote
+from history_store import save_tick
+
+def populate(session, funds, stocks):
+    now = datetime.now()
+    session.execute(insert(Stock), [{'id': i + 1, 'code': f"{600000 + i:06d}", 'name': f"S{i}", 'created_at': now}
+                                    for i in range(stocks)])
+    session.execute(insert(Fund), [{'id': i + 1, 'code': f"{i:06d}", 'name': f"F{i}", 'created_at': now, 'updated_at': now}
+                                   for i in range(funds)])
+    session.commit()
+
+def make_tick(rnd, funds, stocks):
+    changes = [(i + 1, rnd.uniform(-3, 3)) for i in range(funds)]
+    price_map = {f"{600000 + i:06d}": Quote(f"S{i}", 10.0, 10.0, rnd.uniform(-10, 10)) for i in range(stocks)}
+    return changes, price_map
+
+def legacy_write(session, timestamp, changes, price_map):
+    """原 _perform_update 第 4、5 步的写法"""
+    for fund_id, change in changes:
+        session.add(FundHistory(fund_id=fund_id, estimated_change=change, timestamp=timestamp))
+    for code, data in price_map.items():
+        stock = session.query(Stock).filter_by(code=code).first()
+        if stock:
+            session.add(StockPrice(stock_id=stock.id, price=data.price, prev_close=data.prev_close,
+                                   change_percent=data.pct, timestamp=timestamp))
+    session.commit()
+
+def bulk_write(session, timestamp, changes, price_map, code_to_id):
+    save_tick(session, timestamp, changes, {code_to_id[c]: q for c, q in price_map.items()})
+    session.commit()
+
+def run(label, session_factory, write, ticks, start):
+    times = []
+    for i in range(ticks):
+        session = session_factory()
+        t0 = time.perf_counter()
+        write(session, start + timedelta(minutes=i), i)
+        times.append(time.perf_counter() - t0)
+        session.close()
+    times.sort()
+    return label, times[len(times) // 2], times[0]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--funds', type=int, default=5000)
+    ap.add_argument('--stocks', type=int, default=3000)
+    ap.add_argument('--ticks', type=int, default=5)
+    args = ap.parse_args()
+
+    rnd = random.Random(1)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ('legacy ORM add + query', 'save_tick (Core executemany)'):
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, label[:6].strip() + '.db')}")
+            Base.metadata.create_all(engine)
+            factory = sessionmaker(bind=engine)
+            s = factory()
+            populate(s, args.funds, args.stocks)
+            # 代码 -> ID 缓存 (实际运行时由估值矩阵提供)
+            code_to_id = dict(s.execute(select(Stock.code, Stock.id)).all())
+            s.close()
+            # 每个 tick 的值都不同 (save_tick 会跳过未变化的值)
+            ticks = [make_tick(rnd, args.funds, args.stocks) for _ in range(args.ticks)]
+
+            if label.startswith('legacy'):
+                write = lambda session, ts, i: legacy_write(session, ts, *ticks[i])
+            else:
+                write = lambda session, ts, i: bulk_write(session, ts, *ticks[i], code_to_id)
+            results.append(run(label, factory, write, args.ticks, datetime(2024, 1, 2, 9, 30)))
+
+            s = factory()
+            n_hist = s.scalar(select(func.count()).select_from(FundHistory))
+            n_price = s.scalar(select(func.count()).select_from(StockPrice))
+            assert n_hist == args.funds * args.ticks and n_price == args.stocks * args.ticks, "写入条数不符"
+            s.close()
+            engine.dispose()
+
+    print(f"{args.funds} 个基金 + {args.stocks} 只股票 / tick, {args.ticks} 个 tick")
+    base = results[0][1]
+    for label, median, best in results:
+        print(f"  {label:<30} 中位 {median * 1000:8.1f} ms  最快 {best * 1000:8.1f} ms  {base / median:5.1f}x")
+
+if __name__ == '__main__':
+    main()
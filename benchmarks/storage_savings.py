@@ -0,0 +1,215 @@
+# storage_savings.py
+# 只存变化的存储节省：同一个交易日分别按“每 tick 全量写入”和 history_store.save_tick (只存变化) 写入
+# 两个临时 SQLite 库，对比行数和文件大小，并校验向前填充后的序列与全量写入一致
+#
+# 用法:
+#   python benchmarks/storage_savings.py                                  # 合成一个交易日 (60 秒间隔)
+#   python benchmarks/storage_savings.py --funds 500 --suspended 0.05
+#   python benchmarks/storage_savings.py --record data/records            # ALPHA_RECORD_DIR 录制的交易日
+#   python benchmarks/storage_savings.py --db data/fund_monitor.db --date 2024-10-16   # 改造前全量写入的库
+
+import argparse
+import os
+import sys
+import tempfile
+import time as time_mod
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select, func
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Fund, Stock, FundHistory, StockPrice, TickLog
+from quote_parser import Quote, parse_sina
+from holdings_parser import parse_holdings
+from quote_providers import market_prefix
+from trading_calendar import SESSIONS
+import history_store
+
+# 一个 tick: (时间, [(fund_id, 估值)], {stock_id: Quote})
+Tick = Tuple[datetime, List[Tuple[int, float]], Dict[int, Quote]]
+
+def estimate(holdings: Dict[int, List[Tuple[int, float]]], quotes: Dict[int, Quote]) -> List[Tuple[int, float]]:
+    result = []
+    for fid, items in holdings.items():
+        result.append((fid, round(sum(quotes[sid].pct * r for sid, r in items if sid in quotes), 2)))
+    return result
+
+def session_times(day: date, interval: int) -> List[datetime]:
+    """交易时段内的 tick 时间 (与 TradingSessionTrigger 一致)，外加收盘后的三次快照检查"""
+    times = []
+    for start, end in SESSIONS:
+        t = datetime.combine(day, start)
+        e = datetime.combine(day, end)
+        while t < e:
+            times.append(t)
+            t += timedelta(seconds=interval)
+        times.append(e)
+    return times + [datetime.combine(day, time(15, m)) for m in (1, 10, 30)]
+
+def synthesize(args) -> Tuple[List[int], List[int], List[Tick]]:
+    """合成交易日：价格只在交易时段内变化 (午休、收盘后冻结)，部分股票停牌"""
+    import random
+    from fake_upstream import Synthesizer
+    synth = Synthesizer(holdings_per_fund=args.holdings)
+    stock_index = {}
+    holdings = {}
+    for fid, code in enumerate((f"{i:06d}" for i in range(args.funds)), 1):
+        items = {}
+        for c, _, w in synth.holdings(code):
+            sid = stock_index.setdefault(c, len(stock_index) + 1)
+            items.setdefault(sid, w / 100)
+        holdings[fid] = list(items.items())
+    stock_codes = list(stock_index)
+    suspended = set(random.Random(7).sample(stock_codes, int(len(stock_codes) * args.suspended)))
+
+    day = date(2024, 10, 16)
+    base = time_mod.mktime(datetime.combine(day, time(9, 30)).timetuple())
+    ticks = []
+    for ts in session_times(day, args.interval):
+        # 行情时钟：开盘以来经过的交易秒数
+        market = 0
+        for start, end in SESSIONS:
+            s, e = datetime.combine(day, start), datetime.combine(day, end)
+            market += max(0, (min(ts, e) - s).total_seconds())
+        payload = ''.join(synth.sina_line(market_prefix(c) + c, base if c in suspended else base + market)
+                          for c in stock_codes).encode('gbk')
+        by_code = parse_sina(payload)
+        quotes = {stock_index[c]: q for c, q in by_code.items()}
+        ticks.append((ts, estimate(holdings, quotes), quotes))
+    return list(holdings), list(stock_index.values()), ticks
+
+def from_recording(args):
+    """录制文件：新浪行情按时间聚成 tick (间隔超过 5 秒视为下一个 tick)，持仓取录制到的基金页面"""
+    from fake_upstream import Recording
+    rec = Recording(args.record)
+    events = sorted((ts, code, line) for code, series in rec.quotes.items() for ts, line in series)
+    clusters, last_ts = [], None
+    for ts, code, line in events:
+        if last_ts is None or ts - last_ts > 5:
+            clusters.append((ts, {}))
+        clusters[-1][1][code] = line
+        last_ts = ts
+
+    stock_index = {}
+    holdings = {}
+    for (path, code), (status, body) in rec.pages.items():
+        if 'FundArchivesDatas' not in path or status != 200:
+            continue
+        text = body.decode('utf-8', 'replace') if isinstance(body, bytes) else body
+        items = {}
+        for h in parse_holdings(text, limit=None):
+            items.setdefault(stock_index.setdefault(h['code'], len(stock_index) + 1), h['ratio'])
+        if items:
+            holdings[len(holdings) + 1] = list(items.items())
+
+    ticks = []
+    for ts, lines in clusters:
+        by_code = parse_sina(b''.join(lines.values()))
+        quotes = {stock_index.setdefault(c, len(stock_index) + 1): q for c, q in by_code.items()}
+        ticks.append((datetime.fromtimestamp(ts), estimate(holdings, quotes), quotes))
+    return list(holdings), list(stock_index.values()), ticks
+
+def from_db(args):
+    """改造前全量写入的库：按时间戳把一天的记录还原成 tick"""
+    engine = create_engine(f"sqlite:///{args.db}")
+    session = sessionmaker(bind=engine)()
+    day = date.fromisoformat(args.date)
+    start, end = datetime.combine(day, time(0, 0)), datetime.combine(day + timedelta(days=1), time(0, 0))
+    by_ts: Dict[datetime, Tuple[list, dict]] = {}
+    for fid, change, ts in session.execute(select(FundHistory.fund_id, FundHistory.estimated_change, FundHistory.timestamp)
+                                           .where(FundHistory.timestamp >= start, FundHistory.timestamp < end)):
+        by_ts.setdefault(ts, ([], {}))[0].append((fid, change))
+    for sid, price, prev, pct, ts in session.execute(
+            select(StockPrice.stock_id, StockPrice.price, StockPrice.prev_close, StockPrice.change_percent, StockPrice.timestamp)
+            .where(StockPrice.timestamp >= start, StockPrice.timestamp < end)):
+        by_ts.setdefault(ts, ([], {}))[1][sid] = Quote('', price, prev, pct)
+    fund_ids = sorted({fid for changes, _ in by_ts.values() for fid, _ in changes})
+    stock_ids = sorted({sid for _, quotes in by_ts.values() for sid in quotes})
+    session.close()
+    # 沿用原库里的 ID
+    ticks = [(ts, changes, quotes) for ts, (changes, quotes) in sorted(by_ts.items())]
+    return fund_ids, stock_ids, ticks
+
+def write_db(path: str, fund_ids: List[int], stock_ids: List[int], ticks: List[Tick], change_only: bool):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    now = datetime.now()
+    session.execute(insert(Stock), [{'id': sid, 'code': f"S{sid}", 'name': '', 'created_at': now} for sid in stock_ids])
+    session.execute(insert(Fund), [{'id': fid, 'code': f"F{fid}", 'name': '', 'created_at': now, 'updated_at': now}
+                                   for fid in fund_ids])
+    session.commit()
+    history_store._last.reset()
+    for ts, changes, quotes in ticks:
+        if change_only:
+            history_store.save_tick(session, ts, changes, quotes)
+        else:
+            if changes:
+                session.execute(insert(FundHistory.__table__), [
+                    {'fund_id': fid, 'estimated_change': c, 'timestamp': ts} for fid, c in changes])
+            if quotes:
+                session.execute(insert(StockPrice.__table__), [
+                    {'stock_id': sid, 'price': q.price, 'prev_close': q.prev_close, 'change_percent': q.pct, 'timestamp': ts}
+                    for sid, q in quotes.items()])
+        session.commit()
+    counts = tuple(session.scalar(select(func.count()).select_from(model)) for model in (FundHistory, StockPrice, TickLog))
+    return engine, session, counts
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--funds', type=int, default=300)
+    ap.add_argument('--holdings', type=int, default=10)
+    ap.add_argument('--interval', type=int, default=60)
+    ap.add_argument('--suspended', type=float, default=0.02, help='合成数据中停牌股票的比例')
+    ap.add_argument('--record', help='录制文件或目录')
+    ap.add_argument('--db', help='改造前 (全量写入) 的数据库')
+    ap.add_argument('--date', help='配合 --db 使用的日期 YYYY-MM-DD')
+    args = ap.parse_args()
+
+    if args.db:
+        fund_ids, stock_ids, ticks = from_db(args)
+        source = f"{args.db} {args.date}"
+    elif args.record:
+        fund_ids, stock_ids, ticks = from_recording(args)
+        source = f"录制 {args.record}"
+    else:
+        fund_ids, stock_ids, ticks = synthesize(args)
+        source = f"合成交易日 (间隔 {args.interval}s, 停牌 {args.suspended:.0%})"
+    if not ticks:
+        print("没有可用的 tick")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for change_only in (False, True):
+            path = os.path.join(tmp, 'change_only.db' if change_only else 'full.db')
+            engine, session, counts = write_db(path, fund_ids, stock_ids, ticks, change_only)
+            session.close()
+            engine.dispose()
+            results[change_only] = (counts, os.path.getsize(path))
+            if change_only:
+                # 校验：向前填充还原的序列与每个 tick 的实际值一致
+                engine = create_engine(f"sqlite:///{path}")
+                session = sessionmaker(bind=engine)()
+                day = ticks[0][0].date()
+                start, end = datetime.combine(day, time(0, 0)), datetime.combine(day + timedelta(days=1), time(0, 0))
+                for fid in fund_ids[:20]:
+                    times, values = history_store.fund_series(session, fid, start, end)
+                    expected = {ts: c for ts, changes, _ in ticks for f, c in changes if f == fid}
+                    assert all(values[i] == expected[t] for i, t in enumerate(times) if t in expected), "还原序列不一致"
+                session.close()
+                engine.dispose()
+
+    (f_full, s_full, _), size_full = results[False]
+    (f_co, s_co, n_ticks), size_co = results[True]
+    print(f"{source}: {len(ticks)} 个 tick, {len(fund_ids)} 个基金, {len(stock_ids)} 只股票")
+    print(f"  fund_histories  全量 {f_full:>9,} 行  只存变化 {f_co:>9,} 行  节省 {1 - f_co / max(f_full, 1):6.1%}")
+    print(f"  stock_prices    全量 {s_full:>9,} 行  只存变化 {s_co:>9,} 行  节省 {1 - s_co / max(s_full, 1):6.1%}")
+    print(f"  tick_log                          {n_ticks:>9,} 行")
+    print(f"  数据库文件      全量 {size_full / 1024:>8,.0f} KiB 只存变化 {size_co / 1024:>8,.0f} KiB 节省 {1 - size_co / size_full:6.1%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+# close_service.py
+# 收盘数据完整性：一条分组查询找出缺收盘记录的基金，补全后在 close_ledger 封账
+# 补全时的行情抓取不占用写库线程，只抓取缺失基金持有的股票
+# 封账后当天的盘后 tick 直接返回 (内存判断，不查库)；启动时按台账补齐停机期间漏掉的交易日
+
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import get_session, Fund, FundHistory, StockPrice, CloseLedger
+from quote_parser import Quote
+from estimation_engine import estimation_engine
+from history_store import save_tick
+from update_pipeline import fetch, compute
+from db_writer import db_writer, DbWriter
+from trading_calendar import trading_calendar, MARKET_CLOSE
+from log_utils import log
+
+CLOSE_TIME = MARKET_CLOSE
+# 启动时往前检查的天数
+BACKFILL_LOOKBACK_DAYS = 30
+
+# 已封账的日期 -> 封账时的持仓版本；版本变化 (新增基金等) 后需要重新检查一次
+_sealed: Dict[date, int] = {}
+_lock = threading.Lock()
+
+def _day_range(day: date):
+    return datetime.combine(day, CLOSE_TIME), datetime.combine(day + timedelta(days=1), time(0, 0))
+
+def funds_missing_close(session: Session, day: date) -> Set[int]:
+    """当天 15:00 之后没有估值记录的基金 ID (一条查询；当天之后才添加的基金不算)"""
+    start, end = _day_range(day)
+    done = select(FundHistory.fund_id).where(FundHistory.timestamp >= start, FundHistory.timestamp < end).distinct()
+    return set(session.execute(
+        select(Fund.id).where(Fund.created_at < end, Fund.id.not_in(done))).scalars())
+
+def is_sealed(day: date) -> bool:
+    with _lock:
+        return _sealed.get(day) == estimation_engine.version
+
+def seal(session: Session, day: date, status: str, funds: int):
+    """写入台账 (并提交)"""
+    row = session.get(CloseLedger, day.isoformat())
+    if row is None:
+        row = CloseLedger(trade_date=day.isoformat())
+        session.add(row)
+    row.status = status
+    row.funds = funds
+    row.sealed_at = datetime.now()
+    session.commit()
+    with _lock:
+        _sealed[day] = estimation_engine.version
+    if status != 'missing':
+        log(f"{day} 收盘数据已封账 ({status}, {funds} 个基金)")
+
+def ensure_close_snapshot(day: date, writer: DbWriter = db_writer):
+    """
+    盘后检查当天收盘数据：缺失的基金补做一次实时估值，全部齐了就封账
+    查缺、抓取行情和计算都在调用线程 (只读会话) 中完成，写库线程只执行写入和封账，不会被网络请求阻塞
+    """
+    if is_sealed(day):
+        return
+    session = get_session()
+    try:
+        missing = funds_missing_close(session, day)
+        tick = fetch(session, sorted(missing)) if missing else None
+    finally:
+        session.close()
+    if missing:
+        log(f"发现 {len(missing)} 个基金需要补全收盘数据...")
+        if tick is None:
+            log(f"仍有 {len(missing)} 个基金缺少收盘数据，下次继续.")
+            return
+        changes, quotes = compute(tick)
+        writer.run(lambda s: _write_close_snapshot(s, day, tick.timestamp, changes, quotes), name='close_snapshot')
+    else:
+        writer.run(lambda s: _write_close_snapshot(s, day), name='close_snapshot')
+
+def _write_close_snapshot(session: Session, day: date, timestamp: Optional[datetime] = None,
+                          changes: List[Tuple[int, float]] = (), quotes: Optional[Dict[int, Quote]] = None):
+    """写库线程内：写入补全的估值，再查一次缺失，全部齐了就封账"""
+    if changes:
+        save_tick(session, timestamp, changes, quotes or {})
+        log(f"为 {len(changes)} 个基金 更新数据完成.")
+    missing = funds_missing_close(session, day)
+    if missing:
+        log(f"仍有 {len(missing)} 个基金缺少收盘数据，下次继续.")
+        return
+    seal(session, day, 'sealed', session.scalar(select(func.count(Fund.id))))
+
+def _last_quotes(session: Session, day: date) -> Dict[int, float]:
+    """当天每只股票最后一次记录的涨跌幅 {stock_id: pct}"""
+    start = datetime.combine(day, time(0, 0))
+    end = start + timedelta(days=1)
+    last = select(StockPrice.stock_id, func.max(StockPrice.timestamp).label('ts'))\
+        .where(StockPrice.timestamp >= start, StockPrice.timestamp < end)\
+        .group_by(StockPrice.stock_id).subquery()
+    rows = session.execute(
+        select(StockPrice.stock_id, StockPrice.change_percent)
+        .join(last, (StockPrice.stock_id == last.c.stock_id) & (StockPrice.timestamp == last.c.ts))
+    )
+    return {sid: pct for sid, pct in rows}
+
+def backfill_day(session: Session, day: date) -> str:
+    """
+    用当天最后一次记录的股票行情补算缺失基金的收盘估值 (持仓取当前持仓)
+    :return: 写入台账的状态
+    """
+    missing = funds_missing_close(session, day)
+    if not missing:
+        seal(session, day, 'sealed', session.scalar(select(func.count(Fund.id))))
+        return 'sealed'
+
+    pcts = _last_quotes(session, day)
+    if not pcts:
+        # 当天完全没有行情记录 (停机一整天)，无从补算，记为 missing 以免反复检查
+        seal(session, day, 'missing', session.scalar(select(func.count(Fund.id))) - len(missing))
+        return 'missing'
+
+    matrix = estimation_engine.matrix(session)
+    vec = np.zeros(len(matrix.stock_ids), dtype=np.float64)
+    for i, sid in enumerate(matrix.stock_ids.tolist()):
+        pct = pcts.get(sid)
+        if pct is not None:
+            vec[i] = pct
+    estimates = np.round(matrix.dot(vec), 2)
+    changes = [(fid, float(estimates[matrix.fund_index[fid]])) for fid in sorted(missing) if fid in matrix.fund_index]
+    save_tick(session, datetime.combine(day, CLOSE_TIME), changes, {})
+    session.commit()
+    seal(session, day, 'backfilled', session.scalar(select(func.count(Fund.id))))
+    return 'backfilled'
+
+def pending_days(session: Session, today: date) -> List[date]:
+    """最近 BACKFILL_LOOKBACK_DAYS 天内 (不含今天)，台账中还没有记录的交易日"""
+    start = today - timedelta(days=BACKFILL_LOOKBACK_DAYS)
+    done = set(session.execute(
+        select(CloseLedger.trade_date).where(CloseLedger.trade_date >= start.isoformat())).scalars())
+    return [d for d in trading_calendar.trading_days(start, today) if d.isoformat() not in done]
+
+def backfill_missed_days(session: Session, today: Optional[date] = None) -> Dict[str, int]:
+    """补齐停机期间漏掉的交易日，返回各状态的天数"""
+    today = today or date.today()
+    stats = {'sealed': 0, 'backfilled': 0, 'missing': 0}
+    for day in pending_days(session, today):
+        stats[backfill_day(session, day)] += 1
+    if any(stats.values()):
+        log(f"收盘台账补齐完成: {stats}")
+    return stats
@@ -0,0 +1,146 @@
+# db_writer.py
+# 单一写库线程：所有写操作 (定时估值、添加/删除基金、更新持仓、配置) 排队交给它执行
+# SQLite 同一时刻只允许一个写事务，集中到一个线程后不会再出现 database is locked；
+# 队列中积压的多个写任务合并到一个事务里提交，减少 commit 次数
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import get_session
+from log_utils import log
+
+# 写任务队列长度 (满了以后提交方阻塞，形成背压)
+QUEUE_SIZE = 256
+# 一个事务最多合并的写任务数
+MAX_BATCH = 32
+
+WriteJob = Callable[[Session], object]
+
+class DbWriter:
+    """
+    写库线程
+    - submit(fn)：排队执行 fn(session)，返回 Future；fn 内不需要 commit，由写线程合并提交
+    - run(fn)：submit 并等待结果 (Flask 请求等同步场景)
+    fn 内也可以自行 commit (如封账)，写线程只有这一个连接在写，不会冲突
+    """
+
+    def __init__(self, queue_size: int = QUEUE_SIZE, max_batch: int = MAX_BATCH):
+        self._queue: "queue.Queue[Tuple[WriteJob, Future, str]]" = queue.Queue(maxsize=queue_size)
+        self.max_batch = max_batch
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats = {'jobs': 0, 'failed': 0, 'batches': 0, 'commit_ms': 0.0, 'max_batch': 0}
+        self._stats_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._loop, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, fn: WriteJob, name: str = '', timeout: Optional[float] = None) -> Future:
+        """排队一个写任务；队列满时最多等待 timeout 秒，仍满则抛出 queue.Full"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("写线程内不能再提交写任务 (会死锁)，请直接使用传入的 session")
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((fn, fut, name or getattr(fn, '__name__', 'job')), timeout=timeout)
+        return fut
+
+    def run(self, fn: WriteJob, name: str = '', timeout: Optional[float] = None):
+        """提交并等待完成，返回 fn 的返回值 (fn 抛出的异常原样抛出)"""
+        return self.submit(fn, name).result(timeout)
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        s['queued'] = self._queue.qsize()
+        s['avg_commit_ms'] = round(s.pop('commit_ms') / s['batches'], 2) if s['batches'] else 0.0
+        return s
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Tuple[WriteJob, Future, str]]):
+        session = get_session()
+        # 任务内部自行提交 (封账、空间回收) 后，之前的任务已经落盘，不再参与失败后的重做
+        commits = [0]
+        event.listen(session, 'after_commit', lambda s: commits.__setitem__(0, commits[0] + 1))
+        try:
+            done = []   # 本事务内已成功执行、等待提交的任务
+            for job in batch:
+                fn, fut, name = job
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                try:
+                    before = commits[0]
+                    result = fn(session)
+                    session.flush()     # 约束错误在这里暴露，归到出错的任务
+                    done.append((job, result))
+                    if commits[0] != before:
+                        self._resolve(done)
+                        done = []
+                except Exception as e:
+                    # 回滚会连带撤销同一事务里其他任务的写入：失败任务单独报错，其余任务逐个重做
+                    session.rollback()
+                    self._fail(fut, name, e)
+                    retry, done = [j for j, _ in done], []
+                    for rj in retry:
+                        self._run_single(session, rj)
+            t0 = time.perf_counter()
+            session.commit()
+            elapsed = (time.perf_counter() - t0) * 1000
+            self._resolve(done)
+            with self._stats_lock:
+                self._stats['batches'] += 1
+                self._stats['commit_ms'] += elapsed
+                self._stats['max_batch'] = max(self._stats['max_batch'], len(batch))
+        except Exception as e:
+            session.rollback()
+            for fn, fut, name in batch:
+                if not fut.done():
+                    self._fail(fut, name, e)
+        finally:
+            session.close()
+
+    def _resolve(self, done: List):
+        for (fn, fut, name), result in done:
+            fut.set_result(result)
+        with self._stats_lock:
+            self._stats['jobs'] += len(done)
+
+    def _run_single(self, session: Session, job: Tuple[WriteJob, Future, str]):
+        """单独执行并提交一个任务 (合并提交失败后的重做)"""
+        fn, fut, name = job
+        try:
+            result = fn(session)
+            session.commit()
+            fut.set_result(result)
+            with self._stats_lock:
+                self._stats['jobs'] += 1
+                self._stats['batches'] += 1
+        except Exception as e:
+            session.rollback()
+            self._fail(fut, name, e)
+
+    def _fail(self, fut: Future, name: str, e: Exception):
+        log(f"写库任务 {name} 失败: {e}")
+        with self._stats_lock:
+            self._stats['failed'] += 1
+        fut.set_exception(e)
+
+db_writer = DbWriter()
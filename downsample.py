@@ -0,0 +1,35 @@
+# downsample.py
+# 折线降采样：LTTB (Largest-Triangle-Three-Buckets)，保留首尾点，按与相邻桶构成的三角形面积选点，
+# 比均匀抽样更能保留峰谷形状
+
+import numpy as np
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    从 n 个点中选出 n_out 个 (n_out < 3 或不少于 n 时全部保留)
+    :param x: 横坐标 (升序)
+    :param y: 纵坐标
+    :return: 保留的点的下标 (升序)
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # 中间的 n-2 个点分成 n_out-2 个桶：[edges[i], edges[i+1])
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一个桶的平均点 (最后一个桶的下一个是末点)
+        if i == n_out - 3:
+            next_x, next_y = x[-1], y[-1]
+        else:
+            next_x, next_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
@@ -0,0 +1,186 @@
+# estimation_engine.py
+# 估值引擎：内存中常驻 基金 x 股票 的稀疏权重矩阵 (CSR)，每个 tick 只做一次向量运算
+# 基金/持仓的写入提交后才重建矩阵，tick 中不查询持仓
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import Fund, Stock, Holding
+from quote_parser import Quote
+from holdings_store import batched
+from log_utils import log
+
+class WeightMatrix:
+    """
+    CSR 格式的权重矩阵 (只读，重建时整体替换)
+    第 i 个基金的持仓为 indices[indptr[i]:indptr[i+1]] 列，占比为 data 中对应位置
+    """
+
+    def __init__(self, fund_ids: List[int], stock_ids: List[int], stock_codes: List[str],
+                 indptr: np.ndarray, indices: np.ndarray, data: np.ndarray):
+        self.fund_ids = np.asarray(fund_ids, dtype=np.int64)
+        self.stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        self.stock_codes = stock_codes
+        self.stock_index = {code: i for i, code in enumerate(stock_codes)}
+        self.fund_index = {fid: i for i, fid in enumerate(fund_ids)}
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        # 每个非零元素所在的行，用 bincount 按行求和 (空行结果为 0)
+        self.rows = np.repeat(np.arange(len(fund_ids), dtype=np.int64), np.diff(indptr))
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.fund_ids), len(self.stock_codes)
+
+    @property
+    def nnz(self) -> int:
+        return len(self.data)
+
+    def quote_vector(self, price_map: Dict[str, Quote]) -> np.ndarray:
+        """行情 -> 按股票列排列的涨跌幅向量，缺失的股票记为 0 (与原逐个累加时跳过一致)"""
+        vec = np.zeros(len(self.stock_codes), dtype=np.float64)
+        index = self.stock_index
+        for code, q in price_map.items():
+            i = index.get(code)
+            if i is not None:
+                vec[i] = q.pct
+        return vec
+
+    def quotes_by_stock_id(self, price_map: Dict[str, Quote]) -> Dict[int, Quote]:
+        """行情按股票 ID 索引 (矩阵同时充当 代码 -> ID 的缓存，写库时无需再查 Stock 表)"""
+        index, ids = self.stock_index, self.stock_ids
+        result = {}
+        for code, q in price_map.items():
+            i = index.get(code)
+            if i is not None:
+                result[int(ids[i])] = q
+        return result
+
+    def stock_codes_of(self, rows: np.ndarray) -> List[str]:
+        """指定行 (基金) 持有的股票代码 (去重)"""
+        selected = np.zeros(len(self.fund_ids), dtype=bool)
+        selected[rows] = True
+        return [self.stock_codes[j] for j in np.unique(self.indices[selected[self.rows]]).tolist()]
+
+    def dot(self, vec: np.ndarray) -> np.ndarray:
+        """矩阵 x 向量：每个基金的 sum(涨跌幅 * 占比)"""
+        return np.bincount(self.rows, weights=self.data * vec[self.indices], minlength=len(self.fund_ids))
+
+def build_matrix(session: Session) -> WeightMatrix:
+    """一次查询读出全部持仓并构建 CSR 矩阵"""
+    fund_ids = np.fromiter(session.execute(select(Fund.id).order_by(Fund.id)).scalars(), dtype=np.int64)
+    # 持仓行数可能很多：绕过 ORM 结果处理，直接取 DBAPI 游标的元组
+    t = Holding.__table__
+    result = session.connection().execute(select(t.c.fund_id, t.c.stock_id, t.c.ratio))
+    try:
+        rows = result.cursor.fetchall()
+    finally:
+        result.close()
+    h_fund = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    h_stock = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    h_ratio = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+
+    # 丢弃指向不存在基金的持仓，按基金行排序
+    pos = np.searchsorted(fund_ids, h_fund)
+    keep = pos < len(fund_ids)
+    keep[keep] = fund_ids[pos[keep]] == h_fund[keep]
+    pos, h_stock, h_ratio = pos[keep], h_stock[keep], h_ratio[keep]
+    order = np.argsort(pos, kind='stable')
+    pos, h_stock, h_ratio = pos[order], h_stock[order], h_ratio[order]
+
+    # 股票 ID -> 列号
+    stock_ids, indices = np.unique(h_stock, return_inverse=True)
+    code_of = {}
+    for batch in batched([int(x) for x in stock_ids]):
+        code_of.update(session.execute(select(Stock.id, Stock.code).where(Stock.id.in_(batch))).all())
+    stock_codes = [code_of.get(int(sid), '') for sid in stock_ids]
+
+    indptr = np.zeros(len(fund_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pos, minlength=len(fund_ids)), out=indptr[1:])
+    return WeightMatrix(fund_ids.tolist(), stock_ids.tolist(), stock_codes, indptr, indices.astype(np.int64), h_ratio)
+
+class EstimationEngine:
+    """
+    估值引擎 (线程安全)
+    - matrix(session)：返回当前矩阵，持仓有变化时先重建
+    - estimate(matrix, price_map)：返回所有基金的预估涨跌幅
+    基金/持仓的写入提交后 (见 _after_flush/_after_commit) 自动 invalidate，tick 中不再查询是否变化
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._matrix: Optional[WeightMatrix] = None
+        self._version = 0   # 每次 invalidate 加一
+        self._built = -1    # 当前矩阵对应的 _version
+        self.rebuilds = 0
+        self._listeners: List[Callable[[int], None]] = []
+
+    @property
+    def version(self) -> int:
+        """持仓版本号，每次基金/持仓提交后加一"""
+        return self._version
+
+    def add_listener(self, fn: Callable[[int], None]):
+        """注册持仓变化 (基金增删、持仓更新) 提交后的回调 fn(新版本号)"""
+        self._listeners.append(fn)
+
+    def invalidate(self):
+        """持仓已变化，下次使用时重建"""
+        with self._lock:
+            self._version += 1
+            version = self._version
+        for fn in self._listeners:
+            try:
+                fn(version)
+            except Exception as e:
+                log(f"持仓变化回调失败: {e}")
+
+    def matrix(self, session: Session) -> WeightMatrix:
+        with self._lock:
+            if self._matrix is None or self._built != self._version:
+                # 先记下版本再读库：构建期间的提交会再次 invalidate，下次照样重建
+                version = self._version
+                t0 = time.time()
+                self._matrix = build_matrix(session)
+                self._built = version
+                self.rebuilds += 1
+                m = self._matrix
+                log(f"估值矩阵重建: {m.shape[0]} 个基金 x {m.shape[1]} 只股票, {m.nnz} 条持仓 ({(time.time() - t0) * 1000:.0f}ms)")
+            return self._matrix
+
+    @staticmethod
+    def estimate(matrix: WeightMatrix, price_map: Dict[str, Quote]) -> np.ndarray:
+        """所有基金的预估涨跌幅 (%)，顺序与 matrix.fund_ids 一致"""
+        return matrix.dot(matrix.quote_vector(price_map))
+
+estimation_engine = EstimationEngine()
+
+# 会话里有基金/持仓变更 (ORM 对象，或 holdings_store 的批量 insert/update/delete) 时打标记，提交后使矩阵失效
+_DIRTY_KEY = 'holdings_dirty'
+
+@event.listens_for(Session, 'after_flush')
+def _after_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Fund, Holding)):
+            session.info[_DIRTY_KEY] = True
+            return
+
+@event.listens_for(Session, 'do_orm_execute')
+def _do_orm_execute(state):
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None \
+            and state.bind_mapper.class_ in (Fund, Holding):
+        state.session.info[_DIRTY_KEY] = True
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    if session.info.pop(_DIRTY_KEY, False):
+        estimation_engine.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop(_DIRTY_KEY, None)
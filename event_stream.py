@@ -0,0 +1,95 @@
+# event_stream.py
+# 服务端推送 (SSE)：每个 tick 提交后把有变化的基金估值推给所有打开的页面，代替前端 30 秒轮询
+# 一次广播只序列化一次，按订阅者各自的有界队列分发；消费太慢的订阅者直接断开，由浏览器重连后重新拉取列表
+
+import json
+import queue
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from history_store import add_tick_listener
+from estimation_engine import estimation_engine
+
+# 每个订阅者最多积压的消息数
+SUBSCRIBER_QUEUE_SIZE = 32
+# 没有消息时的心跳间隔 (秒)，同时用于发现已断开的连接
+HEARTBEAT_SECONDS = 15
+# 浏览器断线后的重连间隔 (毫秒)
+RETRY_MS = 3000
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.closed = False
+
+class Broadcaster:
+    """
+    - publish(event, data)：广播一条消息
+    - stream()：一个订阅者的 SSE 文本流 (Flask Response 直接迭代)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Set[_Subscriber] = set()
+        self._next_id = 0
+        self._stats = {'published': 0, 'dropped_subscribers': 0}
+
+    def publish(self, event: str, data) -> int:
+        """广播，返回收到消息的订阅者数量 (没有订阅者时不做序列化)"""
+        with self._lock:
+            if not self._subscribers:
+                return 0
+            self._next_id += 1
+            message = f"id: {self._next_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+            self._stats['published'] += 1
+            delivered = 0
+            for sub in list(self._subscribers):
+                try:
+                    sub.queue.put_nowait(message)
+                    delivered += 1
+                except queue.Full:
+                    # 跟不上的连接断开，浏览器重连后会重新拉取完整列表
+                    sub.closed = True
+                    self._subscribers.discard(sub)
+                    self._stats['dropped_subscribers'] += 1
+            return delivered
+
+    def stream(self) -> Iterator[str]:
+        sub = _Subscriber()
+        with self._lock:
+            self._subscribers.add(sub)
+        try:
+            yield f"retry: {RETRY_MS}\nevent: hello\ndata: {{}}\n\n"
+            while not sub.closed:
+                try:
+                    yield sub.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.discard(sub)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, subscribers=len(self._subscribers))
+
+broadcaster = Broadcaster()
+
+def _on_tick(timestamp: datetime, changes: List[Tuple[int, float]], evaluated: Optional[Set[int]]):
+    # 补齐往日收盘数据的写入不推送 (列表只关心当天)
+    if timestamp.date() != date.today():
+        return
+    broadcaster.publish('tick', {
+        'time': timestamp.strftime("%H:%M"),
+        'changes': changes,
+        # 全量 tick 为 null (所有基金都在这个时间得到确认)；部分基金的 tick 只列出计算过的基金
+        'evaluated': None if evaluated is None else sorted(evaluated),
+    })
+
+def _on_holdings_changed(version: int):
+    # 基金增删、持仓变化：前端重新拉取列表 (名称、持仓占比)
+    broadcaster.publish('funds', {'version': version})
+
+add_tick_listener(_on_tick)
+estimation_engine.add_listener(_on_holdings_changed)
@@ -0,0 +1,302 @@
+# fake_upstream.py
+# 本地假上游：模拟新浪行情 (hq.sinajs.cn)、腾讯行情 (qt.gtimg.cn) 与东方财富 (fundf10 / fundsuggest) 接口
+# 用于压测和性能分析，不依赖外网
+#
+# 用法:
+#   python fake_upstream.py --port 8001                                # 合成数据
+#   python fake_upstream.py --replay data/records --speed 10           # 回放 ALPHA_RECORD_DIR 录制的响应
+#   python fake_upstream.py --latency 80 --jitter 40 --error-rate 0.02
+#
+# 然后让应用指向它:
+#   ALPHA_UPSTREAM_URL=http://127.0.0.1:8001 python app.py
+
+import argparse
+import base64
+import glob
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+STOCK_NAMES = ['贵州茅台', '宁德时代', '招商银行', '中国平安', '五粮液', '隆基绿能', '比亚迪', '药明康德',
+               '美的集团', '紫金矿业', '长江电力', '迈瑞医疗', '立讯精密', '东方财富', '中芯国际', '万华化学']
+
+_SINA_LINE = re.compile(rb'hq_str_(\w+)="([^"]*)"')
+
+def _seed(key: str) -> int:
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16)
+
+class Synthesizer:
+    """确定性合成数据：同一代码每次得到相同的昨收和持仓，价格随时间做平滑随机游走"""
+
+    def __init__(self, holdings_per_fund: int = 10, report_date: str = '2024-09-30'):
+        self.holdings_per_fund = holdings_per_fund
+        self.report_date = report_date
+
+    def sina_line(self, sina_code: str, now: float) -> str:
+        s = _seed(sina_code)
+        rnd = random.Random(s)
+        prev = round(rnd.uniform(3, 300), 2)
+        # 两个不同周期的正弦叠加，幅度控制在 ±5% 以内
+        drift = 0.03 * math.sin(now / 600 + s % 97) + 0.02 * math.sin(now / 97 + s % 13)
+        price = round(prev * (1 + drift), 2)
+        t = time.localtime(now)
+        fields = [rnd.choice(STOCK_NAMES), f"{prev:.3f}", f"{prev:.3f}", f"{price:.3f}",
+                  f"{max(prev, price):.3f}", f"{min(prev, price):.3f}", f"{price:.3f}", f"{price:.3f}",
+                  str(rnd.randint(10**5, 10**8)), f"{rnd.uniform(10**6, 10**10):.3f}"]
+        fields += ['100', f"{price:.3f}"] * 10
+        fields += [time.strftime('%Y-%m-%d', t), time.strftime('%H:%M:%S', t), '00']
+        return f'var hq_str_{sina_code}="{",".join(fields)}";'
+
+    def tencent_line(self, market_code: str, now: float) -> str:
+        """与 sina_line 使用同一随机游走，两个数据源报价一致"""
+        sina = self.sina_line(market_code, now)
+        f = sina[sina.index('"') + 1:sina.rindex('"')].split(',')
+        price, prev = float(f[3]), float(f[2])
+        pct = (price - prev) / prev * 100 if prev else 0.0
+        fields = ['1', f[0], market_code[2:], f"{price:.2f}", f"{prev:.2f}", f"{float(f[1]):.2f}",
+                  str(int(f[8]) // 100)] + ['0'] * 23
+        fields += [f[30].replace('-', '') + f[31].replace(':', ''), f"{price - prev:.2f}", f"{pct:.2f}"]
+        return f'v_{market_code}="{"~".join(fields)}";'
+
+    def holdings(self, fund_code: str):
+        rnd = random.Random(_seed(fund_code))
+        weights = sorted((rnd.uniform(1, 10) for _ in range(self.holdings_per_fund)), reverse=True)
+        items = []
+        for w in weights:
+            n = rnd.randint(0, 4999)
+            code = f"{600000 + n:06d}" if n % 2 else f"{n:06d}"
+            items.append((code, rnd.choice(STOCK_NAMES), round(w, 2)))
+        return items
+
+    def fund_archives(self, fund_code: str, topline: int) -> str:
+        """仿照 FundArchivesDatas.aspx?type=jjcc 的返回，包含三个季度的表格"""
+        items = self.holdings(fund_code)[:topline]
+        y, m, _ = self.report_date.split('-')
+        dates = [self.report_date, f"{y}-06-30", f"{y}-03-31"]
+        boxes = []
+        for q, d in enumerate(dates):
+            rows = ''.join(
+                f"<tr><td>{i + 1}</td><td><a href='//quote.eastmoney.com/unify/r/1.{c}'>{c}</a></td>"
+                f"<td class='tol'><a href='//quote.eastmoney.com/unify/r/1.{c}'>{n}</a></td>"
+                f"<td class='tor'><span id='dq{c}'></span></td><td class='tor'><span id='zd{c}'></span></td>"
+                f"<td class='xglj'><a href='ccbdxq_{fund_code}_{c}.html'>变动详情</a></td>"
+                f"<td class='tor'>{max(w - q * 0.3, 0.1):.2f}%</td><td class='tor'>{(i + 1) * 123.45:.2f}</td>"
+                f"<td class='tor'>{(i + 1) * 9876.5:.2f}</td></tr>"
+                for i, (c, n, w) in enumerate(items))
+            boxes.append(
+                f"<div class='box'><div class='boxitem w790'><h4 class='t'><label class='left'>"
+                f"<a href='http://fund.eastmoney.com/{fund_code}.html'>基金{fund_code}</a>&nbsp;&nbsp;{d}股票投资明细</label>"
+                f"<label class='right lab2 xq505'>&nbsp;&nbsp;来源：定期报告&nbsp;&nbsp;截止至：<font class='px12'>{d}</font></label></h4>"
+                f"<div class='space0'></div><table class='w782 comm tzxq'><thead><tr><th class='first'>序号</th><th>股票代码</th>"
+                f"<th>股票名称</th><th class='tor'>最新价</th><th class='tor'>涨跌幅</th><th class='xglj'>相关资讯</th>"
+                f"<th class='tor'>占净值<br />比例</th><th class='tor'>持股数<br />（万股）</th><th class='tor'>持仓市值<br />（万元）</th>"
+                f"</tr></thead><tbody>{rows}</tbody></table></div></div>")
+        content = ''.join(boxes).replace('/', '\\/')
+        ary = ','.join(f"'{d}'" for d in dates)
+        return f'var apidata={{ content:"{content}",aryLastDate:[{ary}],curyear:{y}}};'
+
+    def fund_search(self, fund_code: str) -> str:
+        return json.dumps({'ErrCode': 0, 'Datas': [{'CODE': fund_code, 'NAME': f"合成基金{fund_code}"}]}, ensure_ascii=False)
+
+class Recording:
+    """
+    加载 http_client 录制的 JSONL
+    新浪行情按股票拆分成时间序列，东方财富接口按 (路径, 基金代码) 取最后一次响应
+    """
+
+    def __init__(self, path: str):
+        files = sorted(glob.glob(os.path.join(path, '*.jsonl'))) if os.path.isdir(path) else [path]
+        self.quotes = {}   # {sina_code: [(ts, line_bytes), ...]}
+        self.pages = {}    # {(path, code): (status, body)}
+        self.t0 = None
+        for fn in files:
+            with open(fn, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+        for series in self.quotes.values():
+            series.sort(key=lambda x: x[0])
+        print(f"[FakeUpstream] 回放: {len(self.quotes)} 只股票, {len(self.pages)} 个基金页面")
+
+    def _add(self, e):
+        body = base64.b64decode(e['body_b64'])
+        parts = urlsplit(e['url'])
+        if self.t0 is None or e['ts'] < self.t0:
+            self.t0 = e['ts']
+        if parts.path.startswith('/list='):
+            for m in _SINA_LINE.finditer(body):
+                self.quotes.setdefault(m.group(1).decode('ascii'), []).append((e['ts'], m.group(0) + b';'))
+        elif parts.path.startswith('/q='):
+            # 腾讯行情不回放，始终使用合成数据
+            return
+        else:
+            qs = parse_qs(parts.query)
+            code = (qs.get('code') or qs.get('key') or [''])[0]
+            self.pages[(parts.path, code)] = (e['status'], body)
+
+    def quote_at(self, sina_code: str, ts: float):
+        """取 ts 时刻 (录制时间轴) 之前最近的一条行情"""
+        series = self.quotes.get(sina_code)
+        if not series:
+            return None
+        lo, hi = 0, len(series)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if series[mid][0] <= ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return series[max(lo - 1, 0)][1]
+
+class FakeUpstream:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, empty_rate=0.0,
+                 recording: Recording = None, speed=1.0, synth: Synthesizer = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.empty_rate = empty_rate
+        self.recording = recording
+        self.speed = speed
+        self.synth = synth or Synthesizer()
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'errors': 0, 'empty': 0}
+
+    def replay_clock(self) -> float:
+        """把服务器运行时长按 speed 映射到录制时间轴"""
+        return self.recording.t0 + (time.time() - self.started) * self.speed
+
+    def sina(self, codes):
+        if self.recording:
+            ts = self.replay_clock()
+            lines = []
+            for c in codes:
+                b = self.recording.quote_at(c, ts)
+                lines.append(b if b is not None else self.synth.sina_line(c, time.time()).encode('gbk'))
+            return b'\n'.join(lines) + b'\n'
+        now = time.time()
+        return ('\n'.join(self.synth.sina_line(c, now) for c in codes) + '\n').encode('gbk')
+
+    def tencent(self, codes):
+        now = time.time()
+        return ('\n'.join(self.synth.tencent_line(c, now) for c in codes) + '\n').encode('gbk')
+
+    def page(self, path, code, build):
+        if self.recording and (path, code) in self.recording.pages:
+            return self.recording.pages[(path, code)]
+        return 200, build().encode('utf-8')
+
+    def make_handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def _send(self, status, body: bytes, ctype):
+                self.send_response(status)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                with upstream.lock:
+                    upstream.counters['requests'] += 1
+                delay = upstream.latency_ms + random.uniform(-upstream.jitter_ms, upstream.jitter_ms)
+                if delay > 0:
+                    time.sleep(delay / 1000.0)
+                if random.random() < upstream.error_rate:
+                    with upstream.lock:
+                        upstream.counters['errors'] += 1
+                    return self._send(503, b'Service Unavailable', 'text/plain')
+
+                parts = urlsplit(self.path)
+                qs = parse_qs(parts.query)
+                path = parts.path
+
+                if path.startswith('/list='):
+                    if random.random() < upstream.empty_rate:
+                        # 新浪限流时常见的表现：200 但内容为空
+                        with upstream.lock:
+                            upstream.counters['empty'] += 1
+                        return self._send(200, b'', 'application/javascript; charset=GBK')
+                    codes = [c for c in path[len('/list='):].split(',') if c]
+                    return self._send(200, upstream.sina(codes), 'application/javascript; charset=GBK')
+
+                if path.startswith('/q='):
+                    codes = [c for c in path[len('/q='):].split(',') if c]
+                    return self._send(200, upstream.tencent(codes), 'text/html; charset=GBK')
+
+                if path == '/FundArchivesDatas.aspx':
+                    code = qs.get('code', [''])[0]
+                    topline = int(qs.get('topline', ['10'])[0] or 10)
+                    status, body = upstream.page(path, code, lambda: upstream.synth.fund_archives(code, topline))
+                    return self._send(status, body, 'application/javascript; charset=utf-8')
+
+                if path == '/FundSearch/api/FundSearchAPI.ashx':
+                    code = qs.get('key', [''])[0]
+                    status, body = upstream.page(path, code, lambda: upstream.synth.fund_search(code))
+                    return self._send(status, body, 'application/json; charset=utf-8')
+
+                m = re.match(r'^/ccmx_(\d{6})\.html$', path)
+                if m:
+                    code = m.group(1)
+                    status, body = upstream.page(path, '', lambda: (
+                        f"<html><body><div class='fundDetailTit'><div><h1>合成基金{code}({code})</h1></div></div></body></html>"))
+                    return self._send(status, body, 'text/html; charset=utf-8')
+
+                if path == '/__stats':
+                    with upstream.lock:
+                        body = json.dumps(upstream.counters).encode('utf-8')
+                    return self._send(200, body, 'application/json')
+
+                self._send(404, b'Not Found', 'text/plain')
+
+        return Handler
+
+def serve(host='127.0.0.1', port=8001, **kwargs) -> ThreadingHTTPServer:
+    """启动服务并返回 server 对象 (调用方负责 serve_forever / shutdown)"""
+    upstream = FakeUpstream(**kwargs)
+    server = ThreadingHTTPServer((host, port), upstream.make_handler())
+    server.daemon_threads = True
+    server.upstream = upstream
+    return server
+
+def main():
+    ap = argparse.ArgumentParser(description='本地假上游 (新浪/腾讯行情、东方财富基金持仓)')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8001)
+    ap.add_argument('--replay', help='录制文件或目录 (ALPHA_RECORD_DIR 的输出)')
+    ap.add_argument('--speed', type=float, default=1.0, help='回放倍速')
+    ap.add_argument('--latency', type=float, default=0.0, help='基础延迟 (毫秒)')
+    ap.add_argument('--jitter', type=float, default=0.0, help='延迟抖动 (± 毫秒)')
+    ap.add_argument('--error-rate', type=float, default=0.0, help='返回 503 的概率')
+    ap.add_argument('--empty-rate', type=float, default=0.0, help='行情接口返回空内容的概率')
+    ap.add_argument('--holdings', type=int, default=10, help='合成数据中每个基金的持仓数量')
+    args = ap.parse_args()
+
+    server = serve(
+        args.host, args.port,
+        latency_ms=args.latency, jitter_ms=args.jitter,
+        error_rate=args.error_rate, empty_rate=args.empty_rate,
+        recording=Recording(args.replay) if args.replay else None,
+        speed=args.speed, synth=Synthesizer(holdings_per_fund=args.holdings),
+    )
+    print(f"[FakeUpstream] 监听 http://{args.host}:{args.port}  (ALPHA_UPSTREAM_URL=http://{args.host}:{args.port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,19 @@
 # fetcher.py
 # 数据抓取模块：负责从网络获取基金持仓和股票行情
 
-import requests
 from lxml import html
+import os
 import time
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
 from typing import List, Dict, Optional
+import http_client
+from http_client import http_get
+from quote_parser import Quote
+from holdings_parser import parse_holdings, count_holdings
+from quote_providers import quote_router
+from request_control import backoff_delay
 
 class FundFetcher:
     """基金数据抓取"""
@@ -17,19 +24,23 @@ class FundFetcher:
     }
     # 强制不使用系统代理，避免用户电脑上有残留的代理设置导致连接 127.0.0.1 失败
     PROXIES = {"http": None, "https": None}
+    # 持仓接口的 topline：默认前十大重仓；完整持仓时取足够大的值，半年报/年报可能有数百只
+    TOP_LINE = 10
+    FULL_TOP_LINE = 2000
 
     @staticmethod
-    def get_fund_details(fund_code: str) -> Optional[Dict]:
+    def get_fund_details(fund_code: str, full: bool = False) -> Optional[Dict]:
         """
         获取基金详情（名称、重仓股）
         使用 PC 端接口 FundArchivesDatas.aspx
+        :param full: True 时获取最新报告期披露的全部持仓，否则只取前十大
         """
         print(f"\n[FundFetcher] 开始获取基金详情: {fund_code}")
         
         # 1. 尝试 PC Web API 获取持仓
         data = None
         try:
-            data = FundFetcher._fetch_from_pc_api(fund_code)
+            data = FundFetcher._fetch_from_pc_api(fund_code, full)
             if data and data.get('holdings'):
                 print(f"[FundFetcher] API (PC) 获取持仓成功: {len(data['holdings'])} 只股票")
         except Exception as e:
@@ -59,10 +70,10 @@ class FundFetcher:
         """
         通过搜索接口获取准确的基金中文名称
         """
-        url = "http://fundsuggest.eastmoney.com/FundSearch/api/FundSearchAPI.ashx"
+        url = f"{http_client.FUNDSUGGEST_URL}/FundSearch/api/FundSearchAPI.ashx"
         params = {'m': '1', 'key': fund_code}
         try:
-            resp = requests.get(url, params=params, headers=FundFetcher.HEADERS, proxies=FundFetcher.PROXIES, timeout=5)
+            resp = http_get(url, params=params, headers=FundFetcher.HEADERS, proxies=FundFetcher.PROXIES, timeout=5)
             if resp.status_code == 200:
                 # 返回格式通常是 JSON: {"Datas": [{"CODE": "...", "NAME": "...", ...}], ...}
                 info = resp.json()
@@ -72,17 +83,65 @@ class FundFetcher:
             print(f"[FundFetcher] 获取名称失败: {e}")
         return None
 
+    # 报告期：优先取 aryLastDate 的第一项，没有时取第一个表格标题里的“截止至”日期
+    _REPORT_DATE_RE = re.compile(r"aryLastDate:\s*\[\s*['\"]?(\d{4}-\d{2}-\d{2})")
+    _REPORT_DATE_FALLBACK_RE = re.compile(r"截止至：\s*<font[^>]*>(\d{4}-\d{2}-\d{2})")
+
+    @staticmethod
+    def extract_report_date(text: str) -> Optional[str]:
+        """从 FundArchivesDatas.aspx 响应中提取最新报告期 (YYYY-MM-DD)，不解析 HTML"""
+        m = FundFetcher._REPORT_DATE_RE.search(text)
+        if not m:
+            m = FundFetcher._REPORT_DATE_FALLBACK_RE.search(text)
+        return m.group(1) if m else None
+
     @staticmethod
-    def _fetch_from_pc_api(fund_code: str) -> Optional[Dict]:
+    def check_holdings(fund_code: str, known_report_date: Optional[str], known_count: Optional[int] = None,
+                       full: bool = False) -> Optional[Dict]:
+        """
+        条件刷新：报告期与 known_report_date 相同、且持仓行数与 known_count 相同时不解析持仓
+        (同一报告期季报只披露前十大，半年报/年报发布后才有全部持仓，所以还要比较行数；
+         切换完整持仓选项后行数也会变化，从而触发重新解析)
+        :return: 请求失败返回 None；未变化返回 {code, report_date, changed: False}；
+                 变化返回 _fetch_from_pc_api 的结果并附带 changed: True
+        """
+        text = FundFetcher._request_pc_api(fund_code, full)
+        if text is None:
+            return None
+        report_date = FundFetcher.extract_report_date(text)
+        if report_date and report_date == known_report_date:
+            if known_count is None or FundFetcher._visible_count(text, full) == known_count:
+                return {'code': fund_code, 'report_date': report_date, 'changed': False}
+        data = FundFetcher._parse_pc_api(fund_code, text, full)
+        if data:
+            data['changed'] = True
+        return data
+
+    @staticmethod
+    def _visible_count(text: str, full: bool) -> int:
+        """按当前选项解析时会得到的持仓行数"""
+        n = count_holdings(text)
+        return n if full else min(n, FundFetcher.TOP_LINE)
+
+    @staticmethod
+    def _fetch_from_pc_api(fund_code: str, full: bool = False) -> Optional[Dict]:
         """
         接口: http://fundf10.eastmoney.com/FundArchivesDatas.aspx
-        返回 JS: var apidata = { content: "<html>...", ... }
+        返回 JS: var apidata = { content: "<html>...", aryLastDate: [...], ... }
         """
-        url = "http://fundf10.eastmoney.com/FundArchivesDatas.aspx"
+        text = FundFetcher._request_pc_api(fund_code, full)
+        if text is None:
+            return None
+        return FundFetcher._parse_pc_api(fund_code, text, full)
+
+    @staticmethod
+    def _request_pc_api(fund_code: str, full: bool = False) -> Optional[str]:
+        """请求持仓接口，返回响应文本，非 200 返回 None"""
+        url = f"{http_client.EASTMONEY_F10_URL}/FundArchivesDatas.aspx"
         params = {
             'type': 'jjcc',   # 基金持仓
             'code': fund_code,
-            'topline': '10',  # 前10
+            'topline': str(FundFetcher.FULL_TOP_LINE if full else FundFetcher.TOP_LINE),
             'year': '',
             'month': '',
             'rt': time.time()
@@ -90,91 +149,22 @@ class FundFetcher:
         
         print(f"  [API REQ] GET {url}")
         
-        resp = requests.get(url, params=params, headers=FundFetcher.HEADERS, proxies=FundFetcher.PROXIES, timeout=8)
+        resp = http_get(url, params=params, headers=FundFetcher.HEADERS, proxies=FundFetcher.PROXIES, timeout=8)
         resp.encoding = 'utf-8'
         
         print(f"  [API RES] Status: {resp.status_code}")
         
         if resp.status_code != 200: return None
-        
-        content = ""
-        try:
-            match = re.search(r'content:"(.*?)",aryLastDate', resp.text, re.DOTALL)
-            if match:
-                content = match.group(1)
-            else:
-                match = re.search(r'content:"(.*)"', resp.text, re.DOTALL)
-                if match:
-                    content = match.group(1)
-        except Exception as e:
-            print(f"  [API RES] 正则提取 content 失败: {e}")
-            return None
+        return resp.text
 
-        if not content:
+    @staticmethod
+    def _parse_pc_api(fund_code: str, text: str, full: bool = False) -> Optional[Dict]:
+        """解析持仓接口的响应文本 (只解析最新报告期的表格)"""
+        if 'content:"' not in text:
             print("  [API RES] 未找到 content 内容")
             return None
-        
-        # 打印一下提取到的HTML片段头部，方便确认
-        print(f"  [API RES] Content HTML Head: {content[:100]}...")
-
-        html_content = content.replace(r'\"', '"').replace(r'\/', '/')
-        tree = html.fromstring(html_content)
-        
-        holdings = []
-        tables = tree.xpath('//table')
-        
-        print(f"  [API RES] 找到表格数量: {len(tables)}")
-
-        for tbl in tables:
-            # 尝试通过表头动态定位列索引
-            # 通常第一行是表头
-            rows = tbl.xpath('.//tr')
-            if not rows: continue
-            
-            headers = [ ''.join(col.itertext()).strip() for col in rows[0].xpath('.//td|.//th') ]
-            print(f"  [API RES] 表格头: {headers}")
-            
-            # 定位关键列索引
-            idx_code = -1
-            idx_name = -1
-            idx_ratio = -1
-            
-            for i, h in enumerate(headers):
-                if '代码' in h: idx_code = i
-                elif '名称' in h: idx_name = i
-                elif '占比' in h or '比例' in h: idx_ratio = i
-            
-            if idx_code != -1 and idx_name != -1 and idx_ratio != -1:
-                print(f"  [API RES] 命中关键列索引: 代码={idx_code}, 名称={idx_name}, 占比={idx_ratio}")
-                
-                # 遍历数据行
-                # 从第二行开始
-                for row in rows[1:]:
-                    cols = row.xpath('.//td')
-                    if len(cols) <= max(idx_code, idx_name, idx_ratio):
-                        continue
-                        
-                    c_code = ''.join(cols[idx_code].itertext()).strip()
-                    c_name = ''.join(cols[idx_name].itertext()).strip()
-                    c_ratio_str = ''.join(cols[idx_ratio].itertext()).strip().replace('%', '')
-                    
-                    if c_code and c_ratio_str:
-                        try:
-                            ratio = float(c_ratio_str) / 100.0
-                            holdings.append({
-                                'code': c_code,
-                                'name': c_name,
-                                'ratio': ratio
-                            })
-                        except: continue
-                
-                if holdings: 
-                    # 只取前10
-                    holdings = holdings[:10]
-                    break
-            else:
-                print(f"  [API RES] 未在表头中找到所有关键列")
 
+        holdings = parse_holdings(text, limit=None if full else FundFetcher.TOP_LINE)
         print(f"  [API RES] 解析到持仓: {len(holdings)} 只股票")
         
         # 为了简单，我们先用占位符
@@ -183,16 +173,17 @@ class FundFetcher:
         return {
             'code': fund_code,
             'name': fund_name,
-            'holdings': holdings
+            'holdings': holdings,
+            'report_date': FundFetcher.extract_report_date(text)
         }
 
     @staticmethod
     def _fetch_from_web_fallback(fund_code: str) -> Optional[Dict]:
         """备用：直接抓取HTML（可能不含动态数据）"""
-        url = f"http://fundf10.eastmoney.com/ccmx_{fund_code}.html"
+        url = f"{http_client.EASTMONEY_F10_URL}/ccmx_{fund_code}.html"
         print(f"  [WEB REQ] GET {url}")
         try:
-            resp = requests.get(url, headers=FundFetcher.HEADERS, proxies=FundFetcher.PROXIES, timeout=8)
+            resp = http_get(url, headers=FundFetcher.HEADERS, proxies=FundFetcher.PROXIES, timeout=8)
             resp.encoding = 'utf-8'
             tree = html.fromstring(resp.text)
             
@@ -211,91 +202,98 @@ class FundFetcher:
 class StockFetcher:
     """股票行情抓取"""
 
+    # 并发抓取的分片数 (线程池大小)
+    MAX_WORKERS = int(os.environ.get('ALPHA_FETCH_WORKERS', '8'))
+    # 一次批量请求 (一个 tick) 的总时间预算 (秒)，失败分片在预算内重试
+    TICK_BUDGET = float(os.environ.get('ALPHA_TICK_BUDGET', '20'))
+
+    _executor = None
+
     @staticmethod
-    def get_batch_prices(stock_codes: List[str]) -> Dict[str, Dict]:
+    def _get_executor() -> ThreadPoolExecutor:
+        if StockFetcher._executor is None:
+            StockFetcher._executor = ThreadPoolExecutor(
+                max_workers=StockFetcher.MAX_WORKERS,
+                thread_name_prefix='stock-fetch'
+            )
+        return StockFetcher._executor
+
+    @staticmethod
+    def set_concurrency(max_workers: int):
+        """调整并发数，旧线程池在当前任务结束后回收"""
+        max_workers = max(1, int(max_workers))
+        if max_workers == StockFetcher.MAX_WORKERS:
+            return
+        old = StockFetcher._executor
+        StockFetcher.MAX_WORKERS = max_workers
+        StockFetcher._executor = None
+        if old:
+            old.shutdown(wait=False)
+
+    @staticmethod
+    def get_batch_prices(stock_codes: List[str]) -> Dict[str, Quote]:
         """
         批量获取股票实时价格
+        各分片并发请求，总耗时取决于最慢的分片
+        每个分片由 quote_router 选择主数据源并对慢请求做对冲
+        失败的分片在本次 tick 的时间预算 (TICK_BUDGET) 内退避重试，超出预算才放弃
         """
         print(f"\n[StockFetcher] 批量请求股票行情, 数量: {len(stock_codes)}")
         results = {}
         if not stock_codes: return results
         
         unique_codes = list(set(stock_codes))
-        
-        CHUNK_SIZE = 50
-        for i in range(0, len(unique_codes), CHUNK_SIZE):
-            chunk = unique_codes[i:i+CHUNK_SIZE]
-            res = StockFetcher._fetch_chunk(chunk)
-            results.update(res)
-            time.sleep(0.1) 
-            
+        # 分片大小跟随当前主数据源的控制器
+        size = quote_router.primary.controller.chunk_size
+        chunks = [unique_codes[i:i+size] for i in range(0, len(unique_codes), size)]
+
+        deadline = time.monotonic() + StockFetcher.TICK_BUDGET
+        executor = StockFetcher._get_executor()
+        futures = [executor.submit(StockFetcher._fetch_chunk_with_retry, chunk, deadline) for chunk in chunks]
+
+        failed = 0
+        try:
+            # 多等 1 秒，让卡在最后一次请求上的分片有机会返回
+            for fut in as_completed(futures, timeout=StockFetcher.TICK_BUDGET + 1):
+                res = fut.result()
+                if res is None:
+                    failed += 1
+                else:
+                    results.update(res)
+        except FuturesTimeout:
+            for fut in futures:
+                fut.cancel()
+            failed = sum(1 for fut in futures if not fut.done())
+
+        if failed:
+            print(f"  [StockFetcher] {failed}/{len(chunks)} 个分片在时间预算内未成功，返回部分结果")
+        print(f"  [StockFetcher] 分片: {len(chunks)} x {size}, 获取到行情: {len(results)}")
         return results
 
     @staticmethod
-    def _fetch_chunk(codes: List[str]) -> Dict[str, Dict]:
-        sina_codes = []
-        map_sina_to_raw = {} 
-        
-        for c in codes:
-            prefix = 'sz'
-            if c.startswith('6'): prefix = 'sh'
-            elif c.startswith('8') or c.startswith('4'): prefix = 'bj'
-            
-            sc = f"{prefix}{c}"
-            sina_codes.append(sc)
-            map_sina_to_raw[sc] = c 
-            
-        url = f"http://hq.sinajs.cn/list={','.join(sina_codes)}"
-        headers = {'Referer': 'http://finance.sina.com.cn'}
-        
-        print(f"  [STOCK REQ] GET {url}")
-        
-        try:
-            # 同样禁用代理
-            resp = requests.get(url, headers=headers, proxies={"http": None, "https": None}, timeout=10)
-            resp.encoding = 'gbk' 
-            
-            print(f"  [STOCK RES] Status: {resp.status_code}")
-            # print(f"  [STOCK RES] Body Sample: {resp.text[:100]}...")
-            
-            data_map = {}
-            lines = resp.text.strip().split('\n')
-            for line in lines:
-                if '="' not in line: continue
-                left, right = line.split('="')
-                var_name = left.strip()
-                val_str = right.strip().strip('";')
-                
-                sina_code = var_name.split('hq_str_')[-1]
-                
-                if not val_str: continue
-                fields = val_str.split(',')
-                if len(fields) < 4: continue
-                
-                try:
-                    name = fields[0]
-                    prev_close = float(fields[2])
-                    price = float(fields[3])
-                    
-                    if price == 0 and prev_close > 0:
-                        price = prev_close
-                    
-                    pct = 0.0
-                    if prev_close > 0:
-                        pct = (price - prev_close) / prev_close * 100
-                    
-                    raw_code = map_sina_to_raw.get(sina_code)
-                    if raw_code:
-                        data_map[raw_code] = {
-                            'name': name,
-                            'price': price,
-                            'prev_close': prev_close,
-                            'pct': round(pct, 2)
-                        }
-                except:
-                    continue
-            return data_map
-            
-        except Exception as e:
-            print(f"  [StockFetcher] Batch fetch error: {e}")
-            return {}
+    def _fetch_chunk_with_retry(codes: List[str], deadline: float) -> Optional[Dict[str, Quote]]:
+        """
+        请求一个分片，失败 (含全部数据源熔断/返回空) 后退避重试
+        :return: 成功返回行情，超出 deadline 仍失败返回 None
+        """
+        attempt = 0
+        while True:
+            try:
+                return StockFetcher._fetch_chunk(codes, deadline)
+            except Exception as e:
+                print(f"  [StockFetcher] 分片请求失败 (第 {attempt + 1} 次): {e}")
+
+            delay = backoff_delay(attempt)
+            if time.monotonic() + delay >= deadline:
+                return None
+            time.sleep(delay)
+            attempt += 1
+            quote_router.primary.controller.on_retry()
+
+    @staticmethod
+    def _fetch_chunk(codes: List[str], deadline: float) -> Dict[str, Quote]:
+        """
+        请求一个分片 (对冲请求)；全部数据源都失败时抛出异常，由调用方决定是否重试
+        单次请求的超时为 quote_providers.REQUEST_TIMEOUT (ALPHA_CHUNK_TIMEOUT)，且不超过 deadline
+        """
+        return quote_router.fetch(codes, deadline)
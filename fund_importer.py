@@ -0,0 +1,142 @@
+# fund_importer.py
+# 批量导入基金：并发抓取持仓，经写库线程单事务批量写入，进度通过任务 ID 轮询
+
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import select
+
+from models import get_session, Fund
+from fetcher import FundFetcher
+from holdings_store import bulk_save_funds, batched
+from holdings_service import full_portfolio_enabled
+from db_writer import db_writer
+from log_utils import log
+
+# 同时抓取的基金数量 (每个基金最多 3 个串行请求)
+MAX_PARALLEL = 8
+# 内存中保留的已结束任务数
+MAX_FINISHED_JOBS = 20
+
+_CODE_RE = re.compile(r'(?<!\d)\d{6}(?!\d)')
+
+def parse_codes(text: str) -> List[str]:
+    """从任意文本 (逗号/空格/换行分隔、CSV) 中提取 6 位代码，保持顺序去重"""
+    return list(dict.fromkeys(_CODE_RE.findall(text or '')))
+
+class ImportJob:
+    def __init__(self, codes: List[str]):
+        self.id = uuid.uuid4().hex[:12]
+        self.codes = codes
+        self.status = 'pending'     # pending / fetching / saving / done / failed
+        self.done = 0
+        self.added = []             # [code, ...]
+        self.skipped = []           # 已存在的基金
+        self.failed = {}            # {code: 原因}
+        self.message = ''
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'total': len(self.codes),
+                'done': self.done,
+                'added': list(self.added),
+                'skipped': list(self.skipped),
+                'failed': dict(self.failed),
+                'message': self.message,
+                'created_at': self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                'finished_at': self.finished_at.strftime("%Y-%m-%d %H:%M:%S") if self.finished_at else None,
+            }
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def start_import(codes: List[str]) -> ImportJob:
+    """创建任务并在后台线程执行"""
+    job = ImportJob(codes)
+    with _jobs_lock:
+        finished = [j for j in _jobs.values() if j.finished_at]
+        for j in sorted(finished, key=lambda j: j.finished_at)[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[j.id]
+        _jobs[job.id] = job
+    threading.Thread(target=_run, args=(job,), name=f"fund-import-{job.id}", daemon=True).start()
+    return job
+
+def get_job(job_id: str) -> Optional[ImportJob]:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def _run(job: ImportJob):
+    t0 = time.time()
+    session = get_session()
+    try:
+        # 1. 过滤已存在的基金 (批量 IN 查询)
+        existing = set()
+        for batch in batched(job.codes):
+            existing.update(session.execute(select(Fund.code).where(Fund.code.in_(batch))).scalars())
+        todo = [c for c in job.codes if c not in existing]
+        with job.lock:
+            job.skipped = [c for c in job.codes if c in existing]
+            job.done = len(job.skipped)
+            job.status = 'fetching'
+
+        # 2. 并发抓取持仓
+        full = full_portfolio_enabled(session)
+        results = []
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL, thread_name_prefix='fund-import') as pool:
+            futures = {pool.submit(FundFetcher.get_fund_details, code, full): code for code in todo}
+            for fut in as_completed(futures):
+                code = futures[fut]
+                try:
+                    data = fut.result()
+                    error = None if data else '无法获取基金信息'
+                except Exception as e:
+                    data, error = None, str(e)
+                with job.lock:
+                    job.done += 1
+                    if error:
+                        job.failed[code] = error
+                    else:
+                        results.append(data)
+
+        # 3. 交给写库线程，单事务批量写入
+        with job.lock:
+            job.status = 'saving'
+
+        def save(session):
+            # 抓取期间可能有基金被单独添加，写入前再过滤一次，避免唯一约束冲突导致整批回滚
+            late = set()
+            for batch in batched([d['code'] for d in results]):
+                late.update(session.execute(select(Fund.code).where(Fund.code.in_(batch))).scalars())
+            fresh = [d for d in results if d['code'] not in late]
+            if fresh:
+                bulk_save_funds(session, fresh)
+            return fresh, late
+        if results:
+            results, late = db_writer.run(save, name='fund_import')
+            if late:
+                with job.lock:
+                    job.skipped.extend(sorted(late))
+        with job.lock:
+            job.added = [d['code'] for d in results]
+            job.status = 'done'
+            job.message = f"新增 {len(results)} 个，已存在 {len(job.skipped)} 个，失败 {len(job.failed)} 个"
+        log(f"批量导入完成 ({time.time() - t0:.1f}s): {job.message}")
+    except Exception as e:
+        with job.lock:
+            job.status = 'failed'
+            job.message = str(e)
+        log(f"批量导入失败: {e}")
+    finally:
+        session.close()
+        with job.lock:
+            job.finished_at = datetime.now()
@@ -0,0 +1,197 @@
+# fund_snapshot.py
+# 基金列表快照：内存中保存最新估值、更新时间、持仓占比，序列化好的响应体随版本号一起发布
+# tick 提交后在原快照基础上生成新版本 (不查库)；基金/持仓变化后标记过期，下一次请求用一条查询重建
+# /api/fund/list 按版本号生成 ETag，未变化的轮询只比较请求头，返回 304
+# 分页/排序/筛选在快照上完成 (各排序顺序按版本缓存)，不查库
+
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import Fund, Holding, FundHistory, FundDaily, TickLog
+from trading_calendar import MARKET_CLOSE
+from history_store import add_tick_listener
+from estimation_engine import estimation_engine
+
+# 进程标识：重启后版本号从头开始，ETag 不能与重启前的混淆
+_BOOT = format(int(time.time()), 'x')
+
+# /api/fund/list?sort=... 可用的排序字段；相同值按基金 ID 排列
+SORT_KEYS = {
+    'id': lambda e: e.id,
+    'code': lambda e: e.code,
+    'name': lambda e: e.name,
+    'est_change': lambda e: e.est_change,
+    'abs_change': lambda e: abs(e.est_change),
+    'total_ratio': lambda e: e.total_ratio,
+    'update_time': lambda e: e.timestamp or datetime.min,
+}
+# trend 筛选：涨 / 跌 / 平
+TRENDS = {
+    'up': lambda e: e.est_change > 0,
+    'down': lambda e: e.est_change < 0,
+    'flat': lambda e: e.est_change == 0,
+}
+MAX_PAGE_SIZE = 500
+
+@dataclass(frozen=True)
+class FundEntry:
+    id: int
+    code: str
+    name: str
+    est_change: float
+    timestamp: Optional[datetime]   # 估值最近一次确认的时间 (有更新的 tick 时前移)
+    total_ratio: float
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'code': self.code,
+            'name': self.name,
+            'est_change': self.est_change,
+            'update_time': self.timestamp.strftime("%H:%M") if self.timestamp else "",
+            'total_ratio': self.total_ratio,
+        }
+
+@dataclass(frozen=True)
+class ListQuery:
+    """/api/fund/list 的分页、排序、筛选参数"""
+    sort: str = 'id'
+    desc: bool = False
+    keyword: str = ''           # 代码或名称包含 (不区分大小写)
+    trend: Optional[str] = None
+    page: int = 1               # 从 1 开始
+    page_size: int = 50
+
+@dataclass(frozen=True)
+class FundListSnapshot:
+    """发布后不再修改；新数据总是生成新的快照"""
+    version: int
+    entries: Tuple[FundEntry, ...]
+    body: bytes     # 序列化好的 /api/fund/list 响应 (全部基金，按 ID)
+    _orders: Dict[Tuple[str, bool], Tuple[FundEntry, ...]] = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def etag(self) -> str:
+        """ETag 值 (不含引号)；同一版本下同样的参数总是得到同样的内容"""
+        return f"{_BOOT}-{self.version}"
+
+    def ordered(self, sort: str, desc: bool) -> Tuple[FundEntry, ...]:
+        """按字段排序后的全部列表项 (每个版本每种顺序只排一次)"""
+        key = (sort, desc)
+        order = self._orders.get(key)
+        if order is None:
+            # entries 按 ID 排列，排序是稳定的，相同值保持 ID 顺序
+            order = tuple(sorted(self.entries, key=SORT_KEYS[sort], reverse=desc))
+            self._orders[key] = order
+        return order
+
+    def page_body(self, query: ListQuery) -> bytes:
+        """一页列表的响应体，total 为筛选后的基金数"""
+        entries = self.ordered(query.sort, query.desc)
+        if query.keyword:
+            keyword = query.keyword.lower()
+            entries = [e for e in entries if keyword in e.code or keyword in e.name.lower()]
+        if query.trend:
+            entries = [e for e in entries if TRENDS[query.trend](e)]
+        start = (query.page - 1) * query.page_size
+        return json.dumps({'success': True, 'data': [e.to_dict() for e in entries[start:start + query.page_size]],
+                           'total': len(entries), 'page': query.page, 'page_size': query.page_size},
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _latest(model, key, column):
+    """某基金在 model 中最新一条记录的 column (按主键 (fund_id, key) 倒序取一条，关联子查询)"""
+    return select(column).where(model.fund_id == Fund.id).order_by(key.desc()).limit(1).scalar_subquery()
+
+def load_entries(session: Session) -> List[FundEntry]:
+    """
+    从库里读出所有基金的列表项：一条查询带出最新估值及时间、最近一个交易日的收盘估值、持仓占比合计和最新 tick
+    最新记录用关联子查询按主键逆序取一条 (每个基金一次索引查找)，比全表分组/窗口函数快得多
+    """
+    ratios = select(Holding.fund_id, func.sum(Holding.ratio).label('total')).group_by(Holding.fund_id).subquery()
+    rows = session.execute(
+        select(Fund.id, Fund.code, Fund.name,
+               _latest(FundHistory, FundHistory.timestamp, FundHistory.estimated_change),
+               _latest(FundHistory, FundHistory.timestamp, FundHistory.timestamp),
+               _latest(FundDaily, FundDaily.trade_date, FundDaily.estimated_change),
+               _latest(FundDaily, FundDaily.trade_date, FundDaily.trade_date),
+               ratios.c.total,
+               select(func.max(TickLog.timestamp)).scalar_subquery())
+        .outerjoin(ratios, ratios.c.fund_id == Fund.id)
+        .order_by(Fund.id)).all()
+
+    entries = []
+    for fid, code, name, change, ts, close, close_day, total, last_tick in rows:
+        if ts is None and close_day is not None:
+            # 已归档的日期不在库里：当天还没有分时的基金显示最近一个交易日的收盘估值
+            change, ts = close, datetime.combine(date.fromisoformat(close_day), MARKET_CLOSE)
+        # 估值只在变化时存储，最新一条记录之后的 tick 仍然代表“当前值”已确认
+        if ts and last_tick and last_tick.date() == ts.date() and last_tick > ts:
+            ts = last_tick
+        entries.append(FundEntry(fid, code, name, change if change is not None else 0.0, ts, total or 0))
+    return entries
+
+class FundListCache:
+    """
+    - get(session)：当前快照 (过期时先重建)
+    - apply_tick(时间, 变化, 参与估值的基金)：tick 提交后发布新版本
+    - invalidate()：基金/持仓变化后标记过期
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot: Optional[FundListSnapshot] = None
+        self._version = 0
+        self._stale = True
+
+    def _publish(self, entries) -> FundListSnapshot:
+        self._version += 1
+        body = json.dumps({'success': True, 'data': [e.to_dict() for e in entries]},
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self._snapshot = FundListSnapshot(self._version, tuple(entries), body)
+        return self._snapshot
+
+    def current(self) -> Optional[FundListSnapshot]:
+        """不重建、不查库；过期或尚未建立时返回 None"""
+        snapshot = self._snapshot
+        return None if self._stale else snapshot
+
+    def get(self, session: Session) -> FundListSnapshot:
+        snapshot = self.current()
+        if snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._stale or self._snapshot is None:
+                # 先清标记再读库：读库期间的变化会再次标记，下次照样重建
+                self._stale = False
+                self._publish(load_entries(session))
+            return self._snapshot
+
+    def invalidate(self, *_):
+        self._stale = True
+
+    def apply_tick(self, timestamp: datetime, changes: List[Tuple[int, float]], evaluated: Optional[Set[int]] = None):
+        """:param evaluated: 这个 tick 计算过的基金，None 表示全部；没有计算过的基金保持原来的更新时间"""
+        with self._lock:
+            if self._stale or self._snapshot is None:
+                return
+            changed = dict(changes)
+            entries = []
+            for e in self._snapshot.entries:
+                if e.id in changed and (e.timestamp is None or timestamp >= e.timestamp):
+                    e = FundEntry(e.id, e.code, e.name, changed[e.id], timestamp, e.total_ratio)
+                elif (e.id not in changed and (evaluated is None or e.id in evaluated)
+                      and e.timestamp and e.timestamp.date() == timestamp.date() and timestamp > e.timestamp):
+                    e = FundEntry(e.id, e.code, e.name, e.est_change, timestamp, e.total_ratio)
+                entries.append(e)
+            self._publish(entries)
+
+fund_list_cache = FundListCache()
+
+add_tick_listener(fund_list_cache.apply_tick)
+estimation_engine.add_listener(fund_list_cache.invalidate)
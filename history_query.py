@@ -0,0 +1,323 @@
+# history_query.py
+# 基金历史查询 (/api/fund/history)：按日期范围读取估值序列和持仓股票价格
+# - 每天取精度最高的来源：原始分时 (库) -> 列式归档 -> 5 分钟线 -> 日线；每个来源对整个范围只查一次
+# - 估值只存变化，按当天的时间轴 (tick_log / 归档 ticks / 当天所有 5 分钟线时刻) 向前填充，从当天第一条记录开始
+# - 点数超过 max_points 时用 LTTB 降采样，持仓股票价格只为保留下来的点计算 (向前填充，不跨日)
+
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import DateTime, func, literal, select, union_all
+from sqlalchemy.orm import Session, aliased
+
+from models import (Holding, Stock, FundHistory, StockPrice, TickLog, FundHistory5m, StockPrice5m,
+                    FundDaily, StockDaily)
+from trading_calendar import MARKET_CLOSE
+from downsample import lttb
+import archive
+
+# 精度从高到低；多个来源混合时整体精度取最低的
+RESOLUTIONS = ('tick', '5m', '1d')
+_RESOLUTION_OF = {'raw': 'tick', 'archive': 'tick', '5m': '5m', '1d': '1d'}
+TS_DTYPE = np.dtype('M8[s]')
+# max_points 的下限 (LTTB 至少保留首尾和一个中间点)
+MIN_POINTS = 3
+# 按时间点查 5 分钟线时每条语句的时间点数 (SQLite 复合查询默认最多 500 项)
+BAR_LOOKUP_CHUNK = 400
+# 超过这么多个时间点时改为整段读取 5 分钟线
+BAR_LOOKUP_LIMIT = 2000
+
+@dataclass
+class HoldingInfo:
+    stock_id: int
+    code: str
+    name: str
+    ratio: float
+
+@dataclass
+class FundHistoryResult:
+    times: np.ndarray       # datetime64[s]
+    values: np.ndarray
+    holdings: List[HoldingInfo]     # 按占比降序
+    price: np.ndarray       # (持仓数, 点数)：各持仓股票在各时刻的价格，当天还没有记录为 NaN
+    pct: np.ndarray         # 同上，涨跌幅
+    resolution: str
+    total_points: int       # 降采样前的点数
+    days: List[date] = field(default_factory=list)
+
+    def details(self) -> List[List[Dict]]:
+        """按时间点展开：每个点一个列表，含当时有记录的持仓股票 (按占比降序)"""
+        details: List[List[Dict]] = [[] for _ in range(len(self.times))]
+        for h, price, pct in zip(self.holdings, self.price.tolist(), self.pct.tolist()):
+            for i, (p, c) in enumerate(zip(price, pct)):
+                if p == p:      # 非 NaN
+                    details[i].append({'code': h.code, 'name': h.name, 'ratio': h.ratio, 'pct': c, 'price': p})
+        return details
+
+def _ts(values) -> np.ndarray:
+    return np.array(values, dtype=TS_DTYPE)
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time(0, 0))
+
+def _calendar_days(first: date, last: date) -> List[date]:
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+def _carry(axis: np.ndarray, point_ts: np.ndarray, point_values: np.ndarray) -> np.ndarray:
+    """point 按时间升序，axis 从第一条 point 开始"""
+    return point_values[np.searchsorted(point_ts, axis, side='right') - 1]
+
+def _split_days(ts: np.ndarray) -> Dict[date, slice]:
+    """按天切分已排序的时间数组"""
+    days = ts.astype('M8[D]')
+    bounds = np.flatnonzero(days[1:] != days[:-1]) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(ts)]))
+    return {days[s].item(): slice(s, e) for s, e in zip(starts.tolist(), ends.tolist())}
+
+def load_holdings(session: Session, fund_id: int) -> List[HoldingInfo]:
+    """持仓及股票信息 (一条关联查询)，按占比降序"""
+    return [HoldingInfo(*row) for row in session.execute(
+        select(Holding.stock_id, Stock.code, Stock.name, Holding.ratio)
+        .join(Stock, Stock.id == Holding.stock_id)
+        .where(Holding.fund_id == fund_id)
+        .order_by(Holding.ratio.desc()))]
+
+# ---------------------------------------------------------------------------
+# 各来源：返回 {日期: (时间轴, 估值)}
+
+def _raw_fund(session: Session, fund_id: int, lo: datetime, hi: datetime) -> Dict[date, Tuple[np.ndarray, np.ndarray]]:
+    points = session.execute(
+        select(FundHistory.timestamp, FundHistory.estimated_change)
+        .where(FundHistory.fund_id == fund_id, FundHistory.timestamp >= lo, FundHistory.timestamp < hi)
+        .order_by(FundHistory.timestamp)).all()
+    if not points:
+        return {}
+    ts, values = _ts([p[0] for p in points]), np.array([p[1] for p in points], dtype=np.float64)
+    ticks = _ts(session.execute(
+        select(TickLog.timestamp).where(TickLog.timestamp >= points[0][0], TickLog.timestamp < hi)
+        .order_by(TickLog.timestamp)).scalars().all())
+    result = {}
+    for day, sl in _split_days(ts).items():
+        day_ts = ts[sl]
+        day_end = np.datetime64(_day_start(day + timedelta(days=1)), 's')
+        axis = np.union1d(ticks[(ticks >= day_ts[0]) & (ticks < day_end)], day_ts)
+        result[day] = (axis, _carry(axis, day_ts, values[sl]))
+    return result
+
+def _archive_fund(fund_id: int, days: List[date]) -> Dict[date, Tuple[np.ndarray, np.ndarray]]:
+    result = {}
+    for day in days:
+        part = archive.open_day(day)
+        points = part.fund(fund_id) if part else None
+        if points is None or not len(points):
+            continue
+        point_ts = points['ts'].astype(TS_DTYPE)
+        ticks = part.ticks.astype(TS_DTYPE)
+        axis = np.union1d(ticks[ticks >= point_ts[0]], point_ts)
+        result[day] = (axis, _carry(axis, point_ts, points['value']))
+    return result
+
+def _bars_fund(session: Session, fund_id: int, lo: datetime, hi: datetime) -> Dict[date, Tuple[np.ndarray, np.ndarray]]:
+    points = session.execute(
+        select(FundHistory5m.timestamp, FundHistory5m.estimated_change)
+        .where(FundHistory5m.fund_id == fund_id, FundHistory5m.timestamp >= lo, FundHistory5m.timestamp < hi)
+        .order_by(FundHistory5m.timestamp)).all()
+    if not points:
+        return {}
+    ts, values = _ts([p[0] for p in points]), np.array([p[1] for p in points], dtype=np.float64)
+    # 时间轴：当天所有基金出现过的 5 分钟 (单个基金只存变化，自己的 K 线不连续)
+    axis_all = _ts(session.execute(
+        select(FundHistory5m.timestamp).where(FundHistory5m.timestamp >= points[0][0], FundHistory5m.timestamp < hi)
+        .distinct().order_by(FundHistory5m.timestamp)).scalars().all())
+    axis_days = _split_days(axis_all)
+    result = {}
+    for day, sl in _split_days(ts).items():
+        day_axis = axis_all[axis_days[day]]
+        axis = day_axis[day_axis >= ts[sl][0]]
+        result[day] = (axis, _carry(axis, ts[sl], values[sl]))
+    return result
+
+def _daily_fund(session: Session, fund_id: int, first: date, last: date) -> Dict[date, Tuple[np.ndarray, np.ndarray]]:
+    return {date.fromisoformat(d): (_ts([datetime.combine(date.fromisoformat(d), MARKET_CLOSE)]), np.array([v]))
+            for d, v in session.execute(
+                select(FundDaily.trade_date, FundDaily.estimated_change)
+                .where(FundDaily.fund_id == fund_id, FundDaily.trade_date >= first.isoformat(),
+                       FundDaily.trade_date <= last.isoformat()))}
+
+# ---------------------------------------------------------------------------
+# 持仓股票价格：返回 {stock_id: (时间, 价格, 涨跌幅)}，只保留 days 中的日期
+
+_StockRows = Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]
+
+def _group_stock_rows(rows, days: set) -> _StockRows:
+    by_stock: Dict[int, List] = {}
+    for sid, ts, price, pct in rows:
+        if ts.date() in days:
+            by_stock.setdefault(sid, []).append((ts, price, pct))
+    return {sid: (_ts([r[0] for r in items]), np.array([r[1] for r in items]), np.array([r[2] for r in items]))
+            for sid, items in by_stock.items()}
+
+def _span(days: set) -> Tuple[datetime, datetime]:
+    return _day_start(min(days)), _day_start(max(days) + timedelta(days=1))
+
+def _raw_stocks(session: Session, fund_id: int, days: set) -> _StockRows:
+    lo, hi = _span(days)
+    return _group_stock_rows(session.execute(
+        select(StockPrice.stock_id, StockPrice.timestamp, StockPrice.price, StockPrice.change_percent)
+        .join(Holding, (Holding.stock_id == StockPrice.stock_id) & (Holding.fund_id == fund_id))
+        .where(StockPrice.timestamp >= lo, StockPrice.timestamp < hi)
+        .order_by(StockPrice.stock_id, StockPrice.timestamp)), days)
+
+def _bars_stocks(session: Session, fund_id: int, times: List[datetime]) -> _StockRows:
+    """
+    5 分钟线可能覆盖一整年：时间点少 (已降采样) 时，对每个点按主键查各持仓股票当天最后一根不晚于它的 K 线；
+    点多时逐点查询反而更慢，直接整段读取所涉及的日期
+    """
+    days = {t.date() for t in times}
+    if len(times) > BAR_LOOKUP_LIMIT:
+        lo, hi = _span(days)
+        return _group_stock_rows(session.execute(
+            select(StockPrice5m.stock_id, StockPrice5m.timestamp, StockPrice5m.price, StockPrice5m.change_percent)
+            .join(Holding, (Holding.stock_id == StockPrice5m.stock_id) & (Holding.fund_id == fund_id))
+            .where(StockPrice5m.timestamp >= lo, StockPrice5m.timestamp < hi)
+            .order_by(StockPrice5m.stock_id, StockPrice5m.timestamp)), days)
+    found = set()
+    for i in range(0, len(times), BAR_LOOKUP_CHUNK):
+        chunk = times[i:i + BAR_LOOKUP_CHUNK]
+        # SQLite 不支持带列名的 VALUES 子查询，时间点拼成 UNION ALL 的 CTE
+        points = union_all(*(select(literal(t, DateTime).label('t'), literal(_day_start(t.date()), DateTime).label('lo'))
+                             for t in chunk)).cte('points')
+        bar = aliased(StockPrice5m)
+        last = select(func.max(bar.timestamp)).where(
+            bar.stock_id == Holding.stock_id, bar.timestamp <= points.c.t, bar.timestamp >= points.c.lo)\
+            .scalar_subquery()
+        found.update(session.execute(
+            select(StockPrice5m.stock_id, StockPrice5m.timestamp, StockPrice5m.price, StockPrice5m.change_percent)
+            .select_from(points)
+            .join(Holding, Holding.fund_id == fund_id)
+            .join(StockPrice5m, (StockPrice5m.stock_id == Holding.stock_id) & (StockPrice5m.timestamp == last))))
+    return _group_stock_rows(sorted(found), days)
+
+def _daily_stocks(session: Session, fund_id: int, days: set) -> _StockRows:
+    rows = session.execute(
+        select(StockDaily.stock_id, StockDaily.trade_date, StockDaily.price, StockDaily.change_percent)
+        .join(Holding, (Holding.stock_id == StockDaily.stock_id) & (Holding.fund_id == fund_id))
+        .where(StockDaily.trade_date >= min(days).isoformat(), StockDaily.trade_date <= max(days).isoformat())
+        .order_by(StockDaily.stock_id, StockDaily.trade_date))
+    return _group_stock_rows(((sid, datetime.combine(date.fromisoformat(d), MARKET_CLOSE), price, pct)
+                              for sid, d, price, pct in rows), days)
+
+def _archive_stocks(stock_ids: List[int], days: set) -> _StockRows:
+    parts: Dict[int, List[np.ndarray]] = {sid: [] for sid in stock_ids}
+    for day in sorted(days):
+        part = archive.open_day(day)
+        for sid in stock_ids:
+            rows = part.stock(sid)
+            if len(rows):
+                parts[sid].append(rows)
+    result = {}
+    for sid, chunks in parts.items():
+        if chunks:
+            rows = np.concatenate(chunks)
+            result[sid] = (rows['ts'].astype(TS_DTYPE), rows['price'], rows['pct'])
+    return result
+
+def _merge_stock_rows(sources: List[_StockRows]) -> _StockRows:
+    """各来源覆盖的日期互不重叠，按时间拼接"""
+    merged: Dict[int, List] = {}
+    for rows in sources:
+        for sid, arrays in rows.items():
+            merged.setdefault(sid, []).append(arrays)
+    result = {}
+    for sid, chunks in merged.items():
+        ts = np.concatenate([c[0] for c in chunks])
+        order = np.argsort(ts, kind='stable')
+        result[sid] = (ts[order], np.concatenate([c[1] for c in chunks])[order],
+                       np.concatenate([c[2] for c in chunks])[order])
+    return result
+
+# ---------------------------------------------------------------------------
+
+def fund_history(session: Session, fund_id: int, first: date, last: date,
+                 max_points: Optional[int] = None) -> FundHistoryResult:
+    """
+    基金在 [first, last] (含两端) 的估值序列和持仓详情
+    :param max_points: 点数上限 (LTTB 降采样)，None 表示不降采样
+    """
+    lo, hi = _day_start(first), _day_start(last + timedelta(days=1))
+    segments: Dict[date, Tuple[np.ndarray, np.ndarray]] = {}
+    source_of: Dict[date, str] = {}
+
+    def take(name: str, found: Dict[date, Tuple[np.ndarray, np.ndarray]]):
+        for day, seg in found.items():
+            if day not in segments and len(seg[0]):
+                segments[day] = seg
+                source_of[day] = name
+
+    take('raw', _raw_fund(session, fund_id, lo, hi))
+    take('archive', _archive_fund(fund_id, [d for d in archive.archived_days(first, last + timedelta(days=1))
+                                            if d not in segments]))
+    missing = [d for d in _calendar_days(first, last) if d not in segments]
+    if missing:
+        take('5m', _bars_fund(session, fund_id, _day_start(missing[0]), _day_start(missing[-1] + timedelta(days=1))))
+        missing = [d for d in missing if d not in segments]
+    if missing:
+        take('1d', _daily_fund(session, fund_id, missing[0], missing[-1]))
+
+    days = sorted(segments)
+    if not days:
+        return FundHistoryResult(np.empty(0, TS_DTYPE), np.empty(0), [], np.empty((0, 0)), np.empty((0, 0)),
+                                 RESOLUTIONS[0], 0, [])
+    times = np.concatenate([segments[d][0] for d in days])
+    values = np.concatenate([segments[d][1] for d in days]).astype(np.float64)
+    resolution = max((_RESOLUTION_OF[source_of[d]] for d in days), key=RESOLUTIONS.index)
+
+    # 降采样 (横坐标用序号：前端是类目轴，点等距显示)
+    total = len(times)
+    if max_points and total > max_points:
+        keep = lttb(np.arange(total), values, max_points)
+        times, values = times[keep], values[keep]
+
+    holdings = load_holdings(session, fund_id)
+    price, pct = _holding_matrix(session, fund_id, holdings, times, source_of)
+    return FundHistoryResult(times, values, holdings, price, pct, resolution, total, days)
+
+def _holding_matrix(session: Session, fund_id: int, holdings: List[HoldingInfo], times: np.ndarray,
+                    source_of: Dict[date, str]) -> Tuple[np.ndarray, np.ndarray]:
+    """保留下来的各时间点上，持仓股票的最新价格和涨跌幅 (当天向前填充)，形状 (持仓数, 点数)"""
+    price = np.full((len(holdings), len(times)), np.nan)
+    pct = np.full((len(holdings), len(times)), np.nan)
+    if not holdings or not len(times):
+        return price, pct
+    point_days = times.astype('M8[D]')
+    stamps = times.astype(datetime).tolist()
+    used = {d: source_of[d] for d in set(point_days.tolist())}
+    by_source: Dict[str, set] = {}
+    for d, name in used.items():
+        by_source.setdefault(name, set()).add(d)
+
+    sources = []
+    if 'raw' in by_source:
+        sources.append(_raw_stocks(session, fund_id, by_source['raw']))
+    if 'archive' in by_source:
+        sources.append(_archive_stocks([h.stock_id for h in holdings], by_source['archive']))
+    if '5m' in by_source:
+        sources.append(_bars_stocks(session, fund_id, [t for t, d in zip(stamps, point_days.tolist())
+                                                       if used[d] == '5m']))
+    if '1d' in by_source:
+        sources.append(_daily_stocks(session, fund_id, by_source['1d']))
+    prices = _merge_stock_rows(sources)
+
+    for k, h in enumerate(holdings):
+        rows = prices.get(h.stock_id)
+        if rows is None:
+            continue
+        ts, stock_price, stock_pct = rows
+        idx = np.searchsorted(ts, times, side='right') - 1
+        valid = idx >= 0
+        valid[valid] &= ts[idx[valid]].astype('M8[D]') == point_days[valid]
+        price[k, valid] = stock_price[idx[valid]]
+        pct[k, valid] = stock_pct[idx[valid]]
+    return price, pct
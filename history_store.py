@@ -0,0 +1,182 @@
+# history_store.py
+# 每个 tick 的估值/行情写入：Core executemany 批量插入，一个事务提交
+# 股票 ID 由调用方从估值矩阵中取得，不再逐只 query Stock
+# 只存变化：与同一天上一次存储的值相同则跳过 (停牌股、午休前后、重复的收盘快照)，
+# 每个 tick 在 tick_log 记一条，读取方按 tick 时间轴向前填充还原完整序列
+
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.orm import Session
+from models import FundHistory, StockPrice, TickLog
+from quote_parser import Quote
+from trading_calendar import MARKET_CLOSE
+from log_utils import log
+
+class _LastValues:
+    """
+    当天每个基金/股票最后一次存储的值
+    收盘后的第一条记录总是写入 (收盘台账据此判断收盘数据是否完整)，所以键里带上是否收盘后
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.day: Optional[date] = None
+        self.funds: Dict[Tuple[int, bool], float] = {}
+        self.stocks: Dict[Tuple[int, bool], Tuple[float, float, float]] = {}
+
+    def reset(self):
+        with self.lock:
+            self.day = None
+
+    def prime(self, session: Session, day: date):
+        """换日或重置后从库里读出当天各自最后一条记录 (重启后不会重复写入未变化的值)"""
+        start = datetime.combine(day, time(0, 0))
+        close = datetime.combine(day, MARKET_CLOSE)
+        end = start + timedelta(days=1)
+        self.funds, self.stocks = {}, {}
+        for lo, hi, after in ((start, close, False), (close, end, True)):
+            last = select(FundHistory.fund_id, func.max(FundHistory.timestamp).label('ts'))\
+                .where(FundHistory.timestamp >= lo, FundHistory.timestamp < hi)\
+                .group_by(FundHistory.fund_id).subquery()
+            for fid, change in session.execute(
+                    select(FundHistory.fund_id, FundHistory.estimated_change)
+                    .join(last, (FundHistory.fund_id == last.c.fund_id) & (FundHistory.timestamp == last.c.ts))):
+                self.funds[(fid, after)] = change
+            last = select(StockPrice.stock_id, func.max(StockPrice.timestamp).label('ts'))\
+                .where(StockPrice.timestamp >= lo, StockPrice.timestamp < hi)\
+                .group_by(StockPrice.stock_id).subquery()
+            for sid, price, prev_close, pct in session.execute(
+                    select(StockPrice.stock_id, StockPrice.price, StockPrice.prev_close, StockPrice.change_percent)
+                    .join(last, (StockPrice.stock_id == last.c.stock_id) & (StockPrice.timestamp == last.c.ts))):
+                self.stocks[(sid, after)] = (price, prev_close, pct)
+        self.day = day
+
+_last = _LastValues()
+# session.info 中本事务已写入、尚未提交的 tick: [(时间, [(fund_id, 估值)], 参与估值的基金)]
+_WRITTEN_KEY = 'tick_written'
+TickListener = Callable[[datetime, List[Tuple[int, float]], Optional[Set[int]]], None]
+# 提交后的回调 fn(时间, [(fund_id, 估值)], 参与估值的基金)
+# 变化列表只包含实际写入 (有变化) 的基金；参与估值的基金为 None 表示全部基金 (全量 tick)，
+# 否则为这个 tick 计算过的基金 ID (收盘补全、补算往日等只涉及部分基金)，其余基金不能视为在这个时间得到确认
+_tick_listeners: List[TickListener] = []
+
+def add_tick_listener(fn: TickListener):
+    """注册 tick 提交后的回调 (推送给前端等)，在提交的线程中同步调用，应尽快返回"""
+    _tick_listeners.append(fn)
+
+@event.listens_for(Session, 'after_rollback')
+def _after_rollback(session):
+    # 写入被回滚时缓存已不可信，下次从库里重新读取
+    if session.info.pop(_WRITTEN_KEY, None) is not None:
+        _last.reset()
+
+@event.listens_for(Session, 'after_commit')
+def _after_commit(session):
+    for timestamp, changes, evaluated in session.info.pop(_WRITTEN_KEY, None) or ():
+        for fn in _tick_listeners:
+            try:
+                fn(timestamp, changes, evaluated)
+            except Exception as e:
+                log(f"tick 回调失败: {e}")
+
+def save_tick(session: Session, timestamp: datetime, fund_changes: Iterable[Tuple[int, float]],
+              quotes: Dict[int, Quote], full: bool = False) -> Tuple[int, int]:
+    """
+    写入一个 tick 的数据 (不提交，由调用方控制事务)，只写入与上次存储不同的值
+    :param fund_changes: [(fund_id, 预估涨跌幅)]，这个 tick 计算过的所有基金 (不论是否变化)
+    :param quotes: {stock_id: Quote}
+    :param full: fund_changes 是否覆盖了全部基金
+    :return: (写入的基金历史条数, 写入的股票价格条数)
+    """
+    fund_changes = list(fund_changes)
+    after = timestamp.time() >= MARKET_CLOSE
+    with _last.lock:
+        if _last.day != timestamp.date():
+            _last.prime(session, timestamp.date())
+        last_funds, last_stocks = _last.funds, _last.stocks
+
+        fund_rows = []
+        for fid, change in fund_changes:
+            if last_funds.get((fid, after)) != change:
+                last_funds[(fid, after)] = change
+                fund_rows.append({'fund_id': fid, 'estimated_change': change, 'timestamp': timestamp})
+        price_rows = []
+        for sid, q in quotes.items():
+            value = (q.price, q.prev_close, q.pct)
+            if last_stocks.get((sid, after)) != value:
+                last_stocks[(sid, after)] = value
+                price_rows.append({'stock_id': sid, 'price': q.price, 'prev_close': q.prev_close,
+                                   'change_percent': q.pct, 'timestamp': timestamp})
+        session.info.setdefault(_WRITTEN_KEY, []).append(
+            (timestamp, [(r['fund_id'], r['estimated_change']) for r in fund_rows],
+             None if full else {fid for fid, _ in fund_changes}))
+
+    # 直接对 Table 执行 insert：走 DBAPI executemany，不经过 ORM 工作单元
+    # 主键为 (id, 秒级时间)：同一秒内再次写入 (手动刷新与定时 tick 重叠) 以后写入的为准
+    if fund_rows:
+        session.execute(insert(FundHistory.__table__).prefix_with('OR REPLACE'), fund_rows)
+    if price_rows:
+        session.execute(insert(StockPrice.__table__).prefix_with('OR REPLACE'), price_rows)
+    session.execute(insert(TickLog.__table__), [{
+        'timestamp': timestamp, 'funds': len(fund_changes), 'stocks': len(quotes),
+        'fund_rows': len(fund_rows), 'stock_rows': len(price_rows),
+    }])
+    return len(fund_rows), len(price_rows)
+
+# ---------------------------------------------------------------------------
+# 读取：按 tick 时间轴向前填充
+
+def tick_times(session: Session, start: datetime, end: datetime) -> List[datetime]:
+    """[start, end) 内所有 tick 的时间"""
+    return list(session.execute(
+        select(TickLog.timestamp).where(TickLog.timestamp >= start, TickLog.timestamp < end)
+        .order_by(TickLog.timestamp)).scalars())
+
+def latest_tick_time(session: Session) -> Optional[datetime]:
+    return session.scalar(select(func.max(TickLog.timestamp)))
+
+def carry_forward(times: Sequence[datetime], points: Sequence[Tuple[datetime, object]]) -> List[object]:
+    """
+    把稀疏的 (时间, 值) 按 times 向前填充
+    :param points: 按时间升序
+    :return: 与 times 等长，第一个值出现之前为 None
+    """
+    result = []
+    i, current = 0, None
+    for t in times:
+        while i < len(points) and points[i][0] <= t:
+            current = points[i][1]
+            i += 1
+        result.append(current)
+    return result
+
+def fund_series(session: Session, fund_id: int, start: datetime, end: datetime) -> Tuple[List[datetime], List[float]]:
+    """
+    基金在 [start, end) 的估值序列 (时间, 值)
+    时间轴为 tick_log 与该基金已存记录的并集 (兼容启用 tick_log 之前的数据)，从第一条记录开始
+    """
+    points = session.execute(
+        select(FundHistory.timestamp, FundHistory.estimated_change)
+        .where(FundHistory.fund_id == fund_id, FundHistory.timestamp >= start, FundHistory.timestamp < end)
+        .order_by(FundHistory.timestamp)).all()
+    if not points:
+        return [], []
+    times = sorted(set(tick_times(session, points[0][0], end)) | {p[0] for p in points})
+    return times, carry_forward(times, points)
+
+def stock_series(session: Session, stock_ids: Iterable[int], times: Sequence[datetime],
+                 start: datetime, end: datetime) -> Dict[int, List[Optional[StockPrice]]]:
+    """各股票在 times 各时刻的最新价格记录 (向前填充)"""
+    stock_ids = list(stock_ids)
+    if not stock_ids or not times:
+        return {}
+    rows = session.query(StockPrice)\
+        .filter(StockPrice.stock_id.in_(stock_ids))\
+        .filter(StockPrice.timestamp >= start, StockPrice.timestamp < end)\
+        .order_by(StockPrice.timestamp).all()
+    by_stock: Dict[int, List[Tuple[datetime, StockPrice]]] = {sid: [] for sid in stock_ids}
+    for sp in rows:
+        by_stock[sp.stock_id].append((sp.timestamp, sp))
+    return {sid: carry_forward(times, points) for sid, points in by_stock.items()}
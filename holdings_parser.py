@@ -0,0 +1,129 @@
+# holdings_parser.py
+# FundArchivesDatas.aspx 持仓解析：只定位并解析第一个命中的持仓表格 (最新报告期)
+# 不对整段 content 做正则/反转义，也不为旧季度的表格建 DOM
+
+import html as html_lib
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+_CONTENT_START = 'content:"'
+_CONTENT_END = '",aryLastDate'
+# content 里的斜杠被转义为 \/，两种写法都要能找到
+_TABLE_OPEN = '<table'
+_TABLE_CLOSES = ('<\\/table>', '</table>')
+
+_TR_RE = re.compile(r'<tr[^>]*>(.*?)</tr>', re.S)
+_CELL_RE = re.compile(r'<t([dh])[^>]*>(.*?)</t[dh]>', re.S)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+def _content_bounds(text: str) -> Tuple[int, int]:
+    start = text.find(_CONTENT_START)
+    if start == -1:
+        return -1, -1
+    start += len(_CONTENT_START)
+    end = text.find(_CONTENT_END, start)
+    if end == -1:
+        end = text.rfind('"')
+    return start, end
+
+def _cell_text(raw: str) -> str:
+    if '<' in raw:
+        raw = _TAG_RE.sub('', raw)
+    if '&' in raw:
+        raw = html_lib.unescape(raw)
+    return raw.strip()
+
+@lru_cache(maxsize=64)
+def column_map(headers: Tuple[str, ...]) -> Optional[Tuple[int, int, int]]:
+    """
+    表头 -> (代码列, 名称列, 占比列)，同样的表头只计算一次
+    规则与原解析一致：包含“代码”“名称”“占比/比例”的列
+    """
+    idx_code = idx_name = idx_ratio = -1
+    for i, h in enumerate(headers):
+        if '代码' in h: idx_code = i
+        elif '名称' in h: idx_name = i
+        elif '占比' in h or '比例' in h: idx_ratio = i
+    if idx_code == -1 or idx_name == -1 or idx_ratio == -1:
+        return None
+    return idx_code, idx_name, idx_ratio
+
+def _iter_tables(text: str, start: int, end: int):
+    """依次产出 content 中每个表格 (已反转义) 的文本"""
+    pos = text.find(_TABLE_OPEN, start, end)
+    while pos != -1:
+        close = -1
+        close_len = 0
+        for tag in _TABLE_CLOSES:
+            c = text.find(tag, pos, end)
+            if c != -1 and (close == -1 or c < close):
+                close, close_len = c, len(tag)
+        if close == -1:
+            return
+        # 只反转义当前表格
+        yield text[pos:close].replace('\\"', '"').replace('\\/', '/')
+        pos = text.find(_TABLE_OPEN, close + close_len, end)
+
+def _first_table_rows(text: str):
+    """第一个持仓表格的 (列映射, 数据行迭代器)，找不到返回 (None, None)"""
+    start, end = _content_bounds(text)
+    if start == -1:
+        return None, None
+    for table in _iter_tables(text, start, end):
+        rows = _TR_RE.finditer(table)
+        first = next(rows, None)
+        if first is None:
+            continue
+        headers = tuple(_cell_text(c) for _, c in _CELL_RE.findall(first.group(1)))
+        cols = column_map(headers)
+        if cols is not None:
+            return cols, rows
+    return None, None
+
+def _parse_row(row, cols: Tuple[int, int, int]) -> Optional[Dict]:
+    """一行数据 -> {code, name, ratio}；单元格不够、代码/占比为空或占比不是数字 (合计行、合并单元格等) 返回 None"""
+    idx_code, idx_name, idx_ratio = cols
+    cells = [c for kind, c in _CELL_RE.findall(row.group(1)) if kind == 'd']
+    if len(cells) <= max(cols):
+        return None
+    code = _cell_text(cells[idx_code])
+    ratio_str = _cell_text(cells[idx_ratio]).replace('%', '')
+    if not code or not ratio_str:
+        return None
+    try:
+        ratio = float(ratio_str) / 100.0
+    except ValueError:
+        return None
+    return {'code': code, 'name': _cell_text(cells[idx_name]), 'ratio': ratio}
+
+def count_holdings(text: str) -> int:
+    """
+    最新报告期持仓表中有效的持仓行数，用于判断持仓是否有变化
+    与 parse_holdings 使用同一套行过滤，否则带合计行的表格每次都会被判为“有变化”
+    """
+    cols, rows = _first_table_rows(text)
+    if cols is None:
+        return 0
+    return sum(1 for row in rows if _parse_row(row, cols) is not None)
+
+def parse_holdings(text: str, limit: Optional[int] = 10) -> List[Dict]:
+    """
+    解析持仓接口响应
+    :param text: FundArchivesDatas.aspx 的原始响应文本
+    :param limit: 最多返回的持仓数，None 表示全部
+    :return: [{code, name, ratio}]，ratio 为小数 (0.05 代表 5%)
+    """
+    cols, rows = _first_table_rows(text)
+    if cols is None:
+        return []
+
+    holdings = []
+    for row in rows:
+        holding = _parse_row(row, cols)
+        if holding is None:
+            continue
+        holdings.append(holding)
+        if limit is not None and len(holdings) >= limit:
+            break
+    return holdings
@@ -0,0 +1,154 @@
+# holdings_service.py
+# 持仓刷新：按报告期判断是否需要重新抓取/解析/写库
+# 持仓只在定期报告发布后变化，报告期没变时跳过解析和数据库重写
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from models import get_session, Fund, HoldingsCache, SystemConfig
+from fetcher import FundFetcher
+from holdings_store import sync_holdings, save_holdings_cache
+from db_writer import db_writer
+from log_utils import log
+
+# 并发检查的基金数量
+MAX_PARALLEL = 8
+# SystemConfig 中“跟踪完整持仓”选项的键，值为 '1' / '0'
+FULL_PORTFOLIO_KEY = 'holdings_full'
+
+def full_portfolio_enabled(session: Session) -> bool:
+    """是否跟踪完整持仓 (默认只跟踪前十大重仓)"""
+    config = session.get(SystemConfig, FULL_PORTFOLIO_KEY)
+    return bool(config and config.value == '1')
+
+def set_full_portfolio(enabled: bool):
+    """保存完整持仓选项 (经写库线程)；切换后下一次刷新会因持仓行数变化而重新同步"""
+    def save(session: Session):
+        config = session.get(SystemConfig, FULL_PORTFOLIO_KEY)
+        if not config:
+            config = SystemConfig(key=FULL_PORTFOLIO_KEY, value='0')
+            session.add(config)
+        config.value = '1' if enabled else '0'
+    db_writer.run(save, name='holdings_full')
+
+def latest_period_end(today: date) -> date:
+    """today 之前最近的一个季度末 (报告期只可能是季度末)"""
+    for month, day in ((12, 31), (9, 30), (6, 30), (3, 31)):
+        d = date(today.year, month, day)
+        if d < today:
+            return d
+    return date(today.year - 1, 12, 31)
+
+def needs_check(report_date: Optional[str], checked_at: Optional[datetime], today: date,
+                full: bool = False) -> bool:
+    """
+    是否需要请求接口
+    - 没有缓存：需要
+    - 缓存的报告期已是最近的季度末：不可能有更新的报告，不需要
+      (完整持仓时 6-30/12-31 例外：季报之后半年报/年报还会补充全部持仓)
+    - 当天已经检查过：不需要 (新报告在季度结束后数周内陆续发布，每天查一次足够)
+    """
+    if not report_date:
+        return True
+    if report_date >= latest_period_end(today).isoformat():
+        if not (full and report_date[5:] in ('06-30', '12-31')):
+            return False
+    return not (checked_at and checked_at.date() == today)
+
+def latest_cache(session: Session) -> Dict[str, Tuple[str, datetime, int]]:
+    """每个基金最新报告期的缓存 {fund_code: (report_date, checked_at, 持仓数)}，一次查询"""
+    latest = select(HoldingsCache.fund_code, func.max(HoldingsCache.report_date).label('rd'))\
+        .group_by(HoldingsCache.fund_code).subquery()
+    rows = session.execute(
+        select(HoldingsCache.fund_code, HoldingsCache.report_date, HoldingsCache.checked_at,
+               func.json_array_length(HoldingsCache.holdings))
+        .join(latest, (HoldingsCache.fund_code == latest.c.fund_code) & (HoldingsCache.report_date == latest.c.rd))
+    )
+    return {code: (rd, checked, count) for code, rd, checked, count in rows}
+
+def apply_details(session: Session, fund: Fund, data: Dict) -> Optional[Dict[str, int]]:
+    """
+    把抓取结果按差异同步到基金 (不提交)
+    :return: 没有持仓时返回 None，否则返回 sync_holdings 的增/改/删计数
+    """
+    if data.get('name') and data['name'] != f"基金{fund.code}":
+        fund.name = data['name']
+    if not data.get('holdings'):
+        return None
+    diff = sync_holdings(session, fund.id, data['holdings'])
+    save_holdings_cache(session, [data])
+    return diff
+
+def refresh_all_holdings(force: bool = False) -> Dict:
+    """
+    批量刷新所有基金持仓：读库和并发抓取在当前线程，结果一次交给写库线程写入
+    :param force: 忽略缓存，全部重新请求 (报告期没变仍然跳过解析和写库)
+    :return: 各类计数
+    """
+    t0 = time.time()
+    today = date.today()
+    stats = {'total': 0, 'skipped': 0, 'unchanged': 0, 'updated': 0, 'failed': 0,
+             'inserted': 0, 'changed': 0, 'deleted': 0}
+    session = get_session()
+    try:
+        full = full_portfolio_enabled(session)
+        funds = session.execute(select(Fund.id, Fund.code)).all()
+        cache = latest_cache(session)
+    finally:
+        session.close()
+    stats['total'] = len(funds)
+
+    todo = []
+    for fid, code in funds:
+        rd, checked, count = cache.get(code, (None, None, None))
+        if force or needs_check(rd, checked, today, full):
+            todo.append((fid, code, rd, count))
+    stats['skipped'] = len(funds) - len(todo)
+
+    results = []
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL, thread_name_prefix='holdings-refresh') as pool:
+        futures = {pool.submit(FundFetcher.check_holdings, code, rd, count, full): (fid, code)
+                   for fid, code, rd, count in todo}
+        for fut in as_completed(futures):
+            fid, code = futures[fut]
+            try:
+                data = fut.result()
+            except Exception as e:
+                log(f"检查基金 {code} 持仓失败: {e}")
+                data = None
+            if data is None:
+                stats['failed'] += 1
+            else:
+                results.append((fid, data))
+
+    def write(session: Session) -> Dict[str, int]:
+        # 计数放在任务内部：写库线程合并提交失败后会重做任务
+        counts = dict.fromkeys(('unchanged', 'updated', 'failed', 'inserted', 'changed', 'deleted'), 0)
+        now = datetime.now()
+        for fid, data in results:
+            if not data['changed']:
+                # 报告期没变：只更新确认时间
+                session.execute(update(HoldingsCache)
+                                .where(HoldingsCache.fund_code == data['code'], HoldingsCache.report_date == data['report_date'])
+                                .values(checked_at=now))
+                counts['unchanged'] += 1
+                continue
+            fund = session.get(Fund, fid)
+            diff = apply_details(session, fund, data) if fund else None  # 抓取期间可能已被删除
+            if diff is None:
+                counts['failed'] += 1
+                continue
+            counts['updated'] += 1
+            counts['inserted'] += diff['inserted']
+            counts['changed'] += diff['updated']
+            counts['deleted'] += diff['deleted']
+        return counts
+    if results:
+        for key, n in db_writer.run(write, name='holdings_refresh').items():
+            stats[key] += n
+    log(f"持仓刷新完成 ({time.time() - t0:.1f}s): {stats}")
+    return stats
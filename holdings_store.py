@@ -0,0 +1,137 @@
+# holdings_store.py
+# 基金/股票/持仓的批量写入：一次 IN 查询解析股票，批量 insert，避免逐条 query + flush
+
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+from models import Fund, Stock, Holding, HoldingsCache
+
+# SQLite 单条语句的参数个数有上限，IN 查询分批进行
+IN_BATCH = 500
+
+def batched(items: List, size: int = IN_BATCH):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def resolve_stock_ids(session: Session, stocks: Dict[str, str]) -> Dict[str, int]:
+    """
+    批量查找或创建股票
+    :param stocks: {stock_code: stock_name}
+    :return: {stock_code: stock_id}
+    """
+    codes = list(stocks.keys())
+    ids = {}
+    for batch in batched(codes):
+        for sid, code in session.execute(select(Stock.id, Stock.code).where(Stock.code.in_(batch))):
+            ids[code] = sid
+
+    missing = [c for c in codes if c not in ids]
+    if missing:
+        now = datetime.now()
+        session.execute(insert(Stock), [{'code': c, 'name': stocks[c] or c, 'created_at': now} for c in missing])
+        for batch in batched(missing):
+            for sid, code in session.execute(select(Stock.id, Stock.code).where(Stock.code.in_(batch))):
+                ids[code] = sid
+    return ids
+
+def bulk_save_funds(session: Session, items: Iterable[Dict]) -> Dict[str, int]:
+    """
+    批量写入新基金及其持仓 (不提交，由调用方控制事务)
+    :param items: FundFetcher.get_fund_details 的返回值列表 {code, name, holdings: [{code, name, ratio}]}
+    :return: {fund_code: fund_id}
+    """
+    items = list(items)
+    if not items:
+        return {}
+    now = datetime.now()
+    session.execute(insert(Fund), [
+        {'code': d['code'], 'name': d['name'], 'created_at': now, 'updated_at': now} for d in items
+    ])
+    fund_ids = {}
+    for batch in batched([d['code'] for d in items]):
+        for fid, code in session.execute(select(Fund.id, Fund.code).where(Fund.code.in_(batch))):
+            fund_ids[code] = fid
+
+    stocks = {}
+    for d in items:
+        for h in d['holdings']:
+            stocks.setdefault(h['code'], h['name'])
+    stock_ids = resolve_stock_ids(session, stocks) if stocks else {}
+
+    rows = []
+    for d in items:
+        for h in _dedupe(d['holdings']):
+            rows.append({'fund_id': fund_ids[d['code']], 'stock_id': stock_ids[h['code']],
+                         'ratio': h['ratio'], 'created_at': now})
+    if rows:
+        session.execute(insert(Holding), rows)
+    save_holdings_cache(session, items, now)
+    return fund_ids
+
+def _dedupe(holdings: List[Dict]) -> List[Dict]:
+    """同一基金的持仓表偶尔会重复列出同一只股票，只保留第一条"""
+    seen = set()
+    result = []
+    for h in holdings:
+        if h['code'] not in seen:
+            seen.add(h['code'])
+            result.append(h)
+    return result
+
+# 占比的比较精度 (接口给的是两位小数的百分比)
+RATIO_EPSILON = 1e-9
+
+def sync_holdings(session: Session, fund_id: int, holdings: List[Dict]) -> Dict[str, int]:
+    """
+    按差异同步基金持仓 (不提交)：只插入新增、更新占比变化、删除已清仓的行
+    股票一次 IN 查询解析；未变化的行不产生任何写入
+    :return: {'inserted', 'updated', 'deleted'} 计数
+    """
+    holdings = _dedupe(holdings)
+    existing = {sid: (hid, ratio) for hid, sid, ratio in session.execute(
+        select(Holding.id, Holding.stock_id, Holding.ratio).where(Holding.fund_id == fund_id))}
+    stock_ids = resolve_stock_ids(session, {h['code']: h['name'] for h in holdings}) if holdings else {}
+
+    wanted = {}
+    for h in holdings:
+        wanted[stock_ids[h['code']]] = h['ratio']
+
+    inserts, updates = [], []
+    now = datetime.now()
+    for sid, ratio in wanted.items():
+        old = existing.get(sid)
+        if old is None:
+            inserts.append({'fund_id': fund_id, 'stock_id': sid, 'ratio': ratio, 'created_at': now})
+        elif abs(old[1] - ratio) > RATIO_EPSILON:
+            updates.append({'id': old[0], 'ratio': ratio})
+    deletes = [hid for sid, (hid, _) in existing.items() if sid not in wanted]
+
+    if deletes:
+        for batch in batched(deletes):
+            session.execute(delete(Holding).where(Holding.id.in_(batch)))
+    if updates:
+        # 按主键的批量 UPDATE (executemany)
+        session.execute(update(Holding), updates)
+    if inserts:
+        session.execute(insert(Holding), inserts)
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
+
+def save_holdings_cache(session: Session, items: Iterable[Dict], checked_at: datetime = None):
+    """
+    记录各基金本次抓到的报告期和持仓 (不提交)
+    同一 (基金, 报告期) 已存在时覆盖，fetched_at 保留为首次抓取时间
+    """
+    checked_at = checked_at or datetime.now()
+    for d in items:
+        if not d.get('report_date'):
+            continue
+        row = session.get(HoldingsCache, (d['code'], d['report_date']))
+        payload = json.dumps(d['holdings'], ensure_ascii=False)
+        if row:
+            row.holdings = payload
+            row.checked_at = checked_at
+        else:
+            session.add(HoldingsCache(fund_code=d['code'], report_date=d['report_date'], holdings=payload,
+                                      fetched_at=checked_at, checked_at=checked_at))
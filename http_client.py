@@ -0,0 +1,77 @@
+# http_client.py
+# HTTP 连接池：所有上游请求共用一个 keep-alive 的 requests.Session
+# 可选录制模式：设置 ALPHA_RECORD_DIR 后，原始响应连同时间戳写入 JSONL，供 fake_upstream.py 回放
+
+import base64
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import requests
+from requests.adapters import HTTPAdapter
+
+# 每个 host 保持的最大空闲连接数，应不小于抓取线程数
+POOL_SIZE = int(os.environ.get('ALPHA_HTTP_POOL_SIZE', '16'))
+
+# 上游地址，可指向本地的 fake_upstream.py
+# ALPHA_UPSTREAM_URL 一次性覆盖全部上游，单独的变量优先级更高
+_UPSTREAM = os.environ.get('ALPHA_UPSTREAM_URL', '').rstrip('/')
+SINA_URL = os.environ.get('ALPHA_SINA_URL', _UPSTREAM or 'http://hq.sinajs.cn').rstrip('/')
+TENCENT_URL = os.environ.get('ALPHA_TENCENT_URL', _UPSTREAM or 'http://qt.gtimg.cn').rstrip('/')
+EASTMONEY_F10_URL = os.environ.get('ALPHA_EASTMONEY_F10_URL', _UPSTREAM or 'http://fundf10.eastmoney.com').rstrip('/')
+FUNDSUGGEST_URL = os.environ.get('ALPHA_FUNDSUGGEST_URL', _UPSTREAM or 'http://fundsuggest.eastmoney.com').rstrip('/')
+
+# 录制目录，为空则不录制
+RECORD_DIR = os.environ.get('ALPHA_RECORD_DIR', '')
+
+_session = None
+_session_lock = threading.Lock()
+_record_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """
+    获取进程内共享的 Session (懒加载)
+    requests.Session 的 get 在多线程下可安全共用，连接由 urllib3 连接池管理
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                # 强制不读取系统代理环境变量，与原来 proxies=None 的效果一致
+                s.trust_env = False
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+                s.mount('http://', adapter)
+                s.mount('https://', adapter)
+                _session = s
+    return _session
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    """GET 请求统一入口，录制模式下顺带保存原始响应"""
+    t0 = time.time()
+    resp = get_http_session().get(url, **kwargs)
+    if RECORD_DIR:
+        _record(resp, t0)
+    return resp
+
+def _record(resp: requests.Response, started_at: float):
+    """
+    每行一条: {ts, elapsed, url, status, body_b64}
+    ts 为请求发出时间 (epoch 秒)，url 为带查询参数的完整地址
+    """
+    entry = {
+        'ts': started_at,
+        'elapsed': round(resp.elapsed.total_seconds(), 4),
+        'url': resp.url,
+        'status': resp.status_code,
+        'body_b64': base64.b64encode(resp.content).decode('ascii'),
+    }
+    path = os.path.join(RECORD_DIR, f"upstream-{datetime.fromtimestamp(started_at):%Y%m%d}.jsonl")
+    try:
+        with _record_lock:
+            os.makedirs(RECORD_DIR, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+    except OSError as e:
+        print(f"  [HTTP] 录制写入失败: {e}")
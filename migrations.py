@@ -0,0 +1,114 @@
+# migrations.py
+# 数据库结构迁移：PRAGMA user_version 记录库的结构版本，启动时按顺序执行尚未执行的迁移
+# 新建的库由 create_all 直接建成最新结构，版本号直接记为最新
+# 每个迁移在一个事务中执行 (SQLite 的 DDL 可以回滚)，失败时库保持在上一个版本
+#
+# 新增迁移：在文件末尾用 @migration(下一个版本号, 说明) 注册一个函数，参数为 sqlite3 游标；
+# 同时修改 models.py 中的模型定义，保证新建的库与迁移后的库结构一致
+
+import sqlite3
+from typing import Callable, List, Tuple
+from sqlalchemy.engine import Engine
+
+from models import Base
+from log_utils import log
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = []
+
+def migration(version: int, description: str):
+    def register(fn: Callable[[sqlite3.Cursor], None]):
+        assert not MIGRATIONS or version == MIGRATIONS[-1][0] + 1, "迁移版本号必须连续"
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+def latest_version() -> int:
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+def _user_version(cursor: sqlite3.Cursor) -> int:
+    return cursor.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(engine: Engine) -> Tuple[int, int]:
+    """
+    把库升级到最新结构
+    :return: (升级前版本, 升级后版本)
+    """
+    raw = engine.raw_connection()
+    conn = raw.driver_connection
+    isolation_level = conn.isolation_level
+    try:
+        # 手动控制事务 (sqlite3 默认不会为 DDL 开启事务)
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        fresh = cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0] == 0
+        before = _user_version(cursor)
+
+        # 新表 (旧库中没有的) 由 create_all 补上；已有的表只能通过迁移修改
+        Base.metadata.create_all(engine)
+        if fresh:
+            cursor.execute(f"PRAGMA user_version = {latest_version()}")
+            return latest_version(), latest_version()
+
+        for version, description, fn in MIGRATIONS:
+            if version <= before:
+                continue
+            log(f"数据库迁移 v{version}: {description}")
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                fn(cursor)
+                cursor.execute(f"PRAGMA user_version = {version}")
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+        return before, _user_version(cursor)
+    finally:
+        conn.isolation_level = isolation_level
+        raw.close()
+
+# ---------------------------------------------------------------------------
+
+@migration(1, "fund_histories/stock_prices 增加 (id, timestamp) 复合索引")
+def _composite_history_indexes(cursor: sqlite3.Cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_fund_histories_fund_id_timestamp "
+                   "ON fund_histories (fund_id, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_stock_prices_stock_id_timestamp "
+                   "ON stock_prices (stock_id, timestamp)")
+
+@migration(2, "rollup_ledger 增加 archived_at (原始分时列式归档)")
+def _rollup_archived_at(cursor: sqlite3.Cursor):
+    # 在 v1 之后才建的 rollup_ledger 已由 create_all 建成新结构
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(rollup_ledger)")}
+    if 'archived_at' not in columns:
+        cursor.execute("ALTER TABLE rollup_ledger ADD COLUMN archived_at DATETIME")
+
+@migration(3, "分时表改为紧凑结构：秒级整数时间、定点数价格/涨跌幅、(id, timestamp) 聚簇的 WITHOUT ROWID 表")
+def _compact_tick_tables(cursor: sqlite3.Cursor):
+    # 时间: 'YYYY-MM-DD HH:MM:SS.ffffff' -> 1970-01-01 起的秒数 (strftime 按不带时区处理，与 EpochSeconds 一致)
+    # 价格 x1000、涨跌幅 x100 取整。同一秒内的重复记录保留后写入的一条 (按旧 id 顺序 INSERT OR REPLACE)
+    ts = "CAST(strftime('%s', timestamp) AS INTEGER)"
+    cursor.execute("CREATE TABLE fund_histories_v3 ("
+                   "fund_id INTEGER NOT NULL, timestamp INTEGER NOT NULL, estimated_change INTEGER NOT NULL, "
+                   "PRIMARY KEY (fund_id, timestamp), FOREIGN KEY(fund_id) REFERENCES funds (id)) WITHOUT ROWID")
+    cursor.execute(f"INSERT OR REPLACE INTO fund_histories_v3 (fund_id, timestamp, estimated_change) "
+                   f"SELECT fund_id, {ts}, CAST(round(estimated_change * 100) AS INTEGER) "
+                   f"FROM fund_histories WHERE timestamp IS NOT NULL ORDER BY id")
+    cursor.execute("CREATE TABLE stock_prices_v3 ("
+                   "stock_id INTEGER NOT NULL, timestamp INTEGER NOT NULL, price INTEGER NOT NULL, "
+                   "prev_close INTEGER NOT NULL, change_percent INTEGER NOT NULL, "
+                   "PRIMARY KEY (stock_id, timestamp), FOREIGN KEY(stock_id) REFERENCES stocks (id)) WITHOUT ROWID")
+    cursor.execute(f"INSERT OR REPLACE INTO stock_prices_v3 (stock_id, timestamp, price, prev_close, change_percent) "
+                   f"SELECT stock_id, {ts}, CAST(round(price * 1000) AS INTEGER), "
+                   f"CAST(round(prev_close * 1000) AS INTEGER), CAST(round(change_percent * 100) AS INTEGER) "
+                   f"FROM stock_prices WHERE timestamp IS NOT NULL ORDER BY id")
+    cursor.execute("CREATE TABLE tick_log_v3 ("
+                   "id INTEGER NOT NULL, timestamp INTEGER NOT NULL, funds INTEGER NOT NULL, stocks INTEGER NOT NULL, "
+                   "fund_rows INTEGER NOT NULL, stock_rows INTEGER NOT NULL, PRIMARY KEY (id))")
+    cursor.execute(f"INSERT INTO tick_log_v3 (id, timestamp, funds, stocks, fund_rows, stock_rows) "
+                   f"SELECT id, {ts}, funds, stocks, fund_rows, stock_rows FROM tick_log")
+
+    for table in ('fund_histories', 'stock_prices', 'tick_log'):
+        cursor.execute(f"DROP TABLE {table}")   # 旧表的索引一起删除
+        cursor.execute(f"ALTER TABLE {table}_v3 RENAME TO {table}")
+    # 分时表按主键聚簇，不再需要时间索引 (见 models.FundHistory)
+    cursor.execute("CREATE INDEX ix_tick_log_timestamp ON tick_log (timestamp)")
@@ -1,9 +1,13 @@
 # models.py
 # 数据库模型定义
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, create_engine, event
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
-from datetime import datetime
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.types import TypeDecorator
+from datetime import datetime, timedelta
+import calendar
+from functools import lru_cache
 import os
 import sys
 
@@ -23,10 +27,76 @@ DB_PATH = os.path.join(DB_DIR, 'fund_monitor.db')
 # 确保data目录存在
 os.makedirs(DB_DIR, exist_ok=True)
 
+# SQLite 存储参数 (每个新连接执行一次)
+# WAL：写库线程提交时读请求不阻塞；WAL 下 synchronous=NORMAL 掉电最多丢最后几个事务，不会损坏
+SQLITE_PRAGMAS = {
+    'auto_vacuum': 'INCREMENTAL',   # 只对新建的库直接生效；旧库由维护任务 VACUUM 一次后生效
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,       # 页缓存 64 MiB (负数单位为 KiB)
+    'mmap_size': 268435456,     # 内存映射读 256 MiB
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,       # 遇到锁时等待的毫秒数 (外部工具同时打开库时)
+}
+# 连接池：写只有写库线程一个连接，其余为 Flask 请求、流水线抓取、持仓刷新等并发读
+POOL_SIZE = 8
+POOL_MAX_OVERFLOW = 16
+
 # 创建数据库引擎
-engine = create_engine(f'sqlite:///{DB_PATH}', echo=False)
+engine = create_engine(f'sqlite:///{DB_PATH}', echo=False, poolclass=QueuePool,
+                       pool_size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                       connect_args={'check_same_thread': False})
 Session = sessionmaker(bind=engine)
 
+@event.listens_for(engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for key, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {key}={value}")
+    cursor.close()
+
+# ---------------------------------------------------------------------------
+# 紧凑存储类型：分时表每个 tick 每只基金/股票一行，库的大小和读写量主要在这几张表
+# 库里存整数，ORM/Core 读写时自动换算，查询代码仍然使用 datetime 和 float
+
+_EPOCH = datetime(1970, 1, 1)
+# 价格按 1/1000 元存储，涨跌幅按 0.01% 存储 (行情和估值本来就保留两位小数)
+PRICE_SCALE = 1000
+PCT_SCALE = 100
+
+class EpochSeconds(TypeDecorator):
+    """本地时间 (不带时区) 存为 1970-01-01 起的秒数，精确到秒"""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return calendar.timegm(value.timetuple())
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else _from_epoch(value)
+
+@lru_cache(maxsize=65536)
+def _from_epoch(seconds: int) -> datetime:
+    # 同一个 tick 的所有行时间相同，缓存换算结果 (datetime 不可变，可以共用)
+    return _EPOCH + timedelta(seconds=seconds)
+
+class FixedPoint(TypeDecorator):
+    """定点数：value * scale 四舍五入后存为整数"""
+    impl = Integer
+    cache_ok = True
+
+    def __init__(self, scale: int):
+        super().__init__()
+        self.scale = scale
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else int(round(value * self.scale))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / self.scale
+
 class Fund(Base):
     """基金信息表"""
     __tablename__ = 'funds'
@@ -40,6 +110,8 @@ class Fund(Base):
     # 关联
     holdings = relationship("Holding", back_populates="fund", cascade="all, delete-orphan")
     histories = relationship("FundHistory", back_populates="fund", cascade="all, delete-orphan")
+    bars_5m = relationship("FundHistory5m", cascade="all, delete-orphan")
+    daily = relationship("FundDaily", cascade="all, delete-orphan")
 
 class Stock(Base):
     """股票信息表"""
@@ -68,28 +140,123 @@ class Holding(Base):
     stock = relationship("Stock", back_populates="holdings")
 
 class FundHistory(Base):
-    """基金历史估值记录 (每5分钟一条)"""
+    """
+    基金估值分时 (只存变化)
+    主键 (fund_id, timestamp)，WITHOUT ROWID 表按主键聚簇：热点查询 某个基金 + 时间范围 是一段连续读取
+    不建时间索引：收盘汇总后的日期会归档并删除，表里只有最近几天，按时间的查询 (汇总、导出) 直接按主键顺序扫描更快
+    """
     __tablename__ = 'fund_histories'
 
-    id = Column(Integer, primary_key=True)
-    fund_id = Column(Integer, ForeignKey('funds.id'), nullable=False)
-    estimated_change = Column(Float, nullable=False)  # 预估涨跌幅 (百分比)
-    timestamp = Column(DateTime, default=datetime.now, index=True)
+    fund_id = Column(Integer, ForeignKey('funds.id'), primary_key=True)
+    timestamp = Column(EpochSeconds, primary_key=True, default=datetime.now)
+    estimated_change = Column(FixedPoint(PCT_SCALE), nullable=False)  # 预估涨跌幅 (百分比)
 
     fund = relationship("Fund", back_populates="histories")
 
+    __table_args__ = {'sqlite_with_rowid': False}
+
 class StockPrice(Base):
-    """股票价格历史 (可选，用于回溯计算)"""
+    """股票价格分时 (只存变化)，主键 (stock_id, timestamp)，WITHOUT ROWID，同样不建时间索引"""
     __tablename__ = 'stock_prices'
 
+    stock_id = Column(Integer, ForeignKey('stocks.id'), primary_key=True)
+    timestamp = Column(EpochSeconds, primary_key=True, default=datetime.now)
+    price = Column(FixedPoint(PRICE_SCALE), nullable=False)
+    prev_close = Column(FixedPoint(PRICE_SCALE), nullable=False)
+    change_percent = Column(FixedPoint(PCT_SCALE), nullable=False)
+
+    stock = relationship("Stock", back_populates="prices")
+
+    __table_args__ = {'sqlite_with_rowid': False}
+
+class TickLog(Base):
+    """估值 tick 台账：每次写库一条。估值/价格只在变化时存储，读取时按此时间轴向前填充"""
+    __tablename__ = 'tick_log'
+
     id = Column(Integer, primary_key=True)
-    stock_id = Column(Integer, ForeignKey('stocks.id'), nullable=False)
+    timestamp = Column(EpochSeconds, nullable=False, index=True)
+    funds = Column(Integer, nullable=False, default=0)       # 本次估值的基金数
+    stocks = Column(Integer, nullable=False, default=0)      # 本次获取到行情的股票数
+    fund_rows = Column(Integer, nullable=False, default=0)   # 实际写入 fund_histories 的行数
+    stock_rows = Column(Integer, nullable=False, default=0)  # 实际写入 stock_prices 的行数
+
+class FundHistory5m(Base):
+    """基金估值 5 分钟线：原始分时清理前汇总，字段名与 FundHistory 一致 (estimated_change 为该 5 分钟最后的值)"""
+    __tablename__ = 'fund_history_5m'
+
+    fund_id = Column(Integer, ForeignKey('funds.id'), primary_key=True)
+    timestamp = Column(DateTime, primary_key=True, index=True)  # 5 分钟的结束时刻 (9:35 表示 9:30~9:35；收盘后的记录归入 15:00)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    estimated_change = Column(Float, nullable=False)
+
+class StockPrice5m(Base):
+    """股票 5 分钟线，字段名与 StockPrice 一致 (price/change_percent 为该 5 分钟最后的值)"""
+    __tablename__ = 'stock_price_5m'
+
+    stock_id = Column(Integer, ForeignKey('stocks.id'), primary_key=True)
+    timestamp = Column(DateTime, primary_key=True, index=True)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
     price = Column(Float, nullable=False)
     prev_close = Column(Float, nullable=False)
     change_percent = Column(Float, nullable=False)
-    timestamp = Column(DateTime, default=datetime.now, index=True)
-    
-    stock = relationship("Stock", back_populates="prices")
+
+class FundDaily(Base):
+    """基金估值日线 (永久保留)，estimated_change 为收盘估值"""
+    __tablename__ = 'fund_daily'
+
+    fund_id = Column(Integer, ForeignKey('funds.id'), primary_key=True)
+    trade_date = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    estimated_change = Column(Float, nullable=False)
+
+class StockDaily(Base):
+    """股票日线 (永久保留)"""
+    __tablename__ = 'stock_daily'
+
+    stock_id = Column(Integer, ForeignKey('stocks.id'), primary_key=True)
+    trade_date = Column(String(10), primary_key=True)
+    open = Column(Float, nullable=False)
+    high = Column(Float, nullable=False)
+    low = Column(Float, nullable=False)
+    price = Column(Float, nullable=False)
+    prev_close = Column(Float, nullable=False)
+    change_percent = Column(Float, nullable=False)
+
+class RollupLedger(Base):
+    """汇总台账：每个已汇总的交易日一条，原始分时导出归档、清理后分别记录时间"""
+    __tablename__ = 'rollup_ledger'
+
+    trade_date = Column(String(10), primary_key=True)
+    fund_bars = Column(Integer, nullable=False, default=0)
+    stock_bars = Column(Integer, nullable=False, default=0)
+    rolled_at = Column(DateTime, default=datetime.now)
+    purged_at = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, nullable=True)
+
+class HoldingsCache(Base):
+    """基金持仓缓存 (按报告期)，持仓只在季报/半年报/年报发布后变化"""
+    __tablename__ = 'holdings_cache'
+
+    fund_code = Column(String(10), primary_key=True)
+    report_date = Column(String(10), primary_key=True)  # 报告期 YYYY-MM-DD (接口中的 aryLastDate)
+    holdings = Column(Text, nullable=False)  # JSON: [{code, name, ratio}, ...]
+    fetched_at = Column(DateTime, default=datetime.now)  # 首次抓到该报告期的时间
+    checked_at = Column(DateTime, default=datetime.now)  # 最近一次确认该报告期仍是最新的时间
+
+class CloseLedger(Base):
+    """收盘快照台账：每个交易日一条，记录该日是否已完成收盘数据"""
+    __tablename__ = 'close_ledger'
+
+    trade_date = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    status = Column(String(10), nullable=False)  # sealed: 实时收盘快照 / backfilled: 由当日最后的行情补算 / missing: 当天没有任何数据
+    funds = Column(Integer, nullable=False, default=0)  # 封账时有收盘记录的基金数
+    sealed_at = Column(DateTime, default=datetime.now)
 
 class SystemConfig(Base):
     """系统配置表"""
@@ -100,8 +267,11 @@ class SystemConfig(Base):
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 def init_db():
-    """初始化数据库表结构"""
-    Base.metadata.create_all(engine)
+    """初始化数据库表结构，已有的库按 user_version 执行未完成的迁移"""
+    from migrations import migrate
+    before, after = migrate(engine)
+    if before != after:
+        print(f"数据库结构已升级: v{before} -> v{after}")
     print(f"数据库初始化完成: {DB_PATH}")
 
 def get_session():
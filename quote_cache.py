@@ -0,0 +1,104 @@
+# quote_cache.py
+# 进程级行情缓存：短 TTL + single-flight 合并并发请求
+# 定时任务、手动触发 (/api/trigger) 同时请求相同股票时，只向上游发一次请求
+
+import os
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, List
+
+from fetcher import StockFetcher
+from quote_parser import Quote
+
+# 缓存有效期 (秒)，应明显小于最小更新间隔 (30 秒)
+DEFAULT_TTL = float(os.environ.get('ALPHA_QUOTE_TTL', '5'))
+
+class QuoteCache:
+    """
+    行情缓存
+    - 命中 (hit): 缓存中有未过期的行情
+    - 合并 (coalesced): 该股票正在被其他调用方请求，等待其结果而不再发请求
+    - 未命中 (miss): 由本次调用向上游请求
+    """
+
+    def __init__(self, fetch_fn: Callable[[List[str]], Dict[str, Quote]], ttl: float = DEFAULT_TTL):
+        self._fetch_fn = fetch_fn
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = {}       # {code: (fetched_at, Quote)}
+        self._inflight = {}   # {code: Future}
+        self._stats = {'requests': 0, 'hits': 0, 'misses': 0, 'coalesced': 0, 'upstream_calls': 0, 'upstream_errors': 0}
+
+    def get_prices(self, stock_codes: List[str], wait_timeout: float = 30) -> Dict[str, Quote]:
+        """获取行情，接口与 StockFetcher.get_batch_prices 一致"""
+        results = {}
+        to_fetch = []
+        waiting = set()
+
+        with self._lock:
+            now = time.monotonic()
+            self._stats['requests'] += 1
+            for code in set(stock_codes):
+                entry = self._data.get(code)
+                if entry and now - entry[0] < self.ttl:
+                    results[code] = entry[1]
+                    self._stats['hits'] += 1
+                elif code in self._inflight:
+                    waiting.add(self._inflight[code])
+                    self._stats['coalesced'] += 1
+                else:
+                    to_fetch.append(code)
+                    self._stats['misses'] += 1
+
+            own = None
+            if to_fetch:
+                own = Future()
+                for code in to_fetch:
+                    self._inflight[code] = own
+                self._stats['upstream_calls'] += 1
+
+        if own is not None:
+            fetched = {}
+            try:
+                fetched = self._fetch_fn(to_fetch) or {}
+            except Exception as e:
+                with self._lock:
+                    self._stats['upstream_errors'] += 1
+                print(f"  [QuoteCache] 上游请求失败: {e}")
+            finally:
+                with self._lock:
+                    now = time.monotonic()
+                    for code, quote in fetched.items():
+                        self._data[code] = (now, quote)
+                    for code in to_fetch:
+                        if self._inflight.get(code) is own:
+                            del self._inflight[code]
+                # 以结果而非异常结束，等待者拿到部分结果也能继续
+                own.set_result(fetched)
+            results.update(fetched)
+
+        if waiting:
+            wanted = set(stock_codes)
+            done, _ = wait(waiting, timeout=wait_timeout)
+            for fut in done:
+                for code, quote in fut.result().items():
+                    if code in wanted:
+                        results[code] = quote
+
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            s = dict(self._stats)
+            s['cached'] = len(self._data)
+            s['inflight'] = len(self._inflight)
+        s['ttl'] = self.ttl
+        return s
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+# 进程内共享实例
+quote_cache = QuoteCache(StockFetcher.get_batch_prices)
@@ -0,0 +1,155 @@
+# quote_parser.py
+# 行情解析：直接在原始响应字节上解析新浪行情，不整体解码、不逐行 split
+
+from typing import Dict, NamedTuple, Optional
+
+class Quote(NamedTuple):
+    """单只股票的行情快照"""
+    name: str
+    price: float
+    prev_close: float
+    pct: float           # 涨跌幅 (百分比，保留两位)
+    volume: float = 0.0  # 成交量 (股)，仅 extended 模式解析
+    time: str = ''       # 行情时间 HH:MM:SS，仅 extended 模式解析
+
+# 新浪返回格式: var hq_str_sh600519="贵州茅台,今开,昨收,现价,最高,最低,...,成交量,...,日期,时间,00";
+_VAR_PREFIX = b'hq_str_'
+_IDX_VOLUME = 8
+_IDX_TIME = 31
+
+def _scan(payload: bytes, on_record):
+    """
+    逐条定位记录并切出 名称/昨收/现价 三个字段，不做整段解码和 split
+    on_record(raw_code, start, name_end, end, prev_close, price)
+    start/end 为引号内内容在 payload 中的下标
+    """
+    find = payload.find
+    pos = find(_VAR_PREFIX)
+    while pos != -1:
+        eq = find(b'="', pos)
+        if eq == -1:
+            return
+        start = eq + 2
+        end = find(b'"', start)
+        if end == -1:
+            return
+        pos = find(_VAR_PREFIX, end)
+        c1 = find(b',', start, end)
+        if c1 == -1: continue
+        c2 = find(b',', c1 + 1, end)
+        if c2 == -1: continue
+        c3 = find(b',', c2 + 1, end)
+        if c3 == -1: continue
+        c4 = find(b',', c3 + 1, end)
+        if c4 == -1: c4 = end
+        try:
+            # float() 可直接接收 bytes
+            prev_close = float(payload[c2 + 1:c3])
+            price = float(payload[c3 + 1:c4])
+        except ValueError:
+            continue
+        if price == 0 and prev_close > 0:
+            # 停牌或集合竞价前，现价按昨收处理
+            price = prev_close
+        raw_code = payload[eq - 6:eq].decode('ascii', 'ignore')
+        on_record(raw_code, start, c1, end, prev_close, price)
+
+def parse_sina(payload: bytes, extended: bool = False) -> Dict[str, Quote]:
+    """
+    解析新浪批量行情响应
+    :param payload: 原始响应字节 (GBK)，只有名称字段会被解码
+    :param extended: 是否额外解析成交量和时间
+    :return: {raw_code: Quote}，raw_code 为不带市场前缀的 6 位代码
+    """
+    result = {}
+
+    def on_record(raw_code, start, name_end, end, prev_close, price):
+        name = payload[start:name_end].decode('gbk', 'replace')
+        pct = round((price - prev_close) / prev_close * 100, 2) if prev_close > 0 else 0.0
+        if extended:
+            fields = payload[name_end:end].split(b',', _IDX_TIME + 1)
+            try:
+                volume = float(fields[_IDX_VOLUME]) if len(fields) > _IDX_VOLUME else 0.0
+            except ValueError:
+                volume = 0.0
+            t = fields[_IDX_TIME].decode('ascii', 'ignore') if len(fields) > _IDX_TIME else ''
+            result[raw_code] = Quote(name, price, prev_close, pct, volume, t)
+        else:
+            result[raw_code] = Quote(name, price, prev_close, pct)
+
+    _scan(payload, on_record)
+    return result
+
+def parse_sina_into(payload: bytes, slot_of: Dict[str, int], prices, prev_closes, pcts,
+                    names: Optional[list] = None) -> int:
+    """
+    将行情直接写入预分配数组 (array('d') / numpy 数组 / list 均可)
+    :param slot_of: {raw_code: 数组下标}，不在映射中的股票直接跳过
+    :param names: 可选，传入时按下标写入名称 (只有这时才解码名称)
+    :return: 写入的股票数量
+    """
+    filled = 0
+
+    def on_record(raw_code, start, name_end, end, prev_close, price):
+        nonlocal filled
+        slot = slot_of.get(raw_code)
+        if slot is None:
+            return
+        prices[slot] = price
+        prev_closes[slot] = prev_close
+        pcts[slot] = round((price - prev_close) / prev_close * 100, 2) if prev_close > 0 else 0.0
+        if names is not None:
+            names[slot] = payload[start:name_end].decode('gbk', 'replace')
+        filled += 1
+
+    _scan(payload, on_record)
+    return filled
+
+# 腾讯返回格式: v_sh600519="1~贵州茅台~600519~现价~昨收~今开~成交量(手)~...~时间(yyyyMMddHHmmss)~...";
+_TX_IDX_VOLUME = 6
+_TX_IDX_TIME = 30
+
+def parse_tencent(payload: bytes, extended: bool = False) -> Dict[str, Quote]:
+    """
+    解析腾讯 qt.gtimg.cn 批量行情响应，输出与 parse_sina 相同的 Quote
+    涨跌幅按 现价/昨收 自行计算，保证两个数据源口径一致
+    """
+    result = {}
+    find = payload.find
+    eq = find(b'="')
+    while eq != -1:
+        start = eq + 2
+        end = find(b'"', start)
+        if end == -1:
+            break
+        raw_code = payload[eq - 6:eq].decode('ascii', 'ignore')
+        next_eq = find(b'="', end)
+        t1 = find(b'~', start, end)
+        t2 = find(b'~', t1 + 1, end) if t1 != -1 else -1
+        t3 = find(b'~', t2 + 1, end) if t2 != -1 else -1
+        t4 = find(b'~', t3 + 1, end) if t3 != -1 else -1
+        t5 = find(b'~', t4 + 1, end) if t4 != -1 else -1
+        if t5 != -1:
+            try:
+                price = float(payload[t3 + 1:t4])
+                prev_close = float(payload[t4 + 1:t5])
+            except ValueError:
+                eq = next_eq
+                continue
+            if price == 0 and prev_close > 0:
+                price = prev_close
+            name = payload[t1 + 1:t2].decode('gbk', 'replace')
+            pct = round((price - prev_close) / prev_close * 100, 2) if prev_close > 0 else 0.0
+            if extended:
+                fields = payload[start:end].split(b'~', _TX_IDX_TIME + 1)
+                try:
+                    volume = float(fields[_TX_IDX_VOLUME]) * 100 if len(fields) > _TX_IDX_VOLUME else 0.0
+                except ValueError:
+                    volume = 0.0
+                ts = fields[_TX_IDX_TIME] if len(fields) > _TX_IDX_TIME else b''
+                t = f"{ts[8:10].decode()}:{ts[10:12].decode()}:{ts[12:14].decode()}" if len(ts) >= 14 else ''
+                result[raw_code] = Quote(name, price, prev_close, pct, volume, t)
+            else:
+                result[raw_code] = Quote(name, price, prev_close, pct)
+        eq = next_eq
+    return result
@@ -0,0 +1,254 @@
+# quote_providers.py
+# 行情数据源：统一的 QuoteProvider 接口 + 对冲请求 (hedged request)
+# 主数据源超过其历史延迟分位数仍未返回时，向备用数据源再发一次，取先返回的结果
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import http_client
+from http_client import http_get
+from quote_parser import Quote, parse_sina, parse_tencent
+from request_control import AdaptiveController, get_controller
+
+# 启用的数据源，按默认优先级排列
+PROVIDERS = [p.strip() for p in os.environ.get('ALPHA_QUOTE_PROVIDERS', 'sina,tencent').split(',') if p.strip()]
+# 主数据源耗时超过该分位数时发出对冲请求
+HEDGE_PERCENTILE = float(os.environ.get('ALPHA_HEDGE_PERCENTILE', '90'))
+# 样本不足时使用的对冲等待时间 (秒)
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_HEDGE_DELAY = 0.05
+# 单次请求的超时上限 (秒)；实际超时不超过分片截止时间的剩余时间
+REQUEST_TIMEOUT = float(os.environ.get('ALPHA_CHUNK_TIMEOUT', '10'))
+
+class ProviderUnavailable(Exception):
+    """数据源熔断中或在截止时间前拿不到令牌"""
+
+def market_prefix(code: str) -> str:
+    if code.startswith('6'): return 'sh'
+    if code.startswith('8') or code.startswith('4'): return 'bj'
+    return 'sz'
+
+class LatencyStats:
+    """最近 N 次请求的延迟和错误率"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)   # True=成功
+        self._lock = threading.Lock()
+        self.wins = 0    # 对冲时率先返回的次数
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+            self._outcomes.append(True)
+
+    def record_error(self):
+        with self._lock:
+            self._outcomes.append(False)
+
+    def record_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < 5:
+                return None
+            data = sorted(self._samples)
+        idx = min(len(data) - 1, int(round(p / 100.0 * (len(data) - 1))))
+        return data[idx]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def score(self) -> float:
+        """越小越好：中位延迟按错误率加权，没有样本时排在最后"""
+        p50 = self.percentile(50)
+        if p50 is None:
+            return float('inf')
+        return p50 * (1 + 4 * self.error_rate())
+
+    def summary(self) -> Dict:
+        p50, p90, p99 = self.percentile(50), self.percentile(90), self.percentile(99)
+        with self._lock:
+            n = len(self._samples)
+        return {
+            'samples': n,
+            'p50': round(p50, 3) if p50 is not None else None,
+            'p90': round(p90, 3) if p90 is not None else None,
+            'p99': round(p99, 3) if p99 is not None else None,
+            'error_rate': round(self.error_rate(), 3),
+            'wins': self.wins,
+        }
+
+class QuoteProvider:
+    """行情数据源基类，子类实现 build_url 和 parse"""
+
+    name = ''
+    referer = ''
+
+    def __init__(self):
+        self.stats = LatencyStats()
+
+    def base_url(self) -> str:
+        raise NotImplementedError
+
+    def build_url(self, codes: List[str]) -> str:
+        raise NotImplementedError
+
+    def parse(self, payload: bytes) -> Dict[str, Quote]:
+        raise NotImplementedError
+
+    @property
+    def controller(self) -> AdaptiveController:
+        # 按 (数据源, host) 区分：多个数据源指向同一个 host (如本地 fake_upstream) 时各自熔断、限速
+        return get_controller(f"{self.name}@{urlsplit(self.base_url()).netloc}")
+
+    def fetch(self, codes: List[str], timeout: float = REQUEST_TIMEOUT) -> Dict[str, Quote]:
+        """请求一次；网络异常和非 200 状态直接抛出"""
+        resp = http_get(self.build_url(codes), headers={'Referer': self.referer},
+                        proxies={"http": None, "https": None}, timeout=timeout)
+        if resp.status_code != 200:
+            raise IOError(f"{self.name} HTTP {resp.status_code}")
+        data = self.parse(resp.content)
+        wanted = set(codes)
+        return {code: q for code, q in data.items() if code in wanted}
+
+class SinaProvider(QuoteProvider):
+    name = 'sina'
+    referer = 'http://finance.sina.com.cn'
+
+    def base_url(self) -> str:
+        return http_client.SINA_URL
+
+    def build_url(self, codes: List[str]) -> str:
+        return f"{self.base_url()}/list={','.join(market_prefix(c) + c for c in codes)}"
+
+    def parse(self, payload: bytes) -> Dict[str, Quote]:
+        return parse_sina(payload)
+
+class TencentProvider(QuoteProvider):
+    name = 'tencent'
+    referer = 'http://gu.qq.com'
+
+    def base_url(self) -> str:
+        return http_client.TENCENT_URL
+
+    def build_url(self, codes: List[str]) -> str:
+        return f"{self.base_url()}/q={','.join(market_prefix(c) + c for c in codes)}"
+
+    def parse(self, payload: bytes) -> Dict[str, Quote]:
+        return parse_tencent(payload)
+
+PROVIDER_CLASSES = {'sina': SinaProvider, 'tencent': TencentProvider}
+
+class QuoteRouter:
+    """按延迟统计选择主数据源，并对慢请求做对冲"""
+
+    def __init__(self, providers: List[QuoteProvider]):
+        self.providers = providers
+        self._executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='quote-hedge')
+
+    def ranked(self) -> List[QuoteProvider]:
+        """综合得分排序；得分相同 (如都没有样本) 时保持配置顺序"""
+        return sorted(self.providers, key=lambda p: p.stats.score())
+
+    @property
+    def primary(self) -> QuoteProvider:
+        return self.ranked()[0]
+
+    def _attempt(self, provider: QuoteProvider, codes: List[str], deadline: float) -> Dict[str, Quote]:
+        """经过熔断和限速后请求一次，并把结果记入该数据源的统计"""
+        ctl = provider.controller
+        if not ctl.breaker.allow():
+            ctl.on_rejected()
+            raise ProviderUnavailable(f"{provider.name} 熔断中")
+        # 放行之后每条出口都要结算：成功/失败记入熔断器，没有发出请求则归还 (half_open 时唯一的探测名额)
+        if not ctl.bucket.acquire(deadline):
+            ctl.breaker.release()
+            raise ProviderUnavailable(f"{provider.name} 限速等待超出时间预算")
+        t0 = time.monotonic()
+        # 超时不超过截止时间：调用方放弃之后，请求不会继续占用对冲线程、把结算拖到下一个 tick
+        timeout = min(REQUEST_TIMEOUT, deadline - t0)
+        if timeout <= 0:
+            ctl.breaker.release()
+            raise ProviderUnavailable(f"{provider.name} 已超出时间预算")
+        try:
+            data = provider.fetch(codes, timeout)
+        except Exception:
+            ctl.on_failure()
+            provider.stats.record_error()
+            raise
+        except BaseException:
+            ctl.breaker.release()
+            raise
+        if not data:
+            ctl.on_failure(empty=True)
+            provider.stats.record_error()
+            raise IOError(f"{provider.name} 返回空")
+        latency = time.monotonic() - t0
+        ctl.on_success(latency)
+        provider.stats.record(latency)
+        return data
+
+    def hedge_delay(self, provider: QuoteProvider) -> float:
+        d = provider.stats.percentile(HEDGE_PERCENTILE)
+        return max(MIN_HEDGE_DELAY, d if d is not None else DEFAULT_HEDGE_DELAY)
+
+    def fetch(self, codes: List[str], deadline: float) -> Dict[str, Quote]:
+        """
+        请求一个分片
+        主数据源在 hedge_delay 内未成功 (超时或失败) 时立即请求备用数据源，取最先成功的结果
+        全部失败时抛出最后一个异常
+        """
+        order = self.ranked()
+        pending = {self._executor.submit(self._attempt, order[0], codes, deadline): order[0]}
+        backups = order[1:]
+        hedge_at = time.monotonic() + self.hedge_delay(order[0])
+        hedged = False
+        last_error = None
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if backups:
+                timeout = max(0.0, min(timeout, hedge_at - now))
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                provider = pending.pop(fut)
+                try:
+                    data = fut.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if hedged:
+                    provider.stats.record_win()
+                return data
+            # 主请求失败或超过对冲阈值：追加一个备用请求
+            if backups and (not pending or time.monotonic() >= hedge_at):
+                nxt = backups.pop(0)
+                pending[self._executor.submit(self._attempt, nxt, codes, deadline)] = nxt
+                hedged = True
+                hedge_at = time.monotonic() + self.hedge_delay(nxt)
+
+        raise last_error or TimeoutError("行情请求超出时间预算")
+
+    def stats(self) -> List[Dict]:
+        result = []
+        for i, p in enumerate(self.ranked()):
+            s = p.stats.summary()
+            s.update({'name': p.name, 'primary': i == 0, 'hedge_delay': round(self.hedge_delay(p), 3)})
+            result.append(s)
+        return result
+
+quote_router = QuoteRouter([PROVIDER_CLASSES[n]() for n in PROVIDERS if n in PROVIDER_CLASSES])
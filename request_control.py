@@ -0,0 +1,182 @@
+# request_control.py
+# 上游请求自适应控制：令牌桶限速、指数退避(带抖动)、按 host 熔断、根据延迟/错误自动调整分片大小
+
+import random
+import threading
+import time
+from typing import Dict
+
+class TokenBucket:
+    """令牌桶：平均 rate 次/秒，允许 burst 次突发"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float) -> bool:
+        """阻塞直到拿到令牌；超过 deadline (monotonic) 仍拿不到则返回 False"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait_s = (1 - self._tokens) / self.rate
+            if now + wait_s > deadline:
+                return False
+            time.sleep(wait_s)
+
+class CircuitBreaker:
+    """
+    熔断器
+    closed: 正常放行；连续失败 failure_threshold 次后 open
+    open: 拒绝请求，reset_timeout 秒后进入 half_open
+    half_open: 放行一个探测请求，成功则 closed，失败则重新 open，没有发出则 release 归还
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def release(self):
+        """
+        归还 allow() 放行、但最终没有发出的探测请求 (如限速等待超时)：不算成功也不算失败，
+        下一次 allow() 可以重新探测。调用方拿到放行后必须以 record_success / record_failure / release 之一结束
+        """
+        with self._lock:
+            if self.state == 'half_open':
+                self._probing = False
+
+    def retry_after(self) -> float:
+        """距离允许下一次探测还有多少秒"""
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = 'closed'
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+def backoff_delay(attempt: int, base: float = 0.2, cap: float = 3.0) -> float:
+    """指数退避 + full jitter：在 [0, min(cap, base * 2^attempt)] 之间随机"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class AdaptiveController:
+    """
+    单个上游 host 的请求控制器 (AIMD)
+    - 分片大小跟随延迟：延迟低于目标则 +5，超过目标两倍则减半
+    - 请求速率跟随错误：成功则 +1 次/秒，出错或空响应 (限流) 则减半
+    并发请求往往同时失败，乘性下降之间至少间隔 decrease_cooldown 秒，避免一次抖动被放大多倍
+    """
+
+    def __init__(self, host: str, chunk_size: int = 50, min_chunk: int = 10, max_chunk: int = 100,
+                 rate: float = 20.0, min_rate: float = 4.0, max_rate: float = 50.0,
+                 target_latency: float = 1.0, decrease_cooldown: float = 1.0):
+        self.host = host
+        self.chunk_size = chunk_size
+        self.min_chunk = min_chunk
+        self.max_chunk = max_chunk
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.decrease_cooldown = decrease_cooldown
+        self.bucket = TokenBucket(rate, burst=8)
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._latency_ewma = None
+        self._last_rate_cut = 0.0
+        self._last_chunk_cut = 0.0
+        self._stats = {'success': 0, 'failure': 0, 'empty': 0, 'retries': 0, 'rejected': 0}
+
+    def on_success(self, latency: float):
+        self.breaker.record_success()
+        with self._lock:
+            self._stats['success'] += 1
+            self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+            self.bucket.rate = min(self.max_rate, self.bucket.rate + 1)
+            if latency > self.target_latency * 2:
+                now = time.monotonic()
+                if now - self._last_chunk_cut >= self.decrease_cooldown:
+                    self._last_chunk_cut = now
+                    self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+            elif self._latency_ewma < self.target_latency:
+                self.chunk_size = min(self.max_chunk, self.chunk_size + 5)
+
+    def on_failure(self, empty: bool = False):
+        self.breaker.record_failure()
+        with self._lock:
+            self._stats['empty' if empty else 'failure'] += 1
+            now = time.monotonic()
+            if now - self._last_rate_cut >= self.decrease_cooldown:
+                self._last_rate_cut = now
+                self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+
+    def on_retry(self):
+        with self._lock:
+            self._stats['retries'] += 1
+
+    def on_rejected(self):
+        with self._lock:
+            self._stats['rejected'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            s = dict(self._stats)
+            s.update({
+                'host': self.host,
+                'chunk_size': self.chunk_size,
+                'rate': round(self.bucket.rate, 2),
+                'latency_ewma': round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+            })
+        s['breaker'] = self.breaker.state
+        return s
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def get_controller(host: str, **kwargs) -> AdaptiveController:
+    """按 host (或调用方给出的其他键，如 数据源@host) 获取 (或创建) 控制器，同一个键进程内共享"""
+    with _controllers_lock:
+        ctl = _controllers.get(host)
+        if ctl is None:
+            ctl = AdaptiveController(host, **kwargs)
+            _controllers[host] = ctl
+        return ctl
+
+def all_stats():
+    with _controllers_lock:
+        ctls = list(_controllers.values())
+    return [c.stats() for c in ctls]
@@ -0,0 +1,64 @@
+# response_codec.py
+# 大响应 (走势图数据) 的编码与压缩
+# - json：原格式
+# - columnar：列式 JSON，持仓信息只发一次，各持仓的价格/涨跌幅按时间点排成平行数组 (当天还没有记录为 null)
+# - msgpack：与 columnar 相同的结构，MessagePack 二进制编码
+# 响应体按请求头 Accept-Encoding 协商 br 或 gzip 压缩
+# msgpack、brotli 已列入 requirements.txt；缺少时 (如自行精简的环境) 退回 JSON 格式和 gzip
+
+import gzip
+import json
+from typing import Dict, List, Optional
+import numpy as np
+from flask import Response, request
+
+try:
+    import msgpack
+except ImportError:     # 未安装时不提供 msgpack 格式
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:     # 未安装时只协商 gzip
+    brotli = None
+
+FORMATS = ('json', 'columnar', 'msgpack')
+MSGPACK_MIMETYPE = 'application/msgpack'
+# 小于这个大小的响应体不压缩
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5      # 0-11；5 左右压缩率已接近上限，耗时比 11 少一个数量级
+
+def available_formats() -> List[str]:
+    return [f for f in FORMATS if f != 'msgpack' or msgpack is not None]
+
+def available_encodings() -> List[str]:
+    """可用的压缩方式，按优先顺序"""
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+def nullable(values: np.ndarray) -> List[Optional[float]]:
+    """浮点数组 -> 列表，NaN 换成 None (JSON null / msgpack nil)"""
+    return [None if v != v else v for v in values.tolist()]
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def encoded_response(payload: Dict, fmt: str = 'json') -> Response:
+    """
+    按格式序列化，并按当前请求的 Accept-Encoding 压缩
+    :param fmt: json / columnar 用 JSON，msgpack 用 MessagePack (调用方先确认可用)
+    """
+    if fmt == 'msgpack':
+        body, mimetype = msgpack.packb(payload, use_bin_type=True), MSGPACK_MIMETYPE
+    else:
+        body, mimetype = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), 'application/json'
+    resp = Response(body, mimetype=mimetype)
+    resp.vary.add('Accept-Encoding')
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if encoding:
+            resp.set_data(_compress(body, encoding))
+            resp.headers['Content-Encoding'] = encoding
+    return resp
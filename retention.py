@@ -0,0 +1,291 @@
+# retention.py
+# 数据保留：收盘后的交易日汇总成 5 分钟线和日线，超过保留期的原始分时删除，并增量回收文件空间
+# - 汇总后的交易日原始分时导出为列式归档 (archive.py) 并从库中删除，库里只保留尚未收盘汇总的日期
+# - 归档默认保留 30 天，5 分钟线默认 365 天，日线永久保留
+# - 汇总和删除都以交易日为单位，经写库线程执行 (每天一个任务，不会长时间占住写库线程)
+# - 读取历史见 history_query.py (按 原始分时 -> 归档 -> 5 分钟线 -> 日线 取每天精度最高的来源)
+
+import math
+import threading
+import time as time_mod
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from models import (get_session, FundHistory, StockPrice, TickLog, FundHistory5m, StockPrice5m,
+                    FundDaily, StockDaily, RollupLedger, CloseLedger, SystemConfig)
+from close_service import BACKFILL_LOOKBACK_DAYS
+from trading_calendar import trading_calendar, MARKET_CLOSE
+from db_writer import db_writer
+from log_utils import log
+import archive
+
+# SystemConfig 中的保留天数 (原始分时归档 / 5 分钟线)
+RAW_RETENTION_KEY = 'retention_days'
+BARS_RETENTION_KEY = 'retention_5m_days'
+DEFAULT_RAW_RETENTION_DAYS = 30
+DEFAULT_BARS_RETENTION_DAYS = 365
+BAR_MINUTES = 5
+# 每个写库任务最多回收的页数 (4 KiB/页)
+VACUUM_STEP_PAGES = 4096
+
+def _day_range(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, time(0, 0))
+    return start, start + timedelta(days=1)
+
+def retention_settings(session: Session) -> Dict[str, int]:
+    """{'raw_days': 原始分时 (归档) 保留天数, 'bar_days': 5 分钟线保留天数}"""
+    result = {'raw_days': DEFAULT_RAW_RETENTION_DAYS, 'bar_days': DEFAULT_BARS_RETENTION_DAYS}
+    for name, key in (('raw_days', RAW_RETENTION_KEY), ('bar_days', BARS_RETENTION_KEY)):
+        config = session.get(SystemConfig, key)
+        if config:
+            try:
+                result[name] = max(1, int(config.value))
+            except ValueError:
+                pass
+    return result
+
+def set_retention(raw_days: Optional[int] = None, bar_days: Optional[int] = None):
+    """保存保留天数 (经写库线程)，下一次维护任务按新设置清理"""
+    def save(session: Session):
+        for key, value in ((RAW_RETENTION_KEY, raw_days), (BARS_RETENTION_KEY, bar_days)):
+            if value is None:
+                continue
+            config = session.get(SystemConfig, key)
+            if not config:
+                config = SystemConfig(key=key, value='')
+                session.add(config)
+            config.value = str(max(1, int(value)))
+    db_writer.run(save, name='retention')
+
+# ---------------------------------------------------------------------------
+# 汇总
+
+def bar_time(ts: datetime) -> datetime:
+    """所属 5 分钟线的结束时刻 (9:30:00 -> 9:30, 9:31 -> 9:35)，收盘后的记录归入收盘时刻"""
+    if ts.time() >= MARKET_CLOSE:
+        return datetime.combine(ts.date(), MARKET_CLOSE)
+    hour = ts.replace(minute=0, second=0, microsecond=0)
+    step = BAR_MINUTES * 60
+    return hour + timedelta(seconds=math.ceil((ts - hour).total_seconds() / step) * step)
+
+def _ohlc(bars: Dict, key, value: float) -> List[float]:
+    bar = bars.get(key)
+    if bar is None:
+        bar = bars[key] = [value, value, value, value]
+    else:
+        bar[1] = max(bar[1], value)
+        bar[2] = min(bar[2], value)
+        bar[3] = value
+    return bar
+
+def rollup_day(session: Session, day: date) -> Dict[str, List[Dict]]:
+    """
+    把一天的原始分时汇总成 5 分钟线和日线 (只读，不写库)
+    原始分时只存变化，没有记录的 5 分钟不生成 K 线，读取时同样向前填充
+    """
+    start, end = _day_range(day)
+    bar_of = {}     # 同一个 tick 的记录时间相同，缓存换算结果
+
+    fund_bars, fund_daily = {}, {}
+    for fid, ts, value in session.execute(
+            select(FundHistory.fund_id, FundHistory.timestamp, FundHistory.estimated_change)
+            .where(FundHistory.timestamp >= start, FundHistory.timestamp < end)
+            .order_by(FundHistory.fund_id, FundHistory.timestamp)):
+        bt = bar_of.get(ts) or bar_of.setdefault(ts, bar_time(ts))
+        _ohlc(fund_bars, (fid, bt), value)
+        _ohlc(fund_daily, fid, value)
+
+    stock_bars, stock_daily, stock_last = {}, {}, {}
+    for sid, ts, price, prev_close, pct in session.execute(
+            select(StockPrice.stock_id, StockPrice.timestamp, StockPrice.price, StockPrice.prev_close,
+                   StockPrice.change_percent)
+            .where(StockPrice.timestamp >= start, StockPrice.timestamp < end)
+            .order_by(StockPrice.stock_id, StockPrice.timestamp)):
+        bt = bar_of.get(ts) or bar_of.setdefault(ts, bar_time(ts))
+        _ohlc(stock_bars, (sid, bt), price)
+        _ohlc(stock_daily, sid, price)
+        # 5 分钟线/日线的 prev_close、change_percent 取区间内最后一条
+        stock_last[(sid, bt)] = stock_last[sid] = (prev_close, pct)
+
+    iso = day.isoformat()
+    return {
+        'fund_bars': [{'fund_id': fid, 'timestamp': bt, 'open': o, 'high': h, 'low': l, 'estimated_change': c}
+                      for (fid, bt), (o, h, l, c) in fund_bars.items()],
+        'fund_daily': [{'fund_id': fid, 'trade_date': iso, 'open': o, 'high': h, 'low': l, 'estimated_change': c}
+                       for fid, (o, h, l, c) in fund_daily.items()],
+        'stock_bars': [{'stock_id': sid, 'timestamp': bt, 'open': o, 'high': h, 'low': l, 'price': c,
+                        'prev_close': stock_last[(sid, bt)][0], 'change_percent': stock_last[(sid, bt)][1]}
+                       for (sid, bt), (o, h, l, c) in stock_bars.items()],
+        'stock_daily': [{'stock_id': sid, 'trade_date': iso, 'open': o, 'high': h, 'low': l, 'price': c,
+                         'prev_close': stock_last[sid][0], 'change_percent': stock_last[sid][1]}
+                        for sid, (o, h, l, c) in stock_daily.items()],
+    }
+
+def write_rollup(session: Session, day: date, rollup: Dict[str, List[Dict]]):
+    """写入汇总结果和台账 (不提交)；已有的同日汇总先删除，可重复执行"""
+    start, end = _day_range(day)
+    iso = day.isoformat()
+    session.execute(delete(FundHistory5m).where(FundHistory5m.timestamp >= start, FundHistory5m.timestamp < end))
+    session.execute(delete(StockPrice5m).where(StockPrice5m.timestamp >= start, StockPrice5m.timestamp < end))
+    session.execute(delete(FundDaily).where(FundDaily.trade_date == iso))
+    session.execute(delete(StockDaily).where(StockDaily.trade_date == iso))
+    for model, key in ((FundHistory5m, 'fund_bars'), (StockPrice5m, 'stock_bars'),
+                       (FundDaily, 'fund_daily'), (StockDaily, 'stock_daily')):
+        if rollup[key]:
+            session.execute(insert(model.__table__), rollup[key])
+    row = session.get(RollupLedger, iso)
+    if row is None:
+        row = RollupLedger(trade_date=iso)
+        session.add(row)
+    row.fund_bars = len(rollup['fund_bars'])
+    row.stock_bars = len(rollup['stock_bars'])
+    row.rolled_at = datetime.now()
+    row.purged_at = None
+
+def _has_raw(session: Session, day: date) -> bool:
+    start, end = _day_range(day)
+    return any(session.scalar(select(model.timestamp).where(model.timestamp >= start, model.timestamp < end).limit(1))
+               for model in (FundHistory, StockPrice))
+
+def days_to_roll(session: Session, today: date) -> List[date]:
+    """
+    需要汇总的日期：今天之前、有原始分时、尚未汇总，且收盘数据已定 (已在收盘台账中，
+    或早于启动补齐的检查范围，或本来就不是交易日)
+    """
+    first = min(filter(None, (session.scalar(select(func.min(model.timestamp)))
+                              for model in (FundHistory, StockPrice))), default=None)
+    if first is None:
+        return []
+    rolled = set(session.execute(select(RollupLedger.trade_date)).scalars())
+    closed = set(session.execute(select(CloseLedger.trade_date)).scalars())
+    settled_before = today - timedelta(days=BACKFILL_LOOKBACK_DAYS)
+    days = []
+    d = first.date()
+    while d < today:
+        iso = d.isoformat()
+        if iso not in rolled and (iso in closed or d < settled_before or not trading_calendar.is_trading_day(d)) \
+                and _has_raw(session, d):
+            days.append(d)
+        d += timedelta(days=1)
+    return days
+
+# ---------------------------------------------------------------------------
+# 清理
+
+def purge_day(session: Session, day: date, archived: bool = False) -> int:
+    """删除一天的原始分时 (该日必须已汇总)，返回删除的行数；archived 表示已导出归档"""
+    start, end = _day_range(day)
+    deleted = 0
+    for model in (FundHistory, StockPrice, TickLog):
+        deleted += session.execute(delete(model).where(model.timestamp >= start, model.timestamp < end)).rowcount
+    row = session.get(RollupLedger, day.isoformat())
+    row.purged_at = datetime.now()
+    if archived:
+        row.archived_at = row.purged_at
+    return deleted
+
+def purge_bars(session: Session, before: date) -> int:
+    """删除 before 之前的 5 分钟线"""
+    cutoff = datetime.combine(before, time(0, 0))
+    return sum(session.execute(delete(model).where(model.timestamp < cutoff)).rowcount
+               for model in (FundHistory5m, StockPrice5m))
+
+def vacuum_step(session: Session) -> int:
+    """
+    回收一部分空闲页，返回回收的页数 (没有空闲页时为 0)
+    旧库 (非增量 auto_vacuum) 第一次执行时整体 VACUUM 一次，之后都是增量回收
+    """
+    session.commit()    # 同一批次中之前的任务先提交，VACUUM 不能在事务中执行
+    conn = session.connection()
+    dbapi = conn.connection.driver_connection
+    free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+    if not free or dbapi.in_transaction:
+        return 0
+    if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+        log(f"启用增量回收：整理数据库文件 ({free} 个空闲页)...")
+        dbapi.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        dbapi.execute("VACUUM")
+        return free
+    # incremental_vacuum 每执行一步回收一页，execute 只执行一步；executescript 会执行到结束
+    dbapi.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});")
+    return free - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+# ---------------------------------------------------------------------------
+# 维护任务
+
+_run_lock = threading.Lock()
+last_run: Dict = {}
+
+def run_maintenance(today: Optional[date] = None) -> Optional[Dict]:
+    """汇总已收盘的交易日、清理超过保留期的数据、回收空间；已有维护任务在运行时返回 None"""
+    if not _run_lock.acquire(blocking=False):
+        return None
+    try:
+        t0 = time_mod.time()
+        today = today or date.today()
+        stats = {'rolled_days': 0, 'fund_bars': 0, 'stock_bars': 0, 'archived_days': 0, 'purged_days': 0,
+                 'purged_rows': 0, 'removed_archives': 0, 'purged_bars': 0, 'vacuumed_pages': 0}
+
+        session = get_session()
+        try:
+            settings = retention_settings(session)
+            days = days_to_roll(session, today)
+        finally:
+            session.close()
+
+        # 1. 汇总：读库和计算在当前线程，写入交给写库线程 (每天一个任务)
+        for day in days:
+            session = get_session()
+            try:
+                rollup = rollup_day(session, day)
+            finally:
+                session.close()
+            db_writer.run(lambda s, day=day, rollup=rollup: write_rollup(s, day, rollup), name='rollup')
+            stats['rolled_days'] += 1
+            stats['fund_bars'] += len(rollup['fund_bars'])
+            stats['stock_bars'] += len(rollup['stock_bars'])
+
+        # 2. 已汇总的原始分时导出归档 (超过保留期的不再导出)，然后从库里删除
+        raw_cutoff = today - timedelta(days=settings['raw_days'])
+        session = get_session()
+        try:
+            purgeable = list(session.execute(
+                select(RollupLedger.trade_date).where(RollupLedger.purged_at.is_(None))).scalars())
+        finally:
+            session.close()
+        for iso in purgeable:
+            day = date.fromisoformat(iso)
+            archived = day >= raw_cutoff
+            if archived:
+                # 已汇总的日期不会再有写入，导出在当前线程读库即可
+                session = get_session()
+                try:
+                    archive.export_day(session, day)
+                finally:
+                    session.close()
+                stats['archived_days'] += 1
+            stats['purged_rows'] += db_writer.run(lambda s, d=day, a=archived: purge_day(s, d, a), name='purge')
+            stats['purged_days'] += 1
+        stats['removed_archives'] = archive.remove_before(raw_cutoff)
+        stats['purged_bars'] = db_writer.run(
+            lambda s: purge_bars(s, today - timedelta(days=settings['bar_days'])), name='purge_bars')
+
+        # 3. 回收空间 (分多个任务，期间其他写入照常进行；也回收结构迁移重建表后留下的空闲页)
+        while True:
+            freed = db_writer.run(vacuum_step, name='vacuum')
+            if freed <= 0:
+                break
+            stats['vacuumed_pages'] += freed
+
+        last_run.clear()
+        last_run.update(stats, finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        seconds=round(time_mod.time() - t0, 1))
+        log(f"数据维护完成 ({time_mod.time() - t0:.1f}s): {stats}")
+        return stats
+    finally:
+        _run_lock.release()
+
+def is_running() -> bool:
+    return _run_lock.locked()
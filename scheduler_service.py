@@ -2,143 +2,81 @@
 # 定时任务服务
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
-import time
+from datetime import date, datetime, time, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import Session
-from models import get_session, Fund, Stock, Holding, FundHistory, StockPrice, SystemConfig, init_db
-from fetcher import StockFetcher
+from models import get_session, SystemConfig, init_db
+from db_writer import db_writer
+from update_pipeline import update_pipeline
+from close_service import ensure_close_snapshot, backfill_missed_days
+from trading_calendar import trading_calendar, TradingSessionTrigger, TradingTimeTrigger, upcoming, MARKET_OPEN
 
 from log_utils import log
 
 _scheduler_instance = None
 DEFAULT_INTERVAL = 60 # seconds
+# 收盘快照检查时刻 (15:00 的 tick 通常已经记录了收盘数据，这里负责补漏和封账)
+CLOSE_SNAPSHOT_TIMES = (time(15, 1), time(15, 10), time(15, 30))
+HOLDINGS_REFRESH_TIMES = (time(9, 15), time(15, 10))
+# 数据维护 (汇总、清理、回收空间)：收盘快照封账之后
+MAINTENANCE_TIMES = (time(15, 45),)
 
 def update_job():
-    """核数据更新任务"""
+    """数据更新 (手动触发时使用；定时任务只在交易时段内调用 tick_job)"""
     now = datetime.now()
-    current_time = now.time()
-    
-    # 定义时间范围
-    start_vm = datetime.strptime("09:30:00", "%H:%M:%S").time()
-    end_vm = datetime.strptime("11:30:00", "%H:%M:%S").time()
-    start_pm = datetime.strptime("13:00:00", "%H:%M:%S").time()
-    end_pm = datetime.strptime("15:00:00", "%H:%M:%S").time()
-    
-    is_trading = (start_vm <= current_time <= end_vm) or (start_pm <= current_time <= end_pm)
-    
-    session = get_session()
     try:
-        if is_trading:
+        if trading_calendar.in_session(now):
             log("交易时间，执行全量更新...")
-            _perform_update(session)
+            update_pipeline.submit().result()
+        elif trading_calendar.is_after_close(now):
+            # 收盘后：一条查询找出缺收盘数据的基金并补全；当天封账后直接跳过
+            ensure_close_snapshot(now.date())
         else:
-            # 非交易时间
-            if current_time > end_pm:
-                # 15:00 以后，逐个检查基金是否已有今日收盘数据
-                all_funds = session.query(Fund).all()
-                target_funds = []
-                
-                # 构造今日15:00的时间点
-                close_time = datetime.combine(now.date(), end_pm)
-                
-                for f in all_funds:
-                    # 检查该基金在收盘后是否有记录
-                    exists = session.query(FundHistory)\
-                        .filter(FundHistory.fund_id == f.id)\
-                        .filter(FundHistory.timestamp >= close_time)\
-                        .first()
-                    
-                    if not exists:
-                        target_funds.append(f)
-                
-                if target_funds:
-                    log(f"发现 {len(target_funds)} 个基金需要补全收盘数据...")
-                    _perform_update(session, target_funds)
-                else:
-                    log("所有基金已有收盘数据，跳过更新.")
-            else:
-                # 9:30 之前或 11:30-13:00，跳过
-                log("非交易时间(盘前或午休)，跳过更新.")
-                
+            log("非交易时间，跳过更新.")
     except Exception as e:
         log(f"定时任务异常: {e}")
-    finally:
-        session.close()
 
-def _perform_update(session: Session, target_funds: list = None):
+def tick_job():
     """
-    执行具体的数据更新逻辑
-    :param target_funds: 指定要更新的基金列表，如果为None则更新所有
+    交易时段内的定时估值 (由 TradingSessionTrigger 触发，时段外不会运行)
+    只做抓取，计算和写库在流水线后续阶段完成，不等待提交
     """
-    # 1. 获取目标基金
-    if target_funds is None:
-        funds = session.query(Fund).all()
-    else:
-        funds = target_funds
-        
-    if not funds:
-        return
+    try:
+        update_pipeline.submit()
+    except Exception as e:
+        log(f"定时任务异常: {e}")
 
-    # 2. 收集所有需要的股票代码
-    all_stock_codes = set()
-    fund_holdings_map = {} # {fund_id: [(stock_code, ratio), ...]}
-    
-    for fund in funds:
-        holdings = fund.holdings
-        h_list = []
-        for h in holdings:
-            # h.stock 可能未加载
-            stock = session.get(Stock, h.stock_id) # Replace query.get with session.get
-            if stock:
-                all_stock_codes.add(stock.code)
-                h_list.append((stock.code, h.ratio))
-        fund_holdings_map[fund.id] = h_list
+def close_snapshot_job():
+    """交易日收盘后检查并补全当天收盘数据，封账后再次触发也不做任何事"""
+    try:
+        ensure_close_snapshot(date.today())
+    except Exception as e:
+        log(f"收盘数据任务异常: {e}")
 
-    if not all_stock_codes:
-        return
+def holdings_refresh_job():
+    """持仓刷新任务：报告期未变化的基金跳过解析和写库"""
+    from holdings_service import refresh_all_holdings
+    try:
+        refresh_all_holdings()
+    except Exception as e:
+        log(f"持仓刷新任务异常: {e}")
 
-    # 3. 批量获取股票行情
-    price_map = StockFetcher.get_batch_prices(list(all_stock_codes))
-    if not price_map:
-        return # 网络错误或无数据
+def maintenance_job():
+    """汇总已收盘的交易日，清理超过保留期的原始分时，回收文件空间"""
+    from retention import run_maintenance
+    try:
+        run_maintenance()
+    except Exception as e:
+        log(f"数据维护任务异常: {e}")
 
-    # 4. 计算每个基金的涨跌幅并存储
-    timestamp = datetime.now()
-    
-    for fund in funds:
-        h_list = fund_holdings_map.get(fund.id, [])
-        est_change = 0.0
-        
-        for code, ratio in h_list:
-            p_data = price_map.get(code)
-            if p_data:
-                # 涨跌幅 * 占比
-                est_change += p_data['pct'] * ratio
-        
-        # 存入历史表
-        history = FundHistory(
-            fund_id = fund.id,
-            estimated_change = round(est_change, 2),
-            timestamp = timestamp
-        )
-        session.add(history)
-    
-    # 5. 更新股票价格历史 (只存本次涉及到的股票)
-    for code, data in price_map.items():
-        stock = session.query(Stock).filter_by(code=code).first()
-        if stock:
-            sp = StockPrice(
-                stock_id = stock.id,
-                price = data['price'],
-                prev_close = data['prev_close'],
-                change_percent = data['pct'],
-                timestamp = timestamp
-            )
-            session.add(sp)
-            
-    session.commit()
-    log(f"为 {len(funds)} 个基金 更新数据完成.")
+def close_backfill_job():
+    """启动时补齐停机期间漏掉的交易日收盘数据 (收盘后启动时也补全当天)"""
+    try:
+        # 历史交易日只用库里的行情补算，不访问网络，整个在写库线程内完成
+        db_writer.run(backfill_missed_days, name='close_backfill')
+        if trading_calendar.is_after_close(datetime.now()):
+            ensure_close_snapshot(date.today())
+    except Exception as e:
+        log(f"收盘数据补齐异常: {e}")
 
 def start_scheduler():
     global _scheduler_instance
@@ -168,8 +106,24 @@ def start_scheduler():
     log(f"启动定时任务，当前间隔: {interval} 秒")
 
     scheduler = BackgroundScheduler()
-    # 改为 seconds
-    scheduler.add_job(update_job, 'interval', seconds=interval, id='update_job', next_run_time=datetime.now())
+    # 估值：只在交易日的交易时段内按间隔触发，其余时间不唤醒
+    scheduler.add_job(tick_job, TradingSessionTrigger(interval), id='update_job', name='盘中估值')
+    # 收盘快照：交易日收盘后固定时刻检查，失败时后面的时刻重试 (封账后为空操作)
+    scheduler.add_job(close_snapshot_job, TradingTimeTrigger(CLOSE_SNAPSHOT_TIMES), id='close_snapshot',
+                      name='收盘快照', misfire_grace_time=300, coalesce=True)
+    # 持仓刷新：交易日 09:15 和收盘后各一次
+    scheduler.add_job(holdings_refresh_job, TradingTimeTrigger(HOLDINGS_REFRESH_TIMES), id='holdings_refresh',
+                      name='持仓刷新', misfire_grace_time=300, coalesce=True)
+    # 数据维护：交易日收盘后一次 (汇总当天之前的交易日，清理超过保留期的数据)
+    scheduler.add_job(maintenance_job, TradingTimeTrigger(MAINTENANCE_TIMES), id='maintenance',
+                      name='数据维护', misfire_grace_time=3600, coalesce=True)
+    # 启动时：补齐停机期间漏掉的收盘数据、刷新一次持仓、数据维护
+    scheduler.add_job(close_backfill_job, 'date', run_date=datetime.now() + timedelta(seconds=5),
+                      id='close_backfill_startup', name='收盘数据补齐')
+    scheduler.add_job(holdings_refresh_job, 'date', run_date=datetime.now() + timedelta(seconds=10),
+                      id='holdings_refresh_startup', name='持仓刷新 (启动)')
+    scheduler.add_job(maintenance_job, 'date', run_date=datetime.now() + timedelta(seconds=60),
+                      id='maintenance_startup', name='数据维护 (启动)')
     scheduler.start()
     
     _scheduler_instance = scheduler
@@ -185,21 +139,59 @@ def change_interval(seconds: int):
         seconds = 30
         
     try:
-        _scheduler_instance.reschedule_job('update_job', trigger='interval', seconds=seconds)
+        _scheduler_instance.reschedule_job('update_job', trigger=TradingSessionTrigger(seconds))
         
-        # 持久化
-        session = get_session()
-        try:
+        # 持久化 (经写库线程)
+        def save(session: Session):
             config = session.query(SystemConfig).filter_by(key='update_interval').first()
             if not config:
                 config = SystemConfig(key='update_interval', value=str(seconds))
                 session.add(config)
             else:
                 config.value = str(seconds)
-            session.commit()
-        finally:
-            session.close()
+        db_writer.run(save, name='update_interval')
             
         return True, f"已调整更新频率为 {seconds} 秒/次"
     except Exception as e:
         return False, str(e)
+
+def update_holidays(year: int, days: list):
+    """更新某年的休市日期，并按新日历重新计算各定时任务的下次运行时间"""
+    trading_calendar.update(year, days)
+    if _scheduler_instance:
+        for job in _scheduler_instance.get_jobs():
+            if isinstance(job.trigger, (TradingSessionTrigger, TradingTimeTrigger)):
+                job.reschedule(job.trigger)
+
+def schedule_info(count: int = 5) -> dict:
+    """各定时任务接下来的运行时间，以及当前的交易状态"""
+    now = datetime.now().astimezone()
+    naive = now.replace(tzinfo=None)
+    if trading_calendar.in_session(naive):
+        state = 'trading'
+    elif not trading_calendar.is_trading_day(naive.date()):
+        state = 'holiday' if naive.weekday() < 5 else 'weekend'
+    elif naive.time() < MARKET_OPEN:
+        state = 'pre_open'
+    elif trading_calendar.is_after_close(naive):
+        state = 'closed'
+    else:
+        state = 'break'
+
+    jobs = []
+    if _scheduler_instance:
+        for job in _scheduler_instance.get_jobs():
+            runs = upcoming(job.trigger, now, count) if job.next_run_time else []
+            jobs.append({
+                'id': job.id,
+                'name': job.name,
+                'trigger': str(job.trigger),
+                'next_runs': [t.strftime("%Y-%m-%d %H:%M:%S") for t in runs],
+            })
+    return {
+        'now': now.strftime("%Y-%m-%d %H:%M:%S"),
+        'state': state,
+        'next_trading_day': trading_calendar.next_trading_day(naive.date(), include=False).isoformat(),
+        'holiday_years': trading_calendar.years,
+        'jobs': jobs,
+    }
@@ -0,0 +1,210 @@
+# trading_calendar.py
+# 沪深交易日历：周末 + 法定节假日休市，内置近几年的休市日期，可用 data/holidays.json 更新
+# 并提供两个 APScheduler 触发器：交易时段内按间隔触发、交易日的固定时刻触发
+
+import json
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.util import localize
+
+from models import DB_DIR
+from log_utils import log
+
+# 交易时段 (上午、下午)
+SESSIONS: Tuple[Tuple[time, time], ...] = ((time(9, 30), time(11, 30)), (time(13, 0), time(15, 0)))
+MARKET_OPEN = SESSIONS[0][0]
+MARKET_CLOSE = SESSIONS[-1][1]
+
+# 交易所公布的工作日休市日期 (周末本来就休市，调休上班的周六日也不开市，均不必列出)
+BUNDLED_HOLIDAYS: Dict[str, List[str]] = {
+    '2024': ['2024-01-01',
+             '2024-02-09', '2024-02-12', '2024-02-13', '2024-02-14', '2024-02-15', '2024-02-16',
+             '2024-04-04', '2024-04-05',
+             '2024-05-01', '2024-05-02', '2024-05-03',
+             '2024-06-10',
+             '2024-09-16', '2024-09-17',
+             '2024-10-01', '2024-10-02', '2024-10-03', '2024-10-04', '2024-10-07'],
+    '2025': ['2025-01-01',
+             '2025-01-28', '2025-01-29', '2025-01-30', '2025-01-31', '2025-02-03', '2025-02-04',
+             '2025-04-04',
+             '2025-05-01', '2025-05-02', '2025-05-05',
+             '2025-06-02',
+             '2025-10-01', '2025-10-02', '2025-10-03', '2025-10-06', '2025-10-07', '2025-10-08'],
+    '2026': ['2026-01-01', '2026-01-02',
+             '2026-02-16', '2026-02-17', '2026-02-18', '2026-02-19', '2026-02-20', '2026-02-23',
+             '2026-04-06',
+             '2026-05-01', '2026-05-04', '2026-05-05',
+             '2026-06-19',
+             '2026-09-25',
+             '2026-10-01', '2026-10-02', '2026-10-05', '2026-10-06', '2026-10-07'],
+}
+
+# 覆盖/补充文件，格式同 BUNDLED_HOLIDAYS；文件中出现的年份整体替换内置数据
+HOLIDAYS_FILE = os.path.join(DB_DIR, 'holidays.json')
+
+class TradingCalendar:
+    """交易日历，holidays.json 修改后自动重新加载"""
+
+    def __init__(self, path: str = HOLIDAYS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._holidays: Set[date] = set()
+        self._years: Set[int] = set()
+        self._load(BUNDLED_HOLIDAYS)
+
+    def _load(self, table: Dict[str, List[str]]):
+        self._holidays = {date.fromisoformat(d) for days in table.values() for d in days}
+        self._years = {int(y) for y in table}
+
+    def _refresh(self):
+        """文件有变化时重新合并 (内置 + 文件)"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        table = dict(BUNDLED_HOLIDAYS)
+        if mtime is not None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    table.update({str(y): list(days) for y, days in json.load(f).items()})
+                log(f"已加载节假日文件: {self.path}")
+            except (OSError, ValueError) as e:
+                log(f"节假日文件读取失败，使用内置数据: {e}")
+        self._load(table)
+        self._mtime = mtime
+
+    def update(self, year: int, days: Iterable[str]):
+        """写入 (替换) 某一年的休市日期到 holidays.json"""
+        with self._lock:
+            data = {}
+            if os.path.exists(self.path):
+                with open(self.path, encoding='utf-8') as f:
+                    data = json.load(f)
+            data[str(year)] = sorted({date.fromisoformat(d).isoformat() for d in days})
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            self._mtime = None
+
+    @property
+    def years(self) -> List[int]:
+        """有节假日数据的年份"""
+        with self._lock:
+            self._refresh()
+            return sorted(self._years)
+
+    def is_trading_day(self, d: date) -> bool:
+        if d.weekday() >= 5:
+            return False
+        with self._lock:
+            self._refresh()
+            if d.year not in self._years:
+                # 没有该年份的数据时只按周末判断
+                return True
+            return d not in self._holidays
+
+    def next_trading_day(self, d: date, include: bool = True) -> date:
+        """d 当天 (include=True) 或之后的第一个交易日"""
+        if not include:
+            d += timedelta(days=1)
+        while not self.is_trading_day(d):
+            d += timedelta(days=1)
+        return d
+
+    def in_session(self, dt: datetime) -> bool:
+        """dt 是否在交易时段内 (含首尾)"""
+        if not self.is_trading_day(dt.date()):
+            return False
+        t = dt.time()
+        return any(start <= t <= end for start, end in SESSIONS)
+
+    def is_after_close(self, dt: datetime) -> bool:
+        """交易日收盘之后"""
+        return self.is_trading_day(dt.date()) and dt.time() > MARKET_CLOSE
+
+    def trading_days(self, start: date, end: date) -> List[date]:
+        """[start, end) 内的交易日"""
+        days = []
+        d = start
+        while d < end:
+            if self.is_trading_day(d):
+                days.append(d)
+            d += timedelta(days=1)
+        return days
+
+trading_calendar = TradingCalendar()
+
+class TradingSessionTrigger(BaseTrigger):
+    """
+    交易时段内每 interval 秒触发一次，时段外不触发 (午休、收盘后、周末、节假日)
+    每个时段从开盘时刻起对齐，时段结束时刻 (11:30/15:00) 也会触发一次，保证收盘数据
+    """
+
+    def __init__(self, seconds: int, calendar: TradingCalendar = trading_calendar):
+        self.interval = timedelta(seconds=seconds)
+        self.calendar = calendar
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        tz = now.tzinfo
+        t = now.replace(tzinfo=None)
+        if previous_fire_time is not None:
+            # 下一次不早于 now (错过的不补)
+            t = max(t, previous_fire_time.replace(tzinfo=None) + timedelta(microseconds=1))
+        d = t.date()
+        while True:
+            if self.calendar.is_trading_day(d):
+                for start, end in SESSIONS:
+                    s = datetime.combine(d, start)
+                    e = datetime.combine(d, end)
+                    if t > e:
+                        continue
+                    if t <= s:
+                        return localize(s, tz)
+                    # 时段内：向上对齐到 开盘 + k * interval，超过收盘时刻则取收盘时刻
+                    k = -((s - t) // self.interval)
+                    return localize(min(s + k * self.interval, e), tz)
+            d = self.calendar.next_trading_day(d, include=False)
+            t = datetime.combine(d, time(0, 0))
+
+    def __str__(self):
+        return f"trading_session[interval={int(self.interval.total_seconds())}s]"
+
+class TradingTimeTrigger(BaseTrigger):
+    """交易日的固定时刻触发 (可多个时刻)，非交易日不触发"""
+
+    def __init__(self, times: Iterable[time], calendar: TradingCalendar = trading_calendar):
+        self.times = sorted(times)
+        self.calendar = calendar
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        tz = now.tzinfo
+        t = now.replace(tzinfo=None)
+        if previous_fire_time is not None:
+            t = max(t, previous_fire_time.replace(tzinfo=None) + timedelta(microseconds=1))
+        d = self.calendar.next_trading_day(t.date())
+        while True:
+            for at in self.times:
+                candidate = datetime.combine(d, at)
+                if candidate >= t:
+                    return localize(candidate, tz)
+            d = self.calendar.next_trading_day(d, include=False)
+
+    def __str__(self):
+        return f"trading_time[{','.join(at.strftime('%H:%M') for at in self.times)}]"
+
+def upcoming(trigger: BaseTrigger, now: datetime, count: int = 5) -> List[datetime]:
+    """触发器接下来的 count 次触发时间"""
+    result = []
+    prev = None
+    for _ in range(count):
+        nxt = trigger.get_next_fire_time(prev, now)
+        if nxt is None:
+            break
+        result.append(nxt)
+        prev = nxt
+    return result
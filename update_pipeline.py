@@ -0,0 +1,159 @@
+# update_pipeline.py
+# 盘中估值流水线：抓取 -> 计算 -> 写库，各阶段之间用有界队列连接
+# 抓取在调度线程中执行，计算由单独的线程完成，写库交给 db_writer；
+# 上一个 tick 还在提交时下一次抓取已经可以开始，写库阶段积压时队列满了直接丢弃新 tick (只记录日志)
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import get_session
+from quote_cache import quote_cache
+from quote_parser import Quote
+from estimation_engine import estimation_engine, WeightMatrix
+from history_store import save_tick
+from db_writer import db_writer, DbWriter
+from log_utils import log
+
+# 抓取 -> 计算 之间最多积压的 tick 数
+COMPUTE_QUEUE_SIZE = 2
+# 队列满时抓取阶段最多等待的秒数，超时丢弃这个 tick
+PUT_TIMEOUT = 5
+
+@dataclass
+class FetchedTick:
+    """抓取阶段的产出"""
+    timestamp: datetime
+    matrix: WeightMatrix
+    rows: np.ndarray
+    price_map: Dict[str, Quote]
+    full: bool = False  # 是否为全部基金估值
+
+def fetch(session: Session, target_fund_ids: Optional[Iterable[int]] = None) -> Optional[FetchedTick]:
+    """
+    抓取阶段：权重矩阵 (持仓未变化时直接复用) + 批量行情
+    :param target_fund_ids: 只更新这些基金，None 表示全部
+    :return: 没有需要更新的基金或没有行情时返回 None
+    """
+    matrix = estimation_engine.matrix(session)
+    if target_fund_ids is None:
+        rows = np.arange(len(matrix.fund_ids))
+        codes = matrix.stock_codes
+    else:
+        rows = np.array([matrix.fund_index[fid] for fid in target_fund_ids if fid in matrix.fund_index], dtype=np.int64)
+        # 只抓取这些基金持有的股票
+        codes = matrix.stock_codes_of(rows)
+    if not len(rows) or not codes:
+        return None
+
+    # 经过共享缓存，与并发的手动触发合并请求
+    price_map = quote_cache.get_prices(codes)
+    if not price_map:
+        return None # 网络错误或无数据
+    # 分时表的时间精确到秒
+    return FetchedTick(datetime.now().replace(microsecond=0), matrix, rows, price_map, target_fund_ids is None)
+
+def compute(tick: FetchedTick) -> Tuple[List[Tuple[int, float]], Dict[int, Quote]]:
+    """计算阶段：一次向量运算得到所有基金的涨跌幅，返回 save_tick 需要的 (估值列表, {stock_id: Quote})"""
+    estimates = estimation_engine.estimate(tick.matrix, tick.price_map)
+    changes = np.round(estimates[tick.rows], 2)
+    return (list(zip(tick.matrix.fund_ids[tick.rows].tolist(), changes.tolist())),
+            tick.matrix.quotes_by_stock_id(tick.price_map))
+
+class UpdatePipeline:
+    """
+    submit() 在调用线程中完成抓取，把结果放入计算队列后立即返回 Future，
+    Future 在写库提交后得到 (写入的基金历史条数, 写入的股票价格条数)，没有数据时为 None
+    """
+
+    def __init__(self, writer: DbWriter = db_writer, queue_size: int = COMPUTE_QUEUE_SIZE):
+        self.writer = writer
+        self._queue: "queue.Queue[Tuple[FetchedTick, Future]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'empty': 0, 'dropped': 0, 'written': 0, 'failed': 0,
+                       'fetch_ms': 0.0, 'compute_ms': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _ensure_started(self):
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if not (self._thread and self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._compute_loop, name='update-compute', daemon=True)
+                self._thread.start()
+
+    def submit(self, target_fund_ids: Optional[Iterable[int]] = None) -> Future:
+        fut = Future()
+        self._count('submitted')
+        t0 = time.perf_counter()
+        session = get_session()
+        try:
+            tick = fetch(session, target_fund_ids)
+        except Exception as e:
+            self._count('failed')
+            fut.set_exception(e)
+            return fut
+        finally:
+            session.close()
+        self._count('fetch_ms', (time.perf_counter() - t0) * 1000)
+        if tick is None:
+            self._count('empty')
+            fut.set_result(None)
+            return fut
+
+        self._ensure_started()
+        try:
+            self._queue.put((tick, fut), timeout=PUT_TIMEOUT)
+        except queue.Full:
+            self._count('dropped')
+            log(f"估值流水线积压，丢弃 {tick.timestamp:%H:%M:%S} 的数据")
+            fut.set_result(None)
+        return fut
+
+    def _compute_loop(self):
+        while True:
+            tick, fut = self._queue.get()
+            try:
+                t0 = time.perf_counter()
+                changes, quotes = compute(tick)
+                self._count('compute_ms', (time.perf_counter() - t0) * 1000)
+                # 写库队列满时这里阻塞，计算队列随之积压，最终由 submit 丢弃新 tick
+                written = self.writer.submit(
+                    lambda s, ts=tick.timestamp, c=changes, q=quotes, f=tick.full: save_tick(s, ts, c, q, full=f),
+                    name='tick')
+                written.add_done_callback(lambda w, fut=fut, n=len(changes): self._on_written(w, fut, n))
+            except Exception as e:
+                self._count('failed')
+                log(f"估值计算失败: {e}")
+                fut.set_exception(e)
+
+    def _on_written(self, written: Future, fut: Future, funds: int):
+        e = written.exception()
+        if e is not None:
+            self._count('failed')
+            fut.set_exception(e)
+            return
+        self._count('written')
+        log(f"为 {funds} 个基金 更新数据完成.")
+        fut.set_result(written.result())
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            s = dict(self._stats)
+        s['avg_fetch_ms'] = round(s.pop('fetch_ms') / max(s['submitted'], 1), 2)
+        s['avg_compute_ms'] = round(s.pop('compute_ms') / max(s['written'], 1), 2)
+        s['queued'] = self._queue.qsize()
+        return s
+
+update_pipeline = UpdatePipeline()